@@ -1,3 +1,21 @@
+import json
 from django.contrib import admin
+from django.utils.html import format_html
+from .models import FlightData, FlightRawData
 
-# Register your models here.
+
+@admin.register(FlightData)
+class FlightDataAdmin(admin.ModelAdmin):
+    # El listado sólo lee columnas tipadas; raw_data se carga en el detalle
+    list_display = ('flight_id', 'latitude', 'longitude', 'altitude', 'speed', 'heading', 'timestamp', 'expired_at')
+    list_filter = ('expired_at',)
+    search_fields = ('flight_id',)
+    readonly_fields = ('raw_data',)
+    show_full_result_count = False
+
+    @admin.display(description='Raw data')
+    def raw_data(self, obj):
+        raw = FlightRawData.objects.filter(flight_id=obj.flight_id).first()
+        if raw is None:
+            return '-'
+        return format_html('<pre>{}</pre>', json.dumps(raw.raw_data, indent=2, ensure_ascii=False))
@@ -0,0 +1,213 @@
+# flights/aggregates.py
+# Estadísticas de la flota activa (por país, en vuelo/en tierra, bandas de
+# altitud e histograma de velocidades) calculadas durante la normalización de
+# cada ciclo de ingesta y guardadas como un documento pequeño en FleetAggregate.
+# El documento tiene los totales y un vector de contadores por celda de una
+# rejilla de AGGREGATE_CELL_DEGREES grados, así que leerlo, o sumar las celdas
+# de un bbox, no depende del tamaño de la flota.
+
+import math
+from bisect import bisect_right
+
+DOCUMENT_SCHEMA = 1
+# Rejilla de los agregados: más gruesa que la de spatial.py para acotar el documento (36 x 72 celdas)
+AGGREGATE_CELL_DEGREES = 5.0
+AGGREGATE_ROWS = int(180 / AGGREGATE_CELL_DEGREES)
+AGGREGATE_COLUMNS = int(360 / AGGREGATE_CELL_DEGREES)
+
+# Límite inferior (metros) de cada banda de altitud; sólo cuentan las aeronaves en vuelo
+ALTITUDE_BANDS = (0, 1000, 3000, 6000, 9000, 12000)
+SPEED_BIN_MS = 25
+SPEED_BINS = 14 # el último cubre 325 m/s o más
+UNKNOWN_COUNTRY = 'unknown'
+
+# Posiciones en un vector de contadores
+TOTAL, ON_GROUND = 0, 1
+ALTITUDE_OFFSET = 2
+SPEED_OFFSET = ALTITUDE_OFFSET + len(ALTITUDE_BANDS)
+VECTOR_LENGTH = SPEED_OFFSET + SPEED_BINS
+
+
+def _row_for(latitude):
+    return min(int((latitude + 90.0) // AGGREGATE_CELL_DEGREES), AGGREGATE_ROWS - 1)
+
+
+def _column_for(longitude):
+    return min(int((longitude + 180.0) // AGGREGATE_CELL_DEGREES), AGGREGATE_COLUMNS - 1)
+
+
+def _last_index(value, origin, count):
+    # Última fila/columna que toca un borde máximo: un borde justo en el límite de celda no incluye la siguiente
+    return min(max(math.ceil((value + origin) / AGGREGATE_CELL_DEGREES) - 1, 0), count - 1)
+
+
+def _cell_bounds(cell):
+    # [min_lon, min_lat, max_lon, max_lat], como ?bbox=
+    row, column = divmod(cell, AGGREGATE_COLUMNS)
+    south = -90.0 + row * AGGREGATE_CELL_DEGREES
+    west = -180.0 + column * AGGREGATE_CELL_DEGREES
+    return [west, south, west + AGGREGATE_CELL_DEGREES, south + AGGREGATE_CELL_DEGREES]
+
+
+def cells_in_bbox(bbox):
+    """Celdas de la rejilla de agregados que tocan el bbox (min_lon, min_lat, max_lon, max_lat)."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    first_column, last_column = _column_for(min_lon), _last_index(max_lon, 180.0, AGGREGATE_COLUMNS)
+    if min_lon <= max_lon:
+        columns = range(first_column, max(first_column, last_column) + 1)
+    else:
+        # Cruza el antimeridiano
+        columns = [*range(first_column, AGGREGATE_COLUMNS), *range(0, last_column + 1)]
+    return [
+        row * AGGREGATE_COLUMNS + column
+        for row in range(_row_for(min_lat), max(_row_for(min_lat), _last_index(max_lat, 90.0, AGGREGATE_ROWS)) + 1)
+        for column in columns
+    ]
+
+
+class FleetAggregator:
+    """
+    Acumula, lote a lote, los contadores de las filas normalizadas de un ciclo.
+    Un flight_id que aparece en dos lotes cuenta una vez. ``complete`` es False
+    si quedan vuelos activos que el ciclo no leyó (teselas o fuentes caídas).
+    """
+
+    def __init__(self):
+        self.totals = [0] * VECTOR_LENGTH
+        self.countries = {}
+        self.cells = {}
+        self.cell_countries = {}
+        self.complete = True
+        self._seen = set()
+
+    def __len__(self):
+        return self.totals[TOTAL]
+
+    def add_rows(self, rows):
+        # Bucle caliente de la ingesta: todo en variables locales y la celda calculada en línea
+        seen, totals, countries = self._seen, self.totals, self.countries
+        cells, cell_countries = self.cells, self.cell_countries
+        seen_add = seen.add
+        bands = ALTITUDE_BANDS
+        degrees, rows_count, columns_count = AGGREGATE_CELL_DEGREES, AGGREGATE_ROWS, AGGREGATE_COLUMNS
+        last_speed_bin = SPEED_BINS - 1
+        for row in rows:
+            flight_id = row['flight_id']
+            if flight_id in seen:
+                continue
+            seen_add(flight_id)
+            raw = row['raw_data']
+            country = raw.get('origin_country') or UNKNOWN_COUNTRY
+            if raw.get('on_ground'):
+                bucket = ON_GROUND
+            else:
+                band = bisect_right(bands, row['altitude']) - 1
+                bucket = ALTITUDE_OFFSET + (band if band > 0 else 0)
+            speed = row['speed']
+            if speed is None:
+                speed_bucket = None
+            else:
+                speed_bin = int(speed // SPEED_BIN_MS)
+                speed_bucket = SPEED_OFFSET + (0 if speed_bin < 0 else last_speed_bin if speed_bin > last_speed_bin else speed_bin)
+
+            totals[TOTAL] += 1
+            totals[bucket] += 1
+            if speed_bucket is not None:
+                totals[speed_bucket] += 1
+            countries[country] = countries.get(country, 0) + 1
+
+            latitude, longitude = row['latitude'], row['longitude']
+            if latitude is None or longitude is None or not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+                continue
+            grid_row = int((latitude + 90.0) // degrees)
+            grid_column = int((longitude + 180.0) // degrees)
+            cell = (grid_row if grid_row < rows_count else rows_count - 1) * columns_count + (
+                grid_column if grid_column < columns_count else columns_count - 1
+            )
+            vector = cells.get(cell)
+            if vector is None:
+                vector = cells[cell] = [0] * VECTOR_LENGTH
+                cell_countries[cell] = {}
+            vector[TOTAL] += 1
+            vector[bucket] += 1
+            if speed_bucket is not None:
+                vector[speed_bucket] += 1
+            by_country = cell_countries[cell]
+            by_country[country] = by_country.get(country, 0) + 1
+
+    def document(self):
+        # Claves JSON: las celdas van como texto
+        return {
+            'schema': DOCUMENT_SCHEMA,
+            'complete': self.complete,
+            'totals': self.totals,
+            'countries': self.countries,
+            'cells': {str(cell): vector for cell, vector in self.cells.items()},
+            'cell_countries': {str(cell): countries for cell, countries in self.cell_countries.items()},
+        }
+
+
+def _summary(vector, countries):
+    on_ground = vector[ON_GROUND]
+    altitude_bands = []
+    for index, low in enumerate(ALTITUDE_BANDS):
+        high = ALTITUDE_BANDS[index + 1] if index + 1 < len(ALTITUDE_BANDS) else None
+        altitude_bands.append({'min_m': low, 'max_m': high, 'flights': vector[ALTITUDE_OFFSET + index]})
+    speed_histogram = [
+        {
+            'min_ms': index * SPEED_BIN_MS,
+            'max_ms': (index + 1) * SPEED_BIN_MS if index + 1 < SPEED_BINS else None,
+            'flights': vector[SPEED_OFFSET + index],
+        }
+        for index in range(SPEED_BINS)
+    ]
+    return {
+        'flights': vector[TOTAL],
+        'airborne': vector[TOTAL] - on_ground,
+        'on_ground': on_ground,
+        'by_country': [
+            {'country': country, 'flights': count}
+            for country, count in sorted(countries.items(), key=lambda item: (-item[1], item[0]))
+        ],
+        'altitude_bands': altitude_bands,
+        'speed_histogram': speed_histogram,
+    }
+
+
+def summarize(document, bbox=None, by_cell=False):
+    """
+    Respuesta del endpoint de estadísticas a partir del documento guardado. Con
+    ``bbox`` se suman las celdas que lo tocan (resolución de
+    AGGREGATE_CELL_DEGREES, no posiciones exactas); ``by_cell`` añade el
+    desglose por celda. El coste depende del número de celdas, no de vuelos.
+    """
+    cells, cell_countries = document.get('cells', {}), document.get('cell_countries', {})
+    if bbox is None:
+        vector, countries = document.get('totals') or [0] * VECTOR_LENGTH, document.get('countries', {})
+        selected = sorted(cells, key=int) if by_cell else ()
+    else:
+        selected = [key for key in map(str, cells_in_bbox(bbox)) if key in cells]
+        vector, countries = [0] * VECTOR_LENGTH, {}
+        for key in selected:
+            for index, count in enumerate(cells[key]):
+                vector[index] += count
+            for country, count in cell_countries[key].items():
+                countries[country] = countries.get(country, 0) + count
+
+    result = {'complete': document.get('complete', True), **_summary(vector, countries)}
+    if bbox is not None:
+        result['bbox'] = list(bbox)
+        result['cell_degrees'] = AGGREGATE_CELL_DEGREES
+    if by_cell:
+        result['cell_degrees'] = AGGREGATE_CELL_DEGREES
+        result['cells'] = [
+            {
+                'cell': int(key),
+                'bounds': _cell_bounds(int(key)),
+                'flights': cells[key][TOTAL],
+                'airborne': cells[key][TOTAL] - cells[key][ON_GROUND],
+                'on_ground': cells[key][ON_GROUND],
+            }
+            for key in selected
+        ]
+    return result
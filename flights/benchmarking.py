@@ -0,0 +1,167 @@
+# flights/benchmarking.py
+# Utilidades compartidas por los comandos benchmark_*.
+
+import platform
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import django
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from .models import FlightData, FlightRawData, IngestState
+from .normalizer import normalize_states
+from .pagination import timestamp_key
+from .serializers import FlightDataSerializer
+from .snapshot import FlightSnapshot
+from .synthetic import generate_states
+
+
+@contextmanager
+def temporary_database(verbosity=0):
+    """
+    Crea las bases de datos de prueba (test_<NAME>) y las destruye al salir, para
+    que los benchmarks nunca escriban en la base de datos configurada.
+    """
+    old_config = setup_databases(verbosity=verbosity, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=verbosity)
+
+
+def best_of(repeat, func):
+    """Ejecuta ``func`` ``repeat`` veces; devuelve (mejor tiempo en segundos, último resultado)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def latency_summary(times):
+    """Media, p50, p95 y máximo en milisegundos y peticiones por segundo (en serie) de una lista de tiempos."""
+    times = sorted(times)
+
+    def percentile(q):
+        return times[min(len(times) - 1, int(q * len(times)))] * 1000
+
+    total = sum(times)
+    return {
+        'requests': len(times),
+        'mean_ms': total / len(times) * 1000,
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'max_ms': times[-1] * 1000,
+        'rps': len(times) / total if total else None,
+    }
+
+
+def environment_info():
+    """Datos para comparar resultados entre commits y máquinas."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+        'platform': platform.platform(terse=True),
+    }
+
+
+class StubOpenSkyServer:
+    """
+    Servidor HTTP local (keep-alive) que responde cualquier GET con ``payload``
+    (bytes JSON). El payload se puede cambiar entre ciclos. Uso::
+
+        with StubOpenSkyServer(payload) as server:
+            service.api_url = server.url
+    """
+
+    def __init__(self, payload=b''):
+        self.payload = payload
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                body = stub.payload
+                stub.requests += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}/'
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def table_bytes(table):
+    """Bytes que ocupa ``table`` con sus índices (SQLite con dbstat o Postgres); None en otros motores."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                'SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s)',
+                [table],
+            )
+        else:
+            return None
+        return cursor.fetchone()[0] or 0
+
+
+def load_synthetic_flights(service, size, seed=0):
+    """Reemplaza FlightData (y su raw_data) por ``size`` vuelos sintéticos válidos (sólo en la base temporal)."""
+    FlightData.objects.all().delete()
+    FlightRawData.objects.all().delete()
+    rows = normalize_states(generate_states(size, seed=seed, malformed_ratio=0)).rows
+    FlightData.objects.bulk_create([service._build_flight(row) for row in rows], batch_size=5000)
+    for start in range(0, len(rows), 5000):
+        service._write_raw_data(rows[start:start + 5000], IngestState.current_version())
+    return len(rows)
+
+
+def synthetic_snapshot_rows(service, size, seed=0):
+    """
+    ``size`` filas serializadas (como las de FlightSnapshot) y sus claves
+    (timestamp_us, id), sin tocar la base de datos.
+    """
+    normalized = normalize_states(generate_states(size, seed=seed, malformed_ratio=0))
+    flights = [service._build_flight(row) for row in normalized.rows]
+    for pk, flight in enumerate(flights, start=1):
+        flight.pk = pk
+    rows = [dict(row) for row in FlightDataSerializer(flights, many=True).data]
+    keys = [(timestamp_key(flight.timestamp), flight.pk) for flight in flights]
+    return rows, keys
+
+
+def synthetic_snapshot(service, size, seed=0, version=1):
+    rows, keys = synthetic_snapshot_rows(service, size, seed)
+    return FlightSnapshot(version, rows, keys)
@@ -0,0 +1,230 @@
+# flights/binary.py
+# Formato binario compacto del snapshot de vuelos y de los deltas entre dos
+# versiones de ingesta. Todo es little-endian y de ancho fijo:
+#
+#   cabecera  HEADER (40 bytes)
+#   registros RECORD (22 bytes) x records   -> snapshot completo o altas/cambios del delta
+#   bajas     REMOVED (4 bytes) x removed   -> sólo en deltas
+#   tabla     u32 n + n x (u16 longitud + utf-8) con los flight_id que no son icao24
+#
+# Las coordenadas van en 1e-5 grados, la velocidad en décimas de m/s y el rumbo
+# en décimas de grado (las mismas escalas que FlightPosition); la altitud en
+# metros (int16, saturada) y el timestamp en segundos desde ``base_timestamp``.
+# raw_data no se incluye.
+
+import re
+import struct
+from .models import COORDINATE_SCALE, HEADING_SCALE, SPEED_SCALE
+from .snapshot import build_snapshot, diff_snapshots, snapshot_cache
+from .spatial import bbox_contains
+
+MEDIA_TYPE = 'application/x-flight-snapshot'
+MAGIC = b'FLTS'
+FORMAT_VERSION = 1
+
+KIND_SNAPSHOT = 1
+KIND_DELTA = 2
+
+# magic, formato, tipo, reservado, nº registros, nº bajas, versión, versión anterior, base_timestamp
+HEADER = struct.Struct('<4sBBHIIQQq')
+# icao24, flags, lat_e5, lon_e5, altitud_m, velocidad_dms, rumbo_dd, segundos desde base_timestamp
+RECORD = struct.Struct('<3sBiihHHI')
+# icao24, flags (sólo FLAG_ID_IN_TABLE)
+REMOVED = struct.Struct('<3sB')
+TABLE_COUNT = struct.Struct('<I')
+TABLE_LENGTH = struct.Struct('<H')
+
+FLAG_NO_POSITION = 0x01
+FLAG_NO_SPEED = 0x02
+FLAG_NO_HEADING = 0x04
+FLAG_ID_IN_TABLE = 0x08 # los 3 bytes del id son el índice en la tabla de cadenas
+
+_ICAO24 = re.compile(r'[0-9a-f]{6}\Z')
+_INT16_MIN, _INT16_MAX = -32768, 32767
+_UINT16_MAX = 65535
+_MICROSECONDS = 1000000
+
+
+class _IdPacker:
+    # icao24 en minúsculas -> 3 bytes; cualquier otro flight_id -> tabla de cadenas
+    def __init__(self):
+        self.table = []
+
+    def pack(self, flight_id):
+        if _ICAO24.match(flight_id):
+            return bytes.fromhex(flight_id), 0
+        index = len(self.table)
+        self.table.append(flight_id.encode('utf-8'))
+        return index.to_bytes(3, 'little'), FLAG_ID_IN_TABLE
+
+    def encode_table(self):
+        parts = [TABLE_COUNT.pack(len(self.table))]
+        for value in self.table:
+            parts.append(TABLE_LENGTH.pack(len(value)))
+            parts.append(value)
+        return b''.join(parts)
+
+
+def _pack_records(rows, seconds, ids):
+    base = min(seconds) if seconds else 0
+    pack = RECORD.pack
+    records = []
+    for row, second in zip(rows, seconds):
+        packed_id, flags = ids.pack(row['flight_id'])
+        latitude, longitude = row['latitude'], row['longitude']
+        if latitude is None or longitude is None:
+            flags |= FLAG_NO_POSITION
+            lat_e5 = lon_e5 = 0
+        else:
+            lat_e5, lon_e5 = round(latitude * COORDINATE_SCALE), round(longitude * COORDINATE_SCALE)
+        altitude = row['altitude']
+        altitude_m = 0 if altitude is None else max(_INT16_MIN, min(_INT16_MAX, round(altitude)))
+        speed = row['speed']
+        if speed is None or speed < 0:
+            flags |= FLAG_NO_SPEED
+            speed_dms = 0
+        else:
+            speed_dms = min(_UINT16_MAX, round(speed * SPEED_SCALE))
+        heading = row['heading']
+        if heading is None:
+            flags |= FLAG_NO_HEADING
+            heading_dd = 0
+        else:
+            heading_dd = round((heading % 360.0) * HEADING_SCALE) % (360 * HEADING_SCALE)
+        records.append(pack(packed_id, flags, lat_e5, lon_e5, altitude_m, speed_dms, heading_dd, second - base))
+    return base, b''.join(records)
+
+
+def _seconds(snapshot, indices):
+    # snapshot.keys[i][0] es el timestamp en microsegundos (ver pagination.timestamp_key)
+    keys = snapshot.keys
+    return [keys[index][0] // _MICROSECONDS for index in indices]
+
+
+def encode_snapshot(snapshot, bbox=None):
+    """Todos los vuelos del snapshot (o sólo los de ``bbox``) como KIND_SNAPSHOT."""
+    rows = snapshot.rows
+    indices = range(len(rows))
+    if bbox is not None:
+        indices = [index for index in indices if bbox_contains(bbox, rows[index]['latitude'], rows[index]['longitude'])]
+    ids = _IdPacker()
+    base, records = _pack_records([rows[index] for index in indices], _seconds(snapshot, indices), ids)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, KIND_SNAPSHOT, 0, len(indices), 0, snapshot.version, 0, base)
+    return header + records + ids.encode_table()
+
+
+def encode_delta(previous, current, bbox=None):
+    """
+    Cambios de ``previous`` a ``current`` como KIND_DELTA: registros completos de
+    las aeronaves nuevas o modificadas y los ids de las que desaparecen. Con
+    ``bbox``, la que entra en la zona es un registro y la que sale, una baja.
+    """
+    rows = current.rows
+    added, moved, removed_rows = diff_snapshots(previous, current)
+    upserts = added + [index for index, _ in moved]
+    removed = [row['flight_id'] for row in removed_rows]
+    if bbox is not None:
+        def inside(row):
+            return bbox_contains(bbox, row['latitude'], row['longitude'])
+
+        removed = [row['flight_id'] for row in removed_rows if inside(row)]
+        removed.extend(rows[index]['flight_id'] for index, before in moved if inside(before) and not inside(rows[index]))
+        upserts = [index for index in upserts if inside(rows[index])]
+    upserts.sort()
+
+    ids = _IdPacker()
+    base, records = _pack_records([rows[index] for index in upserts], _seconds(current, upserts), ids)
+    removals = []
+    for flight_id in removed:
+        packed_id, flags = ids.pack(flight_id)
+        removals.append(REMOVED.pack(packed_id, flags))
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, KIND_DELTA, 0, len(upserts), len(removed), current.version, previous.version, base
+    )
+    return header + records + b''.join(removals) + ids.encode_table()
+
+
+def _unpack_id(packed_id, flags, table):
+    if flags & FLAG_ID_IN_TABLE:
+        return table[int.from_bytes(packed_id, 'little')]
+    return packed_id.hex()
+
+
+def decode(payload):
+    """
+    Decodificador de referencia. Devuelve un dict con ``kind`` ('snapshot' o
+    'delta'), ``version``, ``previous_version``, ``flights`` (dicts con
+    flight_id, latitude, longitude, altitude, speed, heading y timestamp en
+    segundos epoch) y ``removed`` (flight_id). Lanza ``ValueError`` si el
+    payload no es válido.
+    """
+    view = memoryview(payload)
+    if len(view) < HEADER.size:
+        raise ValueError('Payload shorter than the header')
+    magic, format_version, kind, _, record_count, removed_count, version, previous_version, base = HEADER.unpack_from(view)
+    if magic != MAGIC or format_version != FORMAT_VERSION or kind not in (KIND_SNAPSHOT, KIND_DELTA):
+        raise ValueError('Not a flight snapshot payload (bad magic, format version or kind)')
+
+    records_end = HEADER.size + record_count * RECORD.size
+    removed_end = records_end + removed_count * REMOVED.size
+    if len(view) < removed_end + TABLE_COUNT.size:
+        raise ValueError('Truncated flight snapshot payload')
+
+    table = []
+    (table_count,) = TABLE_COUNT.unpack_from(view, removed_end)
+    offset = removed_end + TABLE_COUNT.size
+    for _ in range(table_count):
+        if len(view) < offset + TABLE_LENGTH.size:
+            raise ValueError('Truncated string table')
+        (length,) = TABLE_LENGTH.unpack_from(view, offset)
+        offset += TABLE_LENGTH.size
+        if len(view) < offset + length:
+            raise ValueError('Truncated string table')
+        table.append(bytes(view[offset:offset + length]).decode('utf-8'))
+        offset += length
+
+    try:
+        flights = []
+        for packed_id, flags, lat_e5, lon_e5, altitude, speed_dms, heading_dd, seconds in RECORD.iter_unpack(
+            view[HEADER.size:records_end]
+        ):
+            no_position = flags & FLAG_NO_POSITION
+            flights.append({
+                'flight_id': _unpack_id(packed_id, flags, table),
+                'latitude': None if no_position else lat_e5 / COORDINATE_SCALE,
+                'longitude': None if no_position else lon_e5 / COORDINATE_SCALE,
+                'altitude': altitude,
+                'speed': None if flags & FLAG_NO_SPEED else speed_dms / SPEED_SCALE,
+                'heading': None if flags & FLAG_NO_HEADING else heading_dd / HEADING_SCALE,
+                'timestamp': base + seconds,
+            })
+        removed = [
+            _unpack_id(packed_id, flags, table)
+            for packed_id, flags in REMOVED.iter_unpack(view[records_end:removed_end])
+        ]
+    except IndexError:
+        raise ValueError('String table index out of range')
+
+    return {
+        'kind': 'snapshot' if kind == KIND_SNAPSHOT else 'delta',
+        'version': version,
+        'previous_version': previous_version if kind == KIND_DELTA else None,
+        'flights': flights,
+        'removed': removed,
+    }
+
+
+def cached_payload(version, bbox=None, since=None):
+    """
+    Payload de ``?format=bin`` para la versión actual, cacheado por versión:
+    el delta desde ``since`` si este proceso aún conserva esa versión y, si no,
+    el snapshot completo (la cabecera dice cuál es).
+    """
+    def build():
+        snapshot = snapshot_cache.get_snapshot(version, build_snapshot)
+        previous = snapshot_cache.get_history(since) if since is not None else None
+        if previous is not None:
+            return encode_delta(previous, snapshot, bbox)
+        return encode_snapshot(snapshot, bbox)
+
+    return snapshot_cache.get_or_build(version, ('binary', bbox, since), build)
@@ -0,0 +1,211 @@
+# flights/fastpath.py
+# Camino rápido de lectura para WSGI. Las peticiones GET más comunes a
+# /api/flightdata/ (listado, detalle y ?format=bin) se responden directamente
+# desde el snapshot en memoria, sin middlewares, sin el router ni la vista de
+# DRF y sin el ORM (la versión de ingesta y raw_data se leen con SQL directo).
+# Cualquier otra petición, o una que necesite una respuesta de error, pasa a la
+# aplicación Django completa, que es la que define el comportamiento: la salida
+# del camino rápido es byte a byte la misma.
+
+import logging
+import re
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections, connection
+from django.urls import reverse
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .binary import MEDIA_TYPE as BINARY_MEDIA_TYPE, cached_payload
+from .models import FlightRawData, IngestState, unpack_raw_payload
+from .pagination import KeysetPagination
+from .snapshot import build_snapshot, snapshot_cache
+from .views import TRUE_VALUES, FlightDataViewSet, _parse_bbox
+
+logger = logging.getLogger(__name__)
+
+JSON_MEDIA_TYPE = 'application/json'
+# Accept con los que la negociación de DRF elige JSONRenderer sin parámetros
+JSON_ACCEPT = ('', '*/*', JSON_MEDIA_TYPE)
+LIST_PARAMS = frozenset(('page', 'compact', KeysetPagination.mode_query_param, KeysetPagination.cursor_query_param, KeysetPagination.page_size_query_param))
+BINARY_PARAMS = frozenset(('format', 'since', 'bbox'))
+RETRIEVE_PARAMS = frozenset(('compact',))
+# Con credenciales, DRF autentica (y puede responder 401/403): se deja a la aplicación completa
+CREDENTIAL_HEADERS = ('HTTP_AUTHORIZATION', 'HTTP_COOKIE')
+
+_VERSION_SQL = f'SELECT version FROM {IngestState._meta.db_table} WHERE id = 1'
+_RAW_DATA_SQL = f'SELECT payload FROM {FlightRawData._meta.db_table} WHERE flight_id = %s'
+
+
+class Fallback(Exception):
+    """La petición la tiene que responder la aplicación completa."""
+
+
+def _vary():
+    # DRF añade Accept si la vista tiene más de un renderer; SessionMiddleware añade
+    # Cookie si SessionAuthentication leyó la sesión al autenticar la petición
+    vary = []
+    if len(FlightDataViewSet.renderer_classes) > 1:
+        vary.append('Accept')
+    if 'django.contrib.sessions.middleware.SessionMiddleware' in settings.MIDDLEWARE and any(
+        issubclass(authenticator, SessionAuthentication) for authenticator in FlightDataViewSet.authentication_classes
+    ):
+        vary.append('Cookie')
+    return ', '.join(vary)
+
+
+def _response_headers():
+    # Cabeceras que añaden DRF (Vary, Allow) y los middlewares de seguridad con esta configuración
+    vary = _vary()
+    headers = [('Vary', vary)] if vary else []
+    headers.append(('Allow', 'GET, HEAD, OPTIONS'))
+    if 'django.middleware.clickjacking.XFrameOptionsMiddleware' in settings.MIDDLEWARE:
+        headers.append(('X-Frame-Options', getattr(settings, 'X_FRAME_OPTIONS', 'DENY').upper()))
+    if 'django.middleware.security.SecurityMiddleware' in settings.MIDDLEWARE:
+        if settings.SECURE_CONTENT_TYPE_NOSNIFF:
+            headers.append(('X-Content-Type-Options', 'nosniff'))
+        if settings.SECURE_REFERRER_POLICY:
+            policy = settings.SECURE_REFERRER_POLICY
+            headers.append(('Referrer-Policy', policy if isinstance(policy, str) else ','.join(policy)))
+        if settings.SECURE_CROSS_ORIGIN_OPENER_POLICY:
+            headers.append(('Cross-Origin-Opener-Policy', settings.SECURE_CROSS_ORIGIN_OPENER_POLICY))
+    return headers
+
+
+def _supported_configuration():
+    # Redirecciones a HTTPS y HSTS dependen de la petición; en ese caso no se usa el camino rápido
+    return not (settings.SECURE_SSL_REDIRECT or settings.SECURE_HSTS_SECONDS)
+
+
+def current_version():
+    with connection.cursor() as cursor:
+        cursor.execute(_VERSION_SQL)
+        row = cursor.fetchone()
+    return (row[0] if row else 0) or 0
+
+
+def load_raw_data(flight_id):
+    with connection.cursor() as cursor:
+        cursor.execute(_RAW_DATA_SQL, [flight_id])
+        row = cursor.fetchone()
+    return unpack_raw_payload(row[0]) if row else None
+
+
+class FastReadApplication:
+    """
+    Envuelve la aplicación WSGI de Django. ``respond`` devuelve (content_type,
+    versión, cuerpo) o lanza Fallback; ``__call__`` arma la respuesta HTTP.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.list_path = reverse('flightdata-list')
+        self._detail = re.compile(re.escape(self.list_path) + r'(\d+)/\Z')
+        self.headers = _response_headers()
+        self.enabled = _supported_configuration()
+        self.renderer = JSONRenderer()
+        if not self.enabled:
+            logger.info("Fast read path disabled: SECURE_SSL_REDIRECT/SECURE_HSTS_SECONDS need the full middleware stack.")
+
+    def __call__(self, environ, start_response):
+        if not self._candidate(environ):
+            return self.application(environ, start_response)
+        close_old_connections()
+        response = None
+        try:
+            response = self.respond(environ)
+        except (Fallback, SuspiciousOperation):
+            # DisallowedHost, demasiados parámetros...: la aplicación completa responde el 400 y lo registra
+            pass
+        except Exception as e:
+            logger.exception(f"Fast read path failed for {environ.get('PATH_INFO')}: {e}. Using the full application.")
+        finally:
+            close_old_connections()
+        # Fuera del except: el log de la aplicación completa no arrastra la excepción del camino rápido
+        if response is None:
+            return self.application(environ, start_response)
+        content_type, version, body = response
+        headers = [
+            ('Content-Type', content_type),
+            ('X-Ingest-Version', str(version)),
+            *self.headers,
+            ('Content-Length', str(len(body))),
+        ]
+        start_response('200 OK', headers)
+        return [body]
+
+    def _candidate(self, environ):
+        return (
+            self.enabled
+            and environ.get('REQUEST_METHOD') == 'GET'
+            and environ.get('PATH_INFO', '').startswith(self.list_path)
+            and not any(environ.get(name) for name in CREDENTIAL_HEADERS)
+        )
+
+    def respond(self, environ):
+        path = environ['PATH_INFO']
+        request = Request(WSGIRequest(environ))
+        params = request.query_params
+        request.get_host() # DisallowedHost -> la aplicación completa responde 400
+        if path == self.list_path:
+            if params.get('format') == 'bin' and set(params) <= BINARY_PARAMS:
+                return self._binary(params)
+            if set(params) <= LIST_PARAMS and self._accepts_json(environ):
+                return self._list(request, params)
+            raise Fallback
+        match = self._detail.match(path)
+        if match and set(params) <= RETRIEVE_PARAMS and self._accepts_json(environ):
+            return self._retrieve(int(match.group(1)), params)
+        raise Fallback
+
+    def _accepts_json(self, environ):
+        return environ.get('HTTP_ACCEPT', '').strip() in JSON_ACCEPT
+
+    def _binary(self, params):
+        try:
+            bbox = _parse_bbox(params)
+            since = params.get('since')
+            since = int(since) if since is not None else None
+        except Exception:
+            raise Fallback
+        version = current_version()
+        return BINARY_MEDIA_TYPE, version, cached_payload(version, bbox, since)
+
+    def _list(self, request, params):
+        # Mismo resultado que FlightDataViewSet.list sin filtros espaciales ni proyección
+        version = current_version()
+        snapshot = snapshot_cache.get_snapshot(version, build_snapshot)
+        version = snapshot.version
+        compact = params.get('compact') in TRUE_VALUES
+        try:
+            if KeysetPagination.is_requested(request):
+                paginator = KeysetPagination()
+                indices = paginator.paginate_keys(snapshot.keys, request)
+            else:
+                paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+                indices = paginator.paginate_queryset(range(len(snapshot)), request)
+        except Exception:
+            # Página o cursor inválidos: el 404 lo arma DRF
+            raise Fallback
+        fragments = snapshot.compact_fragments if compact else snapshot.fragments
+        if indices is None:
+            return JSON_MEDIA_TYPE, version, b'[' + b','.join(fragments) + b']'
+        envelope = self.renderer.render(paginator.get_paginated_response([]).data)
+        if not envelope.endswith(b'[]}'):
+            raise Fallback
+        return JSON_MEDIA_TYPE, version, envelope[:-3] + b'[' + b','.join(fragments[index] for index in indices) + b']}'
+
+    def _retrieve(self, pk, params):
+        version = current_version()
+        snapshot = snapshot_cache.get_snapshot(version, build_snapshot)
+        version = snapshot.version
+        index = snapshot.by_id.get(pk)
+        if index is None:
+            raise Fallback
+        if params.get('compact') in TRUE_VALUES:
+            return JSON_MEDIA_TYPE, version, snapshot.compact_fragments[index]
+        # El detalle incluye raw_data por defecto (ver FlightDataViewSet._wants_raw_data)
+        row = snapshot.rows[index]
+        return JSON_MEDIA_TYPE, version, self.renderer.render({**row, 'raw_data': load_raw_data(row['flight_id'])})
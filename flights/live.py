@@ -0,0 +1,272 @@
+# flights/live.py
+# Feed en vivo (Server-Sent Events) sobre ASGI. Un único sondeo por proceso
+# detecta cada nueva versión de ingesta, calcula el delta por aeronave una sola
+# vez y lo reparte a todos los suscriptores mediante colas acotadas: un cliente
+# lento se desconecta en lugar de acumular mensajes en memoria.
+
+import asyncio
+import logging
+import weakref
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from .models import IngestState
+from .snapshot import DELTA_FIELDS, build_snapshot, diff_snapshots, snapshot_cache
+from .spatial import bbox_contains
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_HEARTBEAT = 15.0
+RECONNECT_DELAY_MS = 5000
+
+# Marca que se deja en la cola de un suscriptor descartado
+DROPPED = object()
+
+
+def _event(event, data, event_id=None):
+    # data ya es JSON de una sola línea (JSONRenderer no emite saltos de línea)
+    header = b'id: %d\n' % event_id if event_id is not None else b''
+    return header + b'event: ' + event.encode() + b'\ndata: ' + data + b'\n\n'
+
+
+def snapshot_event(snapshot, bbox=None):
+    # Estado completo (sin raw_data) con el que el cliente empieza a aplicar deltas
+    fragments = snapshot.compact_fragments
+    if bbox is not None:
+        rows = snapshot.rows
+        fragments = [
+            fragment for row, fragment in zip(rows, fragments)
+            if bbox_contains(bbox, row['latitude'], row['longitude'])
+        ]
+    data = b'{"version":%d,"flights":[' % snapshot.version + b','.join(fragments) + b']}'
+    return _event('snapshot', data, snapshot.version)
+
+
+class SnapshotDelta:
+    """
+    Diferencia entre dos FlightSnapshot (``diff_snapshots``): aeronaves nuevas,
+    movidas y desaparecidas (expiradas o borradas).
+    Cada elemento se renderiza una sola vez; ``encode(bbox)`` sólo une bytes.
+    """
+
+    def __init__(self, previous, current):
+        self.version = current.version
+        self.previous_version = previous.version
+        renderer = JSONRenderer()
+        rows, fragments = current.rows, current.compact_fragments
+        added, moved, removed = diff_snapshots(previous, current)
+
+        # (lat, lon, fragmento); moved lleva además la posición anterior, la fila
+        # completa y el flight_id renderizado, por si entra o sale de un bbox
+        self.added = [(rows[index]['latitude'], rows[index]['longitude'], fragments[index]) for index in added]
+        self.moved = []
+        for index, before in moved:
+            row = rows[index]
+            change = {'flight_id': row['flight_id'], **{name: row[name] for name in DELTA_FIELDS}}
+            self.moved.append((
+                row['latitude'], row['longitude'], renderer.render(change),
+                before['latitude'], before['longitude'], fragments[index], renderer.render(row['flight_id']),
+            ))
+        self.removed = [(row['latitude'], row['longitude'], renderer.render(row['flight_id'])) for row in removed]
+
+    def __bool__(self):
+        return bool(self.added or self.moved or self.removed)
+
+    def counts(self):
+        return {'added': len(self.added), 'moved': len(self.moved), 'removed': len(self.removed)}
+
+    def encode(self, bbox=None):
+        """
+        Evento SSE con el delta visto desde ``bbox``: una aeronave que entra en
+        la zona llega como "added" (fila completa) y una que sale, como "removed".
+        Devuelve None si el delta no afecta a la zona.
+        """
+        if bbox is None:
+            added = [item[2] for item in self.added]
+            moved = [item[2] for item in self.moved]
+            removed = [item[2] for item in self.removed]
+        else:
+            added = [fragment for lat, lon, fragment in self.added if bbox_contains(bbox, lat, lon)]
+            moved, removed = [], []
+            for lat, lon, change, before_lat, before_lon, fragment, flight_id in self.moved:
+                inside, was_inside = bbox_contains(bbox, lat, lon), bbox_contains(bbox, before_lat, before_lon)
+                if inside and was_inside:
+                    moved.append(change)
+                elif inside:
+                    added.append(fragment)
+                elif was_inside:
+                    removed.append(flight_id)
+            removed.extend(fragment for lat, lon, fragment in self.removed if bbox_contains(bbox, lat, lon))
+            if not (added or moved or removed):
+                return None
+        data = (
+            b'{"version":%d,"previous_version":%d,"added":[' % (self.version, self.previous_version)
+            + b','.join(added) + b'],"moved":[' + b','.join(moved) + b'],"removed":[' + b','.join(removed) + b']}'
+        )
+        return _event('delta', data, self.version)
+
+
+class Subscription:
+    def __init__(self, bbox=None, max_queue=DEFAULT_QUEUE_SIZE):
+        self.bbox = tuple(bbox) if bbox else None
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = False
+
+    def offer(self, message):
+        # False si la cola estaba llena: se vacía y sólo queda el aviso DROPPED
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(DROPPED)
+            return False
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LiveBroker:
+    """
+    Pub/sub en memoria para un event loop. ``publish`` codifica el delta una vez
+    por bbox distinto y lo encola sin esperar a nadie.
+    """
+
+    def __init__(self, max_queue=DEFAULT_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, bbox=None):
+        subscription = Subscription(bbox, self.max_queue)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, delta):
+        encoded = {}
+        delivered = 0
+        for subscription in list(self._subscribers):
+            if subscription.bbox in encoded:
+                message = encoded[subscription.bbox]
+            else:
+                message = encoded[subscription.bbox] = delta.encode(subscription.bbox)
+            if message is None:
+                continue
+            if subscription.offer(message):
+                delivered += 1
+            else:
+                self._subscribers.discard(subscription)
+                self.dropped += 1
+                logger.warning(f"Live feed subscriber dropped: queue full ({self.max_queue} messages).")
+        self.published += 1
+        self.delivered += delivered
+        return delivered
+
+    def stats(self):
+        return {
+            'subscribers': len(self._subscribers),
+            'published': self.published,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+        }
+
+
+class LiveFeed:
+    """
+    Sondea IngestState.version mientras haya suscriptores y publica el delta de
+    cada versión nueva. El snapshot sale de snapshot_cache, así que se comparte
+    con las vistas REST del mismo proceso.
+    """
+
+    def __init__(self, poll_interval=DEFAULT_POLL_INTERVAL, max_queue=DEFAULT_QUEUE_SIZE):
+        self.poll_interval = poll_interval
+        self.broker = LiveBroker(max_queue)
+        self.snapshot = None
+        self._task = None
+
+    async def _load_snapshot(self):
+        version = await sync_to_async(IngestState.current_version)()
+        return await sync_to_async(snapshot_cache.get_snapshot)(version, build_snapshot)
+
+    async def subscribe(self, bbox=None):
+        # Devuelve (suscripción, snapshot a partir del cual aplicar los deltas)
+        if self.snapshot is None:
+            self.snapshot = await self._load_snapshot()
+        subscription = self.broker.subscribe(bbox)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._poll())
+        return subscription, self.snapshot
+
+    async def refresh(self):
+        snapshot = await self._load_snapshot()
+        previous = self.snapshot
+        if previous is not None and snapshot.version <= previous.version:
+            return None
+        self.snapshot = snapshot
+        if previous is None:
+            return None
+        delta = SnapshotDelta(previous, snapshot)
+        if delta:
+            self.broker.publish(delta)
+            logger.info(f"Live feed published version {snapshot.version} to {len(self.broker)} subscribers: {delta.counts()}")
+        return delta
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self.broker:
+                break
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.exception(f"Live feed refresh failed: {e}")
+        # Sin suscriptores se suelta el snapshot; el próximo cliente lo vuelve a cargar
+        self.snapshot = None
+        self._task = None
+
+
+_feeds = weakref.WeakKeyDictionary()
+
+
+def get_live_feed():
+    # Un LiveFeed por event loop: las colas asyncio no se comparten entre loops
+    loop = asyncio.get_running_loop()
+    feed = _feeds.get(loop)
+    if feed is None:
+        feed = _feeds[loop] = LiveFeed(
+            poll_interval=getattr(settings, 'FLIGHTS_LIVE_POLL_INTERVAL', DEFAULT_POLL_INTERVAL),
+            max_queue=getattr(settings, 'FLIGHTS_LIVE_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+        )
+    return feed
+
+
+async def iter_live_events(feed, subscription, snapshot, last_event_id=None, heartbeat=DEFAULT_HEARTBEAT):
+    try:
+        yield b'retry: %d\n\n' % RECONNECT_DELAY_MS
+        # Si el cliente se reconecta ya al día (Last-Event-ID) no se repite el snapshot
+        if last_event_id != str(snapshot.version):
+            yield snapshot_event(snapshot, subscription.bbox)
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            if message is DROPPED:
+                yield _event('dropped', b'{"reason":"slow consumer"}')
+                return
+            yield message
+    finally:
+        feed.broker.unsubscribe(subscription)
@@ -0,0 +1,62 @@
+import json
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from flights.aggregates import FleetAggregator, summarize
+from flights.benchmarking import best_of
+from flights.normalizer import normalize_states
+from flights.synthetic import generate_states
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+# Nombre -> argumentos de summarize()
+READS = {
+    'global': {},
+    'bbox europe': {'bbox': (-10.0, 35.0, 30.0, 60.0)},
+    'world by cell': {'bbox': (-180.0, -90.0, 180.0, 90.0), 'by_cell': True},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Cost of the fleet statistics (flights/aggregates.py): accumulation per ingest cycle, size of the stored '
+        'document and cost of building a /api/flightdata/stats/ response, which must not grow with the fleet.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Aircraft per cycle.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best time is reported.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or min(options['sizes']) < 1:
+            raise CommandError('--sizes and --repeat must be positive integers.')
+
+        logging.disable(logging.CRITICAL)
+        try:
+            header = f"{'aircraft':>8} | {'ingest ms':>9} | {'ns/row':>6} | {'doc KB':>6}"
+            self.stdout.write(header + ''.join(f" | {name + ' ms':>16}" for name in READS))
+            for size in options['sizes']:
+                rows = normalize_states(generate_states(size, seed=options['seed'])).rows
+                batches = [rows[start:start + BATCH_SIZE] for start in range(0, len(rows), BATCH_SIZE)]
+
+                def accumulate():
+                    aggregator = FleetAggregator()
+                    for batch in batches:
+                        aggregator.add_rows(batch)
+                    return aggregator
+
+                ingest_time, aggregator = best_of(options['repeat'], accumulate)
+                # Como se guarda y se vuelve a leer de la base de datos (JSONField)
+                encoded = json.dumps(aggregator.document())
+                document = json.loads(encoded)
+                line = (
+                    f"{size:>8} | {ingest_time * 1000:9.1f} | {ingest_time / len(rows) * 1e9:6.0f} | "
+                    f"{len(encoded) / 1024:6.0f}"
+                )
+                for arguments in READS.values():
+                    read_time, _ = best_of(options['repeat'], lambda: summarize(document, **arguments))
+                    line += f" | {read_time * 1000:16.3f}"
+                self.stdout.write(line)
+        finally:
+            logging.disable(logging.NOTSET)
@@ -0,0 +1,83 @@
+import gzip
+import json
+import logging
+import random
+from django.core.management.base import BaseCommand, CommandError
+from flights.benchmarking import best_of, synthetic_snapshot_rows
+from flights.binary import decode, encode_delta, encode_snapshot
+from flights.live import SnapshotDelta
+from flights.services import FlightDataService
+from flights.snapshot import FlightSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def _moved_rows(rows, ratio, seed):
+    # Siguiente versión: una fracción de las aeronaves se desplaza
+    rng = random.Random(seed)
+    rows = [dict(row) for row in rows]
+    for row in rng.sample(rows, int(len(rows) * ratio)):
+        if row['latitude'] is not None:
+            row['latitude'] = max(-90.0, min(90.0, row['latitude'] + rng.uniform(-0.1, 0.1)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Compares the binary snapshot/delta format with the JSON list output: size, encode and decode time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--moved-ratio', type=float, default=0.3, help='Fraction of aircraft changed in the delta.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the best time is reported.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be a positive integer.')
+
+        logging.disable(logging.CRITICAL)
+        try:
+            service = FlightDataService()
+            for size in options['flights']:
+                self._benchmark(service, size, options)
+        finally:
+            logging.disable(logging.NOTSET)
+
+    def _benchmark(self, service, size, options):
+        repeat = options['repeat']
+        rows, keys = synthetic_snapshot_rows(service, size)
+        previous = FlightSnapshot(1, rows, keys)
+        current = FlightSnapshot(2, _moved_rows(rows, options['moved_ratio'], size), keys)
+
+        # Salida JSON actual del listado (fragmentos pre-renderizados) frente al binario
+        payloads = {
+            'json': (
+                lambda: b'[' + b','.join(current.fragments) + b']',
+                json.loads,
+            ),
+            'json compact': (
+                lambda: b'[' + b','.join(current.compact_fragments) + b']',
+                json.loads,
+            ),
+            'binary': (lambda: encode_snapshot(current), decode),
+            'json delta (SSE)': (
+                lambda: SnapshotDelta(previous, current).encode().split(b'data: ', 1)[1],
+                json.loads,
+            ),
+            'binary delta': (lambda: encode_delta(previous, current), decode),
+        }
+
+        self.stdout.write(f"--- {size} flights, {int(size * options['moved_ratio'])} changed in the delta ---")
+        self.stdout.write(f"{'format':>17} | {'bytes':>10} | {'gzip':>9} | {'encode ms':>9} | {'decode ms':>9}")
+        baseline = None
+        for name, (encode, decode_payload) in payloads.items():
+            encode_time, body = best_of(repeat, encode)
+            decode_time, _ = best_of(repeat, lambda: decode_payload(body))
+            baseline = baseline or len(body)
+            self.stdout.write(
+                f"{name:>17} | {len(body):>10} | {len(gzip.compress(body, 6)):>9} | "
+                f"{encode_time * 1000:9.2f} | {decode_time * 1000:9.2f}  ({len(body) / baseline:.1%} of json)"
+            )
+
+        decoded = decode(encode_snapshot(current))
+        if [flight['flight_id'] for flight in decoded['flights']] != [row['flight_id'] for row in current.rows]:
+            raise CommandError('Binary snapshot does not round-trip the flight ids in order.')
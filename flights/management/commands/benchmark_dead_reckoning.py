@@ -0,0 +1,48 @@
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from flights.benchmarking import best_of, synthetic_snapshot_rows
+from flights.motion import FleetMotion, project_rows
+from flights.services import FlightDataService
+from flights.snapshot import FlightSnapshot
+from flights.synthetic import BASE_TIMESTAMP, generate_states
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Cost of the ?at= dead-reckoning projection: per-version preparation and per-request projection of the whole fleet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--seconds', type=float, default=30.0, help='Projection time after the synthetic observations.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the best time is reported.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be a positive integer.')
+
+        logging.disable(logging.CRITICAL)
+        try:
+            service = FlightDataService()
+            self.stdout.write(f"{'flights':>8} | {'prepare ms':>10} | {'fleet ms':>8} | {'page of 100 ms':>14} | moved")
+            for size in options['flights']:
+                rows, keys = synthetic_snapshot_rows(service, size)
+                snapshot = FlightSnapshot(1, rows, keys)
+                # La tasa vertical que en producción se lee de FlightRawData
+                vertical_motion = {
+                    state[0]: (state[11], state[8]) for state in generate_states(size, malformed_ratio=0, short_ratio=0)
+                }
+                at = BASE_TIMESTAMP + options['seconds']
+
+                prepare_time, motion = best_of(options['repeat'], lambda: FleetMotion(snapshot, vertical_motion))
+                fleet_time, positions = best_of(options['repeat'], lambda: motion.project(at))
+                page_time, _ = best_of(
+                    options['repeat'], lambda: project_rows(rows[:100], motion.project(at, range(min(100, size))))
+                )
+                moved = sum(position is not None for position in positions)
+                self.stdout.write(
+                    f"{len(snapshot):>8} | {prepare_time * 1000:10.1f} | {fleet_time * 1000:8.2f} | "
+                    f"{page_time * 1000:14.3f} | {moved}"
+                )
+        finally:
+            logging.disable(logging.NOTSET)
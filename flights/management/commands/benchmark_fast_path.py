@@ -0,0 +1,259 @@
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+from flights.benchmarking import StubOpenSkyServer, latency_summary, load_synthetic_flights, temporary_database
+from flights.fastpath import FastReadApplication
+from flights.models import FlightData, IngestState
+from flights.services import FlightDataService
+from flights.synthetic import generate_payload
+
+logger = logging.getLogger(__name__)
+
+BBOX = '-10,35,30,60'
+
+
+class _CountingApplication:
+    # Aplicación completa que cuenta las peticiones que le llegan (las que el camino rápido no atiende)
+    def __init__(self, application):
+        self.application = application
+        self.calls = 0
+
+    def __call__(self, environ, start_response):
+        self.calls += 1
+        return self.application(environ, start_response)
+
+
+def _call(application, environ):
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured['status'], captured['headers'] = status, headers
+
+    chunks = application(environ, start_response)
+    try:
+        body = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return captured['status'], dict(captured['headers']), body
+
+
+def _load_client(args):
+    # Proceso cliente: peticiones en serie (una conexión por petición, como hace gunicorn sync) hasta el plazo
+    port, path, seconds = args
+    done = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            connection.request('GET', path, headers={'Host': '127.0.0.1'})
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                done += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+        finally:
+            connection.close()
+    return done, errors
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Checks that flights/fastpath.py returns exactly the same responses as the full Django stack and compares '
+        'their latency in-process and their requests/sec under gunicorn.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=500, help='In-process requests per endpoint and path.')
+        parser.add_argument('--gunicorn', action='store_true', help='Also measure requests/sec under gunicorn.')
+        parser.add_argument('--workers', type=int, default=4, help='gunicorn workers.')
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent client processes for the gunicorn run.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per endpoint and path.')
+        parser.add_argument(
+            '--database-url', default=None,
+            help='Scratch database for the gunicorn run (it is migrated and loaded). Default: a temporary SQLite file.',
+        )
+
+    def handle(self, *args, **options):
+        if options['flights'] < 100 or options['requests'] < 1:
+            raise CommandError('--flights must be at least 100 and --requests positive.')
+
+        logging.disable(logging.CRITICAL)
+        try:
+            with temporary_database():
+                load_synthetic_flights(FlightDataService(), options['flights'])
+                IngestState.bump()
+                with override_settings(ALLOWED_HOSTS=['testserver']):
+                    self._check_and_time(options)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        if options['gunicorn']:
+            self._gunicorn(options)
+
+    def _paths(self):
+        pk = FlightData.objects.filter(expired_at__isnull=True).values_list('pk', flat=True).first()
+        version = IngestState.current_version()
+        return {
+            'list': '/api/flightdata/',
+            'list page 3': '/api/flightdata/?page=3',
+            'list last page': '/api/flightdata/?page=last',
+            'list compact': '/api/flightdata/?compact=1',
+            'list keyset 100': '/api/flightdata/?pagination=keyset&page_size=100',
+            'binary': '/api/flightdata/?format=bin',
+            'binary bbox': f'/api/flightdata/?format=bin&bbox={BBOX}',
+            'binary since': f'/api/flightdata/?format=bin&since={version - 1}',
+            'retrieve': f'/api/flightdata/{pk}/',
+            'retrieve compact': f'/api/flightdata/{pk}/?compact=1',
+            # Estas las responde siempre la aplicación completa
+            'missing flight (404)': '/api/flightdata/999999999/',
+            'bad page (404)': '/api/flightdata/?page=999999',
+            'bbox filter': f'/api/flightdata/?bbox={BBOX}',
+        }
+
+    def _check_and_time(self, options):
+        full = WSGIHandler()
+        counting = _CountingApplication(full)
+        fast = FastReadApplication(counting)
+        factory = RequestFactory()
+        paths = self._paths()
+
+        # La siguiente página del keyset se pide con el cursor que devuelve la primera
+        _, _, body = _call(full, factory.get(paths['list keyset 100']).environ)
+        paths['list keyset next'] = json.loads(body)['next'].replace('http://testserver', '')
+
+        self.stdout.write(f"--- {options['flights']} flights, in-process WSGI ---")
+        self.stdout.write(f"{'request':>22} | {'served by':>9} | {'full p50 ms':>11} | {'fast p50 ms':>11} | speedup")
+        for name, path in paths.items():
+            calls = counting.calls
+            expected = _call(full, factory.get(path).environ)
+            counting.calls = calls
+            actual = _call(fast, factory.get(path).environ)
+            served_by = 'full' if counting.calls > calls else 'fast'
+            if actual != expected:
+                differing = sorted(key for key in set(expected[1]) | set(actual[1]) if expected[1].get(key) != actual[1].get(key))
+                raise CommandError(
+                    f"Fast path response differs for {path}: status {expected[0]} / {actual[0]}, "
+                    f"bodies {'equal' if expected[2] == actual[2] else 'differ'}, headers {differing or 'equal'}."
+                )
+            full_times = self._time(full, factory, path, options['requests'])
+            fast_times = self._time(fast, factory, path, options['requests'])
+            full_p50, fast_p50 = latency_summary(full_times)['p50_ms'], latency_summary(fast_times)['p50_ms']
+            self.stdout.write(f"{name:>22} | {served_by:>9} | {full_p50:11.3f} | {fast_p50:11.3f} | {full_p50 / fast_p50:6.1f}x")
+        self.stdout.write(self.style.SUCCESS('Status, headers and bodies identical for every request.'))
+
+    def _time(self, application, factory, path, count):
+        times = []
+        for environ in [factory.get(path).environ for _ in range(count)]:
+            started = time.perf_counter()
+            _call(application, environ)
+            times.append(time.perf_counter() - started)
+        return times
+
+    def _gunicorn(self, options):
+        with tempfile.TemporaryDirectory() as directory:
+            database_url = options['database_url'] or f"sqlite:///{os.path.join(directory, 'bench.sqlite3')}"
+            env = {
+                **os.environ,
+                'DATABASE_URL': database_url,
+                'ALLOWED_HOST_FQDN': '127.0.0.1',
+                'DJANGO_DEBUG': 'False',
+            }
+            payload = json.dumps(generate_payload(options['flights'], malformed_ratio=0)).encode()
+            with StubOpenSkyServer(payload) as server:
+                self._manage(['migrate', '--noinput'], env)
+                self._manage(['update_flight_data', '--mode', 'replace'], {**env, 'EXTERNAL_API_URL': server.url})
+
+            results = {}
+            for mode, enabled in (('full', 'False'), ('fast', 'True')):
+                results[mode] = self._gunicorn_run({**env, 'FLIGHTS_FAST_READ_PATH': enabled}, options)
+
+        self.stdout.write(
+            f"--- gunicorn, {options['workers']} sync workers, {options['clients']} client processes, "
+            f"{options['duration']:.0f} s per endpoint ---"
+        )
+        self.stdout.write(f"{'request':>17} | {'full req/s':>10} | {'fast req/s':>10} | speedup | errors")
+        for name in results['full']:
+            full_rps, full_errors = results['full'][name]
+            fast_rps, fast_errors = results['fast'][name]
+            self.stdout.write(
+                f"{name:>17} | {full_rps:10.0f} | {fast_rps:10.0f} | {fast_rps / full_rps if full_rps else 0:6.2f}x | "
+                f"{full_errors}/{fast_errors}"
+            )
+
+    def _manage(self, arguments, env):
+        completed = subprocess.run(
+            [sys.executable, 'manage.py', *arguments], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            raise CommandError(f"manage.py {' '.join(arguments)} failed:\n{completed.stderr[-2000:]}")
+
+    def _gunicorn_run(self, env, options):
+        port = _free_port()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'tracker_project.wsgi', '--workers', str(options['workers']),
+             '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            first = self._wait_ready(port, process)
+            pk = first['results'][0]['id']
+            paths = {
+                'list': '/api/flightdata/',
+                'list keyset 100': '/api/flightdata/?pagination=keyset&page_size=100',
+                'binary': '/api/flightdata/?format=bin',
+                'retrieve': f'/api/flightdata/{pk}/',
+                'retrieve compact': f'/api/flightdata/{pk}/?compact=1',
+            }
+            context = multiprocessing.get_context('fork')
+            results = {}
+            with context.Pool(options['clients']) as pool:
+                # Calentamiento: cada worker construye su snapshot con la primera petición
+                for path in paths.values():
+                    pool.map(_load_client, [(port, path, 1.0)] * options['clients'])
+                for name, path in paths.items():
+                    counts = pool.map(_load_client, [(port, path, options['duration'])] * options['clients'])
+                    results[name] = (sum(done for done, _ in counts) / options['duration'], sum(errors for _, errors in counts))
+            return results
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    def _wait_ready(self, port, process, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError('gunicorn exited during startup.')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                connection.request('GET', '/api/flightdata/', headers={'Host': '127.0.0.1'})
+                response = connection.getresponse()
+                body = response.read()
+                connection.close()
+                if response.status == 200:
+                    return json.loads(body)
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f'gunicorn did not answer on port {port} within {timeout} s.')
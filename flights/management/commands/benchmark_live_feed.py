@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import random
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand, CommandError
+from flights.benchmarking import synthetic_snapshot_rows
+from flights.live import DROPPED, LiveBroker, SnapshotDelta
+from flights.services import FlightDataService
+from flights.snapshot import FlightSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Zonas de suscripción (min_lon, min_lat, max_lon, max_lat); None es el feed completo
+SUBSCRIPTION_REGIONS = (
+    None,
+    (-10.0, 35.0, 30.0, 60.0),
+    (-125.0, 25.0, -65.0, 50.0),
+    (100.0, 20.0, 145.0, 45.0),
+    (170.0, -50.0, -170.0, -30.0),
+)
+
+
+def _next_rows(rows, rng, moved_ratio, churn_ratio, next_pk):
+    # Simula una ingesta: mueve una fracción de aeronaves, retira algunas y añade otras
+    rows = [dict(row) for row in rows]
+    for row in rng.sample(rows, int(len(rows) * moved_ratio)):
+        if row['latitude'] is not None and row['longitude'] is not None:
+            row['latitude'] = max(-90.0, min(90.0, row['latitude'] + rng.uniform(-0.2, 0.2)))
+            row['longitude'] = max(-180.0, min(180.0, row['longitude'] + rng.uniform(-0.2, 0.2)))
+    churn = int(len(rows) * churn_ratio)
+    for index in sorted(rng.sample(range(len(rows)), churn), reverse=True):
+        rows.pop(index)
+    for offset in range(churn):
+        row = dict(rng.choice(rows))
+        row['id'] = next_pk + offset
+        row['flight_id'] = f'new{next_pk + offset:07d}'
+        rows.append(row)
+    return rows, next_pk + churn
+
+
+class Command(BaseCommand):
+    help = 'Load test for the live feed: fans out snapshot deltas to many simulated SSE subscribers in-process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=1000)
+        parser.add_argument('--flights', type=int, default=5000)
+        parser.add_argument('--updates', type=int, default=30, help='Ingest versions published.')
+        parser.add_argument('--moved-ratio', type=float, default=0.3)
+        parser.add_argument('--churn-ratio', type=float, default=0.01, help='Fraction removed and added per version.')
+        parser.add_argument('--slow-ratio', type=float, default=0.05, help='Subscribers that never read.')
+        parser.add_argument('--queue-size', type=int, default=16)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['subscribers'] < 1 or options['updates'] < 1 or options['queue_size'] < 1:
+            raise CommandError('--subscribers, --updates and --queue-size must be positive integers.')
+        if not 0 <= options['slow_ratio'] <= 1:
+            raise CommandError('--slow-ratio must be between 0 and 1.')
+
+        logging.disable(logging.CRITICAL)
+        try:
+            asyncio.run(self._run(options))
+        finally:
+            logging.disable(logging.NOTSET)
+
+    async def _run(self, options):
+        rng = random.Random(options['seed'])
+        rows, _ = synthetic_snapshot_rows(FlightDataService(), options['flights'], options['seed'])
+        next_pk = len(rows) + 1
+        previous = FlightSnapshot(1, rows)
+
+        broker = LiveBroker(options['queue_size'])
+        slow_count = int(options['subscribers'] * options['slow_ratio'])
+        subscriptions = [
+            broker.subscribe(SUBSCRIPTION_REGIONS[index % len(SUBSCRIPTION_REGIONS)])
+            for index in range(options['subscribers'])
+        ]
+        slow, fast = subscriptions[:slow_count], subscriptions[slow_count:]
+        received = {'messages': 0, 'bytes': 0}
+
+        async def consume(subscription):
+            while True:
+                message = await subscription.get()
+                if message is DROPPED:
+                    return
+                received['messages'] += 1
+                received['bytes'] += len(message)
+
+        consumers = [asyncio.ensure_future(consume(subscription)) for subscription in fast]
+        self.stdout.write(
+            f"{options['subscribers']} subscribers ({slow_count} never read), {len(previous)} flights, "
+            f"{len(SUBSCRIPTION_REGIONS)} distinct regions, queue size {options['queue_size']}"
+        )
+
+        # Versiones y deltas se preparan antes: sólo se mide memoria del reparto
+        deltas, delta_times = [], []
+        for version in range(2, options['updates'] + 2):
+            rows, next_pk = _next_rows(rows, rng, options['moved_ratio'], options['churn_ratio'], next_pk)
+            current = FlightSnapshot(version, rows)
+            started = time.perf_counter()
+            deltas.append(SnapshotDelta(previous, current))
+            delta_times.append(time.perf_counter() - started)
+            previous = current
+
+        tracemalloc.start()
+        publish_times, drain_times = [], []
+        for delta in deltas:
+            started = time.perf_counter()
+            broker.publish(delta)
+            publish_times.append(time.perf_counter() - started)
+
+            # Hasta que todos los consumidores rápidos vacían su cola
+            started = time.perf_counter()
+            while any(not subscription.queue.empty() for subscription in fast):
+                await asyncio.sleep(0)
+            drain_times.append(time.perf_counter() - started)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        for consumer in consumers:
+            consumer.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+
+        def summary(times):
+            times = sorted(times)
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            return f"avg {sum(times) / len(times) * 1000:7.2f} ms | p95 {p95 * 1000:7.2f} ms"
+
+        counts = delta.counts()
+        self.stdout.write(f"Last delta: {counts['added']} added, {counts['moved']} moved, {counts['removed']} removed")
+        self.stdout.write(f"Delta computation (once per version): {summary(delta_times)}")
+        self.stdout.write(f"Fan-out to all subscribers:            {summary(publish_times)}")
+        self.stdout.write(f"Until every fast subscriber drained:   {summary(drain_times)}")
+        self.stdout.write(
+            f"Delivered {received['messages']} messages ({received['bytes'] / 1e6:.1f} MB) to {len(fast)} fast subscribers; "
+            f"dropped {broker.dropped} of {slow_count} slow subscribers; "
+            f"{sum(subscription.queue.qsize() for subscription in slow if not subscription.dropped)} messages still queued."
+        )
+        self.stdout.write(f"Peak traced memory during fan-out (deltas excluded): {peak / 1e6:.1f} MB")
@@ -0,0 +1,52 @@
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from flights.benchmarking import best_of
+from flights.normalizer import normalize_states
+from flights.services import FlightDataService
+from flights.synthetic import generate_states
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark: per-item _process_api_item vs. the batched normalize_states on synthetic OpenSky states (output equality is checked in flights/tests.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='Number of states per run.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per size; the best time is reported.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be a positive integer.')
+
+        # Los rechazos del camino por elemento generan un log por fila; se silencian
+        # para medir la normalización y no la salida a consola.
+        logging.disable(logging.CRITICAL)
+        try:
+            service = FlightDataService()
+            for size in options['sizes']:
+                states = generate_states(size, seed=options['seed'])
+
+                def per_item():
+                    rows = []
+                    for item in states:
+                        if not isinstance(item, list):
+                            continue
+                        row = service._process_api_item(item)
+                        if row:
+                            rows.append(row)
+                    return rows
+
+                def batched():
+                    return normalize_states(states).rows
+
+                per_item_time, _ = best_of(options['repeat'], per_item)
+                batched_time, batched_rows = best_of(options['repeat'], batched)
+
+                self.stdout.write(
+                    f"{size:>8} states | per-item: {per_item_time * 1000:9.1f} ms | "
+                    f"batched: {batched_time * 1000:9.1f} ms | "
+                    f"speedup: {per_item_time / batched_time:4.2f}x | rows: {len(batched_rows)}"
+                )
+        finally:
+            logging.disable(logging.NOTSET)
@@ -0,0 +1,98 @@
+import logging
+import time
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from flights.benchmarking import best_of, table_bytes, temporary_database
+from flights.models import FlightData, FlightRawData
+from flights.normalizer import normalize_states
+from flights.serializers import FlightDataSerializer
+from flights.spatial import grid_cell_for
+from flights.synthetic import generate_states
+
+logger = logging.getLogger(__name__)
+
+# Última migración con raw_data dentro de FlightData
+BEFORE_MIGRATION = ('flights', '0007_ingeststate_source_fingerprint')
+
+
+def _serializer_for(model):
+    meta = type('Meta', (), {'model': model, 'fields': '__all__'})
+    return type('BenchmarkSerializer', (serializers.ModelSerializer,), {'Meta': meta})
+
+
+class Command(BaseCommand):
+    help = 'Measures FlightData table size and list query time with raw_data inline (0007) and in FlightRawData'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=10000, help='Flights loaded in the temporary database.')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the best time is reported.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['flights'] < 1:
+            raise CommandError('--flights and --repeat must be positive integers.')
+
+        logging.disable(logging.CRITICAL)
+        try:
+            with temporary_database():
+                # La base temporal se lleva al esquema anterior, se carga y se vuelve a migrar
+                call_command('migrate', *BEFORE_MIGRATION, verbosity=0)
+                old_apps = MigrationExecutor(connection).loader.project_state(BEFORE_MIGRATION).apps
+                OldFlightData = old_apps.get_model('flights', 'FlightData')
+                rows = normalize_states(generate_states(options['flights'], malformed_ratio=0)).rows
+                OldFlightData.objects.bulk_create(
+                    [OldFlightData(grid_cell=grid_cell_for(row['latitude'], row['longitude']), **row) for row in rows],
+                    batch_size=2000,
+                )
+                before = self._measure(OldFlightData, _serializer_for(OldFlightData), options)
+                before['table'] = table_bytes(FlightData._meta.db_table)
+
+                started = time.perf_counter()
+                call_command('migrate', 'flights', verbosity=0)
+                migration_time = time.perf_counter() - started
+                # DROP COLUMN no devuelve el espacio hasta reescribir la tabla
+                self._rewrite_table(FlightData._meta.db_table)
+
+                after = self._measure(FlightData, FlightDataSerializer, options)
+                after['table'] = table_bytes(FlightData._meta.db_table)
+                after['raw_table'] = table_bytes(FlightRawData._meta.db_table)
+                page_ids = [row['flight_id'] for row in rows[:options['page_size']]]
+                raw_time, _ = best_of(options['repeat'], lambda: FlightRawData.load(page_ids))
+        finally:
+            logging.disable(logging.NOTSET)
+
+        self.stdout.write(f"{options['flights']} flights on {connection.vendor}; migration 0008 took {migration_time * 1000:.0f} ms "
+            f"(sizes after rewriting the table)")
+        if before['table'] is not None:
+            self.stdout.write(
+                f"FlightData table: {before['table'] / 1024:.0f} KiB -> {after['table'] / 1024:.0f} KiB "
+                f"(+ FlightRawData {after['raw_table'] / 1024:.0f} KiB, loaded only on demand)"
+            )
+        for label, key in (('Full list query', 'query'), (f"Page of {options['page_size']}", 'page'),
+                           ('List query + serialize + render', 'render')):
+            self.stdout.write(
+                f"{label:>32}: {before[key] * 1000:8.2f} ms -> {after[key] * 1000:8.2f} ms "
+                f"({before[key] / after[key]:.2f}x)"
+            )
+        self.stdout.write(f"{'raw_data for one page (on demand)':>32}: {raw_time * 1000:8.2f} ms")
+
+    def _rewrite_table(self, table):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('VACUUM')
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f'VACUUM FULL {connection.ops.quote_name(table)}')
+
+    def _measure(self, model, serializer_class, options):
+        queryset = model.objects.filter(expired_at__isnull=True).order_by('-timestamp', '-id')
+        renderer = JSONRenderer()
+        repeat = options['repeat']
+        # .all() en cada ejecución: un QuerySet evaluado guarda sus resultados
+        query_time, _ = best_of(repeat, lambda: list(queryset.all()))
+        page_time, _ = best_of(repeat, lambda: list(queryset.all()[:options['page_size']]))
+        render_time, _ = best_of(repeat, lambda: renderer.render(serializer_class(list(queryset.all()), many=True).data))
+        return {'query': query_time, 'page': page_time, 'render': render_time}
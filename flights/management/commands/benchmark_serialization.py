@@ -0,0 +1,60 @@
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from flights.benchmarking import best_of, load_synthetic_flights, temporary_database
+from flights.models import FlightData
+from flights.serializers import FlightDataSerializer
+from flights.services import FlightDataService
+from flights.snapshot import FlightSnapshot
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Benchmarks FlightDataSerializer + JSONRenderer against pages assembled from pre-rendered snapshot fragments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=5000, help='Flights loaded in the temporary database.')
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the best time is reported.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be a positive integer.')
+        if max(options['page_sizes']) > options['flights']:
+            raise CommandError('--flights must be at least the largest page size.')
+
+        logging.disable(logging.CRITICAL)
+        try:
+            with temporary_database():
+                load_synthetic_flights(FlightDataService(), options['flights'])
+                queryset = FlightData.objects.filter(expired_at__isnull=True).order_by('-timestamp', '-id')
+                renderer = JSONRenderer()
+
+                # Coste que se paga una vez por versión de ingesta
+                build_time, snapshot = best_of(
+                    1, lambda: FlightSnapshot(1, FlightDataSerializer(queryset, many=True).data)
+                )
+                self.stdout.write(f"Snapshot build for {len(snapshot)} flights (once per ingest): {build_time * 1000:.1f} ms")
+
+                for page_size in options['page_sizes']:
+                    serializer_time, serializer_body = best_of(
+                        options['repeat'],
+                        lambda: renderer.render(FlightDataSerializer(queryset[:page_size], many=True).data),
+                    )
+                    fragment_time, fragment_body = best_of(
+                        options['repeat'], lambda: b'[' + b','.join(snapshot.fragments[:page_size]) + b']'
+                    )
+                    compact_time, _ = best_of(
+                        options['repeat'], lambda: b'[' + b','.join(snapshot.compact_fragments[:page_size]) + b']'
+                    )
+                    if serializer_body != fragment_body:
+                        raise CommandError(f'Pre-rendered page differs from serializer output at page size {page_size}.')
+
+                    self.stdout.write(
+                        f"page {page_size:>5} | serializer: {serializer_time * 1000:8.2f} ms | "
+                        f"fragments: {fragment_time * 1000:7.3f} ms | compact: {compact_time * 1000:7.3f} ms | "
+                        f"speedup: {serializer_time / fragment_time:7.1f}x | bytes full/compact: "
+                        f"{len(fragment_body)}/{len(b','.join(snapshot.compact_fragments[:page_size])) + 2}"
+                    )
+        finally:
+            logging.disable(logging.NOTSET)
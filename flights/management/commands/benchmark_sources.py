@@ -0,0 +1,80 @@
+import io
+import json
+import logging
+from functools import partial
+from django.core.management.base import BaseCommand, CommandError
+from flights.benchmarking import best_of
+from flights.normalizer import SourceState
+from flights.services import STREAM_CHUNK_SIZE
+from flights.sharding import merge_states
+from flights.sources import get_parser
+from flights.synthetic import advance_states, generate_payload, render_dump1090, render_json_feed, render_sbs
+
+logger = logging.getLogger(__name__)
+
+# Parser -> función que genera su payload a partir de un payload de OpenSky
+RENDERERS = {
+    'opensky': lambda payload: json.dumps(payload).encode(),
+    'json': lambda payload: render_json_feed(payload['states']),
+    'dump1090': lambda payload: render_dump1090(payload['states']),
+    'sbs': lambda payload: render_sbs(payload['states']),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Throughput of each source parser (flights/sources.py) on synthetic feeds and cost of merging several '
+        'sources by last_contact, which must grow linearly with the fleet size.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Aircraft per feed.')
+        parser.add_argument('--parsers', nargs='+', choices=sorted(RENDERERS), default=sorted(RENDERERS))
+        parser.add_argument('--merge-sources', type=int, default=3, help='Overlapping sources in the merge benchmark.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best time is reported.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['merge_sources'] < 1 or min(options['sizes']) < 1:
+            raise CommandError('--sizes, --merge-sources and --repeat must be positive integers.')
+
+        logging.disable(logging.CRITICAL)
+        try:
+            self.stdout.write(f"{'parser':>9} | {'aircraft':>8} | {'MB':>6} | {'ms':>8} | {'states/s':>10} | {'MB/s':>6}")
+            for size in options['sizes']:
+                payload = generate_payload(size, seed=options['seed'], malformed_ratio=0, short_ratio=0)
+                for name in options['parsers']:
+                    self._parser_row(name, RENDERERS[name](payload), size, options['repeat'])
+
+            self.stdout.write(f"--- merge of {options['merge_sources']} overlapping sources ---")
+            self.stdout.write(f"{'aircraft':>8} | {'states in':>9} | {'ms':>8} | {'ns/state':>8} | kept")
+            for size in options['sizes']:
+                self._merge_row(size, options)
+        finally:
+            logging.disable(logging.NOTSET)
+
+    def _parser_row(self, name, body, size, repeat):
+        parser = get_parser(name)
+
+        def parse():
+            chunks = iter(partial(io.BytesIO(body).read, STREAM_CHUNK_SIZE), b'')
+            return list(parser.parse(chunks, name))
+
+        elapsed, states = best_of(repeat, parse)
+        if len(states) != size:
+            raise CommandError(f"Parser '{name}' returned {len(states)} states for {size} aircraft.")
+        megabytes = len(body) / 1e6
+        self.stdout.write(
+            f"{name:>9} | {size:>8} | {megabytes:6.1f} | {elapsed * 1000:8.1f} | {size / elapsed:10.0f} | {megabytes / elapsed:6.1f}"
+        )
+
+    def _merge_row(self, size, options):
+        # Todas las fuentes ven la flota completa; cada una con una fracción distinta más reciente
+        states = generate_payload(size, seed=options['seed'], malformed_ratio=0, short_ratio=0)['states']
+        sources = [
+            [SourceState(state, f"source-{index}") for state in advance_states(states, moved_ratio=0.3, seed=options['seed'] + index)]
+            for index in range(options['merge_sources'])
+        ]
+        elapsed, merged = best_of(options['repeat'], lambda: merge_states(sources))
+        total = size * len(sources)
+        self.stdout.write(f"{size:>8} | {total:>9} | {elapsed * 1000:8.2f} | {elapsed / total * 1e9:8.0f} | {len(merged)}")
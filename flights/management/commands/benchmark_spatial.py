@@ -0,0 +1,64 @@
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from flights.benchmarking import best_of, load_synthetic_flights, temporary_database
+from flights.models import FlightData
+from flights.services import FlightDataService
+from flights.spatial import filter_bbox, filter_near
+
+logger = logging.getLogger(__name__)
+
+# Zona de consulta fija (centro de México) para que el resultado sea comparable entre tamaños
+QUERY_BBOX = (-102.0, 17.0, -97.0, 22.0)
+QUERY_NEAR = (19.43, -99.13, 150.0)
+
+class Command(BaseCommand):
+    help = 'Benchmarks bbox/radius queries with the grid_cell index vs. a plain coordinate scan, on a temporary test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Number of flights per run.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query; the best time is reported.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be a positive integer.')
+
+        logging.disable(logging.CRITICAL)
+        try:
+            with temporary_database():
+                service = FlightDataService()
+                min_lon, min_lat, max_lon, max_lat = QUERY_BBOX
+                for size in options['sizes']:
+                    load_synthetic_flights(service, size, options['seed'])
+                    active = FlightData.objects.filter(expired_at__isnull=True)
+
+                    grid_query = lambda: list(filter_bbox(active, *QUERY_BBOX).values_list('id', flat=True))
+                    scan_query = lambda: list(
+                        active.filter(
+                            latitude__gte=min_lat, latitude__lte=max_lat,
+                            longitude__gte=min_lon, longitude__lte=max_lon,
+                        ).values_list('id', flat=True)
+                    )
+                    near_query = lambda: list(filter_near(active, *QUERY_NEAR).values_list('id', flat=True))
+
+                    grid_time, grid_rows = best_of(options['repeat'], grid_query)
+                    scan_time, scan_rows = best_of(options['repeat'], scan_query)
+                    near_time, near_rows = best_of(options['repeat'], near_query)
+                    if sorted(grid_rows) != sorted(scan_rows):
+                        raise CommandError(f'Grid bbox query returned different rows than the scan for {size} flights.')
+
+                    self.stdout.write(
+                        f"{size:>8} flights | bbox grid: {grid_time * 1000:7.2f} ms | "
+                        f"bbox scan: {scan_time * 1000:7.2f} ms | near grid: {near_time * 1000:7.2f} ms | "
+                        f"rows bbox/near: {len(grid_rows)}/{len(near_rows)}"
+                    )
+
+                with connection.cursor() as cursor:
+                    sql, params = filter_bbox(FlightData.objects.all(), *QUERY_BBOX).values('id').query.sql_with_params()
+                    cursor.execute(f'EXPLAIN {"QUERY PLAN " if connection.vendor == "sqlite" else ""}{sql}', params)
+                    self.stdout.write('Query plan (bbox grid):')
+                    for row in cursor.fetchall():
+                        self.stdout.write(f'  {row[-1]}')
+        finally:
+            logging.disable(logging.NOTSET)
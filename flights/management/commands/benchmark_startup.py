@@ -0,0 +1,181 @@
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PROFILES = ('tracker_project.settings', 'tracker_project.settings_lean')
+
+# Cada escenario se ejecuta en un intérprete nuevo: es el arranque en frío de ese tipo de proceso
+_PRELUDE = '''
+import json, sys, time
+started = time.perf_counter()
+import django
+'''
+_REPORT = '''
+elapsed = time.perf_counter() - started
+rss_kb = None
+try:
+    with open('/proc/self/status') as status:
+        rss_kb = next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+except (OSError, StopIteration):
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': elapsed, 'rss_kb': rss_kb, 'modules': len(sys.modules)}))
+'''
+SCENARIOS = {
+    # Lo que hace cualquier manage.py antes de ejecutar el comando
+    'django.setup': 'django.setup()',
+    # Un worker de gunicorn: aplicación WSGI y urlconf (vistas, DRF) cargadas
+    'wsgi app': (
+        'import tracker_project.wsgi\n'
+        'from django.urls import get_resolver\n'
+        'get_resolver().url_patterns'
+    ),
+    # run_ingest_worker hasta su primer ciclo (la sesión HTTP se crea con la primera petición)
+    'ingest worker': (
+        'django.setup()\n'
+        "from django.core.management import load_command_class\n"
+        "load_command_class('flights', 'run_ingest_worker')\n"
+        'from flights.services import FlightDataService\n'
+        'FlightDataService()'
+    ),
+    'import services': 'django.setup()\nimport flights.services',
+}
+
+
+def _rss_kb(pid):
+    with open(f'/proc/{pid}/status') as status:
+        return next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+
+
+def _children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as children:
+        return [int(child) for child in children.read().split()]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Cold-start cost of each settings profile (tracker_project.settings and the minimal-apps '
+        'tracker_project.settings_lean): wall time, RSS and loaded modules of fresh processes, and optionally '
+        'boot time and per-worker RSS under gunicorn.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', default=list(PROFILES), help='Settings modules to compare.')
+        parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+        parser.add_argument('--repeat', type=int, default=5, help='Fresh processes per measurement; the median is reported.')
+        parser.add_argument('--gunicorn', action='store_true', help='Also boot gunicorn with each profile and read worker RSS.')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn workers.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['workers'] < 1:
+            raise CommandError('--repeat and --workers must be positive integers.')
+
+        env = {**os.environ, 'ALLOWED_HOST_FQDN': '127.0.0.1', 'DJANGO_DEBUG': 'False'}
+        baseline = self._run('', env, options['repeat'])
+        self.stdout.write(
+            f"Bare interpreter: {baseline['wall_ms']:.0f} ms, {baseline['rss_kb'] / 1024:.1f} MB RSS, "
+            f"{baseline['modules']} modules (included in every row below)."
+        )
+        self.stdout.write(f"{'scenario':>16} | {'profile':>30} | {'wall ms':>7} | {'in-process ms':>13} | {'RSS MB':>6} | modules")
+        for scenario in options['scenarios']:
+            for profile in options['profiles']:
+                result = self._run(SCENARIOS[scenario], {**env, 'DJANGO_SETTINGS_MODULE': profile}, options['repeat'])
+                self.stdout.write(
+                    f"{scenario:>16} | {profile:>30} | {result['wall_ms']:7.0f} | {result['seconds'] * 1000:13.1f} | "
+                    f"{result['rss_kb'] / 1024:6.1f} | {result['modules']}"
+                )
+
+        if options['gunicorn']:
+            self._gunicorn(env, options)
+
+    def _run(self, code, env, repeat):
+        # Mediana de ``repeat`` procesos nuevos; el tiempo de pared incluye el arranque del intérprete
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, '-c', _PRELUDE + code + _REPORT],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            wall = time.perf_counter() - started
+            if completed.returncode != 0:
+                raise CommandError(f"Startup scenario failed:\n{completed.stderr[-2000:]}")
+            runs.append({**json.loads(completed.stdout.strip().splitlines()[-1]), 'wall_ms': wall * 1000})
+        return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+    def _gunicorn(self, env, options):
+        self.stdout.write(f"--- gunicorn, {options['workers']} sync workers (empty database) ---")
+        self.stdout.write(f"{'profile':>30} | {'boot ms':>7} | {'master MB':>9} | {'worker MB':>9}")
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**env, 'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'startup.sqlite3')}"}
+            # Las migraciones siempre con el perfil completo (ver settings_lean.py)
+            completed = subprocess.run(
+                [sys.executable, 'manage.py', 'migrate', '--noinput'],
+                cwd=settings.BASE_DIR, env={**env, 'DJANGO_SETTINGS_MODULE': PROFILES[0]}, capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                raise CommandError(f"manage.py migrate failed:\n{completed.stderr[-2000:]}")
+            for profile in options['profiles']:
+                boot, master, workers = self._gunicorn_run({**env, 'DJANGO_SETTINGS_MODULE': profile}, options['workers'])
+                self.stdout.write(
+                    f"{profile:>30} | {boot * 1000:7.0f} | {master / 1024:9.1f} | {statistics.mean(workers) / 1024:9.1f}"
+                )
+
+    def _gunicorn_run(self, env, workers):
+        port = _free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'tracker_project.wsgi', '--workers', str(workers),
+             '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self._wait_ready(port, process)
+            boot = time.perf_counter() - started
+            # Unas peticiones más para que cada worker haya atendido alguna
+            for _ in range(workers * 4):
+                self._get(port)
+            try:
+                return boot, _rss_kb(process.pid), [_rss_kb(child) for child in _children(process.pid)]
+            except (OSError, StopIteration):
+                raise CommandError('Worker RSS needs /proc (Linux).')
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    def _get(self, port):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            connection.request('GET', '/api/flightdata/', headers={'Host': '127.0.0.1'})
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def _wait_ready(self, port, process, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError('gunicorn exited during startup.')
+            try:
+                if self._get(port) == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.05)
+        raise CommandError(f'gunicorn did not answer on port {port} within {timeout} s.')
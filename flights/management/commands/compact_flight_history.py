@@ -0,0 +1,38 @@
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from flights.services import FlightHistoryService
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Deletes expired position history and downsamples old tracks in FlightPosition'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=7, help='Positions older than this are deleted (default: 7).')
+        parser.add_argument('--downsample-after-hours', type=int, default=24, help='Positions older than this are downsampled (default: 24).')
+        parser.add_argument('--interval', type=int, default=300, help='Seconds between kept positions when downsampling (default: 300).')
+
+    def handle(self, *args, **options):
+        if options['retention_days'] < 1 or options['downsample_after_hours'] < 1 or options['interval'] < 1:
+            raise CommandError('--retention-days, --downsample-after-hours and --interval must be positive integers.')
+
+        self.stdout.write(self.style.SUCCESS('Starting flight history compaction...'))
+        logger.info("Management command 'compact_flight_history' initiated.")
+
+        result = FlightHistoryService().compact(
+            retention_days=options['retention_days'],
+            downsample_after_hours=options['downsample_after_hours'],
+            interval_seconds=options['interval'],
+        )
+
+        if result.get('success'):
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"History compaction finished. Deleted: {result['deleted']}. "
+                    f"Downsampled: {result['downsampled']} positions in {result['buckets']} buckets."
+                )
+            )
+        else:
+            error_message = result.get('message', 'Unknown error occurred in service.')
+            self.stderr.write(self.style.ERROR(f"Error during history compaction: {error_message}"))
+            logger.error(f"History compaction failed: {error_message}")
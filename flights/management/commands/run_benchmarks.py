@@ -0,0 +1,220 @@
+import json
+import logging
+import random
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from flights.benchmarking import StubOpenSkyServer, environment_info, latency_summary, temporary_database
+from flights.models import FleetAggregate, FlightData, FlightPosition, FlightRawData, IngestCycle, IngestState
+from flights.services import FlightDataService
+from flights.synthetic import advance_states, generate_payload
+
+logger = logging.getLogger(__name__)
+
+RESULTS_SCHEMA = 1
+SUITES = ('ingest', 'api')
+
+# Nombre -> ruta del listado (o de otra vista sin pk); el detalle se mide aparte con pks aleatorios
+LIST_ENDPOINTS = {
+    'list': '/api/flightdata/',
+    'list_keyset_100': '/api/flightdata/?pagination=keyset&page_size=100',
+    'list_compact_bbox': '/api/flightdata/?compact=1&bbox=-10,35,30,60',
+    'list_binary': '/api/flightdata/?format=bin',
+    'stats': '/api/flightdata/stats/',
+    'stats_bbox_cells': '/api/flightdata/stats/?bbox=-10,35,30,60&by=cell',
+}
+
+# Métrica que se compara con --compare en cada suite (más bajo es mejor)
+COMPARED_METRIC = {'ingest': 'seconds', 'api': 'p50_ms'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Reproducible benchmark suite on synthetic OpenSky payloads: update_database_from_api end-to-end against '
+        'a local stub server and list/retrieve latency through the full Django stack. Runs on the configured '
+        'database engine (set DATABASE_URL for Postgres) inside a temporary test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Aircraft per payload.')
+        parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+        parser.add_argument('--requests', type=int, default=200, help='Requests per API endpoint.')
+        parser.add_argument('--malformed-ratio', type=float, default=0.01, help='Fraction of malformed states.')
+        parser.add_argument('--moved-ratio', type=float, default=0.3, help='Fraction of aircraft moved in the update cycle.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, metavar='PATH', help='Write the results as JSON to PATH.')
+        parser.add_argument('--compare', default=None, metavar='PATH', help='Compare with a previous --output file.')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Relative slowdown reported as a regression with --compare (default: 0.2 = 20%%).',
+        )
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error if --compare finds regressions.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or min(options['sizes']) < 1:
+            raise CommandError('--sizes and --requests must be positive integers.')
+        if not 0 <= options['malformed_ratio'] < 1 or not 0 <= options['moved_ratio'] <= 1:
+            raise CommandError('--malformed-ratio must be in [0, 1) and --moved-ratio in [0, 1].')
+        baseline = self._load_results(options['compare']) if options['compare'] else None
+
+        results = []
+        logging.disable(logging.CRITICAL)
+        try:
+            with temporary_database():
+                environment = environment_info()
+                self.stdout.write(
+                    f"Database: {environment['database']}, commit {environment['git_commit'] or 'unknown'}, "
+                    f"Python {environment['python']}, Django {environment['django']}"
+                )
+                for size in options['sizes']:
+                    results.extend(self._run_size(size, options))
+        finally:
+            logging.disable(logging.NOTSET)
+
+        document = {
+            'schema': RESULTS_SCHEMA,
+            'created_at': datetime.now(dt_timezone.utc).isoformat(),
+            'environment': environment,
+            'options': {name: options[name] for name in ('sizes', 'suites', 'requests', 'malformed_ratio', 'moved_ratio', 'seed')},
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(document, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        if baseline is not None:
+            regressions = self._compare(baseline, document, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{regressions} benchmarks regressed by more than {options['threshold']:.0%}.")
+
+    def _load_results(self, path):
+        try:
+            with open(path) as source:
+                document = json.load(source)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read benchmark results from {path}: {e}")
+        if document.get('schema') != RESULTS_SCHEMA:
+            raise CommandError(f"{path} has results schema {document.get('schema')}, expected {RESULTS_SCHEMA}.")
+        return document
+
+    def _reset(self):
+        # Cada tamaño empieza con la base vacía; la versión de ingesta sigue creciendo
+        # para que la caché de snapshot del proceso no sirva datos de otro tamaño
+        FlightData.objects.all().delete()
+        FlightRawData.objects.all().delete()
+        FlightPosition.objects.all().delete()
+        IngestCycle.objects.all().delete()
+        FleetAggregate.objects.all().delete()
+        IngestState.save_source_fingerprint('', '', '')
+        IngestState.bump()
+
+    def _run_size(self, size, options):
+        self.stdout.write(f"--- {size} aircraft ---")
+        self._reset()
+        payload = generate_payload(size, seed=options['seed'], malformed_ratio=options['malformed_ratio'])
+        results = []
+        with StubOpenSkyServer(json.dumps(payload).encode()) as server:
+            service = FlightDataService()
+            service.api_url = server.url
+            if 'ingest' in options['suites']:
+                results.extend(self._ingest_suite(service, server, payload, size, options))
+            else:
+                service.update_database_from_api()
+        if 'api' in options['suites']:
+            results.extend(self._api_suite(size, options))
+        return results
+
+    def _ingest_cycle(self, service, name, size):
+        started = time.perf_counter()
+        result = service.update_database_from_api()
+        elapsed = time.perf_counter() - started
+        if not result['success']:
+            raise CommandError(f"Ingest cycle '{name}' failed for {size} aircraft: {result['message']}")
+        metrics = result.get('metrics', {})
+        entry = {
+            'suite': 'ingest', 'name': name, 'flights': size, 'seconds': elapsed,
+            'stages': metrics.get('stages', {}),
+            'peak_rss_bytes': metrics.get('peak_rss_bytes'),
+            'payload_bytes': result.get('payload_bytes', 0),
+            'rows': {key: result.get(key, 0) for key in ('total_from_api', 'processed', 'rejected', 'created', 'updated', 'unchanged', 'expired')},
+            'skipped': bool(result.get('skipped')),
+        }
+        rows = entry['rows']
+        self.stdout.write(
+            f"ingest {name:>9} | {elapsed * 1000:9.1f} ms | created {rows['created']}, updated {rows['updated']}, "
+            f"unchanged {rows['unchanged']}, rejected {rows['rejected']}{' (skipped)' if entry['skipped'] else ''}"
+        )
+        return entry
+
+    def _ingest_suite(self, service, server, payload, size, options):
+        # Carga inicial, ciclo con una parte de la flota movida y el mismo payload repetido
+        results = [self._ingest_cycle(service, 'initial', size)]
+        payload = {**payload, 'states': advance_states(payload['states'], moved_ratio=options['moved_ratio'], seed=options['seed'])}
+        server.payload = json.dumps(payload).encode()
+        results.append(self._ingest_cycle(service, 'update', size))
+        results.append(self._ingest_cycle(service, 'unchanged', size))
+        return results
+
+    def _measure_requests(self, client, paths):
+        times = []
+        for path in paths:
+            started = time.perf_counter()
+            response = client.get(path)
+            times.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(f"GET {path} returned {response.status_code}.")
+        return times
+
+    def _api_suite(self, size, options):
+        rng = random.Random(options['seed'])
+        pks = list(FlightData.objects.filter(expired_at__isnull=True).values_list('pk', flat=True))
+        if not pks:
+            raise CommandError(f"No active flights after loading {size} aircraft.")
+        client = Client()
+        results = []
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            # La primera petición tras una ingesta construye el snapshot de esa versión
+            cold = self._measure_requests(client, [LIST_ENDPOINTS['list']])[0]
+            results.append({'suite': 'api', 'name': 'list_cold', 'flights': size, **latency_summary([cold])})
+            endpoints = {name: [path] * options['requests'] for name, path in LIST_ENDPOINTS.items()}
+            endpoints['retrieve'] = [f'/api/flightdata/{rng.choice(pks)}/' for _ in range(options['requests'])]
+            endpoints['retrieve_compact'] = [f'/api/flightdata/{rng.choice(pks)}/?compact=1' for _ in range(options['requests'])]
+            for name, paths in endpoints.items():
+                self._measure_requests(client, paths[:5]) # calentamiento
+                results.append({'suite': 'api', 'name': name, 'flights': size, **latency_summary(self._measure_requests(client, paths))})
+
+        for entry in results:
+            self.stdout.write(
+                f"api {entry['name']:>17} | p50 {entry['p50_ms']:8.2f} ms | p95 {entry['p95_ms']:8.2f} ms | "
+                f"{entry['rps'] or 0:8.0f} req/s"
+            )
+        return results
+
+    def _compare(self, baseline, document, threshold):
+        old_env, new_env = baseline['environment'], document['environment']
+        self.stdout.write(
+            f"--- compared with {old_env.get('git_commit') or 'unknown'} ({old_env.get('database')}) ---"
+        )
+        if old_env.get('database') != new_env['database'] or old_env.get('machine') != new_env['machine']:
+            self.stderr.write(self.style.WARNING('Baseline ran on a different database or machine; ratios are only indicative.'))
+
+        previous = {(entry['suite'], entry['name'], entry['flights']): entry for entry in baseline['results']}
+        regressions = 0
+        for entry in document['results']:
+            old = previous.get((entry['suite'], entry['name'], entry['flights']))
+            metric = COMPARED_METRIC[entry['suite']]
+            if not old or not old.get(metric):
+                continue
+            ratio = entry[metric] / old[metric]
+            line = f"{entry['suite']:>6} {entry['name']:>17} {entry['flights']:>7} | {metric} {old[metric]:10.2f} -> {entry[metric]:10.2f} ({ratio:5.2f}x)"
+            if ratio > 1 + threshold:
+                regressions += 1
+                self.stderr.write(self.style.ERROR(f"{line} REGRESSION"))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            self.stderr.write(self.style.ERROR(f"{regressions} regressions above {threshold:.0%}."))
+        else:
+            self.stdout.write(self.style.SUCCESS('No regressions.'))
+        return regressions
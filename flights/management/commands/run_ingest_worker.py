@@ -0,0 +1,86 @@
+import logging
+import os
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from flights.services import INGEST_MODES, INGEST_MODE_UPSERT, UPSERT_BATCH_SIZE
+from flights.sources import build_sources
+from flights.worker import DEFAULT_MAX_BACKOFF, DEFAULT_POLL_INTERVAL, IngestWorker
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Runs a long-lived ingestion loop (replaces cron + update_flight_data) with a pooled HTTP session, conditional requests and backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=None,
+            help=f'Seconds between cycles (default: $INGEST_POLL_INTERVAL or {DEFAULT_POLL_INTERVAL}).',
+        )
+        parser.add_argument('--max-backoff', type=float, default=DEFAULT_MAX_BACKOFF, help=f'Upper bound for the retry delay after failures (default: {DEFAULT_MAX_BACKOFF}).')
+        parser.add_argument('--mode', choices=INGEST_MODES, default=INGEST_MODE_UPSERT)
+        parser.add_argument('--batch-size', type=int, default=UPSERT_BATCH_SIZE)
+        parser.add_argument('--sources', action='store_true', help='Ingest every source in FLIGHTS_INGEST_SOURCES each cycle instead of EXTERNAL_API_URL alone.')
+        parser.add_argument('--max-cycles', type=int, default=None, help='Stop after this many cycles (default: run until SIGTERM/SIGINT).')
+
+    def _report(self, result):
+        if result.get('skipped'):
+            self.stdout.write(f"Cycle skipped: {result.get('message')} ({result['duration']:.2f}s)")
+        elif result.get('success'):
+            self.stdout.write(self.style.SUCCESS(
+                f"Cycle finished in {result['duration']:.2f}s. Processed: {result.get('processed', 0)}. "
+                f"Created: {result.get('created', 0)}. Updated: {result.get('updated', 0)}. "
+                f"Unchanged: {result.get('unchanged', 0)}. Expired: {result.get('expired', 0)}."
+            ))
+        else:
+            self.stderr.write(self.style.ERROR(f"Cycle failed: {result.get('message')}"))
+
+    def _interval(self, options):
+        # La variable de entorno se lee aquí y no en add_arguments: un valor inválido no rompe `manage.py help`
+        if options['interval'] is not None:
+            return options['interval']
+        value = os.environ.get('INGEST_POLL_INTERVAL')
+        if not value:
+            return DEFAULT_POLL_INTERVAL
+        try:
+            return float(value)
+        except ValueError:
+            raise CommandError(f"INGEST_POLL_INTERVAL must be a number of seconds, got {value!r}.")
+
+    def handle(self, *args, **options):
+        options['interval'] = self._interval(options)
+        if not options['interval'] > 0 or not options['max_backoff'] > 0:
+            raise CommandError('--interval and --max-backoff must be positive.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive integer.')
+
+        sources = None
+        if options['sources']:
+            try:
+                sources = build_sources(settings.FLIGHTS_INGEST_SOURCES)
+            except ValueError as e:
+                raise CommandError(f"Invalid FLIGHTS_INGEST_SOURCES: {e}")
+            if not sources:
+                raise CommandError('--sources needs FLIGHTS_INGEST_SOURCES to list at least one source.')
+
+        worker = IngestWorker(
+            interval=options['interval'],
+            max_backoff=options['max_backoff'],
+            mode=options['mode'],
+            batch_size=options['batch_size'],
+            on_cycle=self._report,
+            sources=sources,
+        )
+
+        def request_stop(signum, frame):
+            logger.info(f"Received signal {signum}; stopping after the current cycle.")
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.stdout.write(self.style.SUCCESS(f"Starting ingest worker (interval: {options['interval']}s)..."))
+        worker.run(max_cycles=options['max_cycles'])
+        self.stdout.write(self.style.SUCCESS('Ingest worker finished.'))
@@ -1,39 +1,255 @@
+import cProfile
+import io
 import logging
-from django.core.management.base import BaseCommand
-from flights.services import FlightDataService
+import pstats
+import tracemalloc
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from flights.services import (
+    DEFAULT_TILE_WORKERS, FlightDataService, HTTP_POOL_SIZE, INGEST_MODES, INGEST_MODE_UPSERT, UPSERT_BATCH_SIZE,
+    build_http_session,
+)
+from flights.metrics import format_stages
+from flights.sharding import build_tiles
+from flights.sources import PARSERS, build_sources, load_source_configs
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PROFILE_PATH = 'update_flight_data.prof'
+PROFILE_TOP = 25
+
 class Command(BaseCommand):
     help = 'Fetches flight data from external API and updates the database using FlightDataService'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=INGEST_MODES,
+            default=INGEST_MODE_UPSERT,
+            help="'upsert' (default) writes only changed rows and expires missing flights; 'replace' deletes and reloads everything.",
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Maximum number of API items to process (default: the whole snapshot).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=UPSERT_BATCH_SIZE,
+            help=f'Items normalized and written per batch; the whole cycle commits once (default: {UPSERT_BATCH_SIZE}).',
+        )
+        parser.add_argument(
+            '--tiles',
+            default=None,
+            metavar='LATxLON',
+            help='Fetch the world as LATxLON bounding-box tiles in parallel (e.g. 3x4) instead of one request.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DEFAULT_TILE_WORKERS,
+            help=f'Concurrent tile requests with --tiles, or sources read at once with --sources (default: {DEFAULT_TILE_WORKERS}).',
+        )
+        parser.add_argument(
+            '--sources',
+            action='store_true',
+            help='Read every source in FLIGHTS_INGEST_SOURCES concurrently and merge them by last_contact.',
+        )
+        parser.add_argument(
+            '--source',
+            action='append',
+            default=[],
+            metavar='[NAME=]PARSER[:URL|PATH]',
+            help=f"Add a source for this run (repeatable), e.g. radar=sbs:/var/lib/sbs.csv. Parsers: {', '.join(sorted(PARSERS))}.",
+        )
+        parser.add_argument(
+            '--profile',
+            nargs='?',
+            const=DEFAULT_PROFILE_PATH,
+            default=None,
+            metavar='PATH',
+            help=f'Run the cycle under cProfile, save the stats to PATH (default: {DEFAULT_PROFILE_PATH}) and print the top {PROFILE_TOP} functions.',
+        )
+        parser.add_argument(
+            '--trace-memory',
+            action='store_true',
+            help='Trace Python allocations with tracemalloc and report the peak (slows the cycle down).',
+        )
+
+    def _parse_tiles(self, value):
+        try:
+            lat_divisions, lon_divisions = (int(part) for part in value.lower().split('x'))
+            return build_tiles(lat_divisions, lon_divisions)
+        except ValueError:
+            raise CommandError(f"--tiles must look like LATxLON with positive integers (got '{value}').")
+
+    def _parse_source(self, value):
+        # [NAME=]PARSER[:URL|PATH]; sin ubicación la fuente usa EXTERNAL_API_URL
+        name, separator, spec = value.partition('=')
+        if not separator or ':' in name:
+            # El '=' es de la URL (query string), no del nombre
+            name, spec = '', value
+        parser, _, location = spec.partition(':')
+        config = {'parser': parser}
+        if name:
+            config['name'] = name
+        if location.startswith(('http://', 'https://')):
+            config['url'] = location
+        elif location:
+            config['path'] = location
+        return config
+
+    def _build_sources(self, options):
+        configs = []
+        if options['sources']:
+            try:
+                configs = load_source_configs(settings.FLIGHTS_INGEST_SOURCES)
+            except ValueError as e:
+                raise CommandError(f"Invalid FLIGHTS_INGEST_SOURCES: {e}")
+        configs.extend(self._parse_source(value) for value in options['source'])
+        if not configs:
+            raise CommandError('--sources needs FLIGHTS_INGEST_SOURCES to list at least one source.')
+        try:
+            return build_sources(configs)
+        except ValueError as e:
+            raise CommandError(f"Invalid source configuration: {e}")
+
+    def _report_sources(self, sources):
+        for source in sources:
+            line = (
+                f"  Source {source['source']} ({source['parser']}): {source['latency'] * 1000:.0f} ms, "
+                f"{source['rows']} rows, {source['bytes']} bytes, {source['merged']} kept after merge"
+            )
+            if source['success']:
+                self.stdout.write(line)
+            else:
+                self.stderr.write(self.style.WARNING(f"{line} - FAILED ({source['error']}); its flights were not expired"))
+
+    def _report_tiles(self, tiles):
+        for tile in tiles:
+            line = f"  Tile {tile['tile']}: {tile['latency'] * 1000:.0f} ms, {tile['rows']} rows, {tile['bytes']} bytes"
+            if tile['success']:
+                self.stdout.write(line)
+            else:
+                self.stderr.write(self.style.WARNING(f"{line} - FAILED ({tile['error']}); region left stale"))
+
+    def _run(self, update, options):
+        # Ejecuta el ciclo, opcionalmente bajo cProfile y/o tracemalloc
+        if options['trace_memory']:
+            tracemalloc.start()
+        try:
+            if not options['profile']:
+                return update()
+            profiler = cProfile.Profile()
+            result = profiler.runcall(update)
+        finally:
+            if options['trace_memory']:
+                tracemalloc.stop()
+        profiler.dump_stats(options['profile'])
+        self.stdout.write(f"Profile saved to {options['profile']}. Top {PROFILE_TOP} functions by cumulative time:")
+        # OutputWrapper añade un salto de línea en cada write(): se pasa el informe de una vez
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).strip_dirs().sort_stats('cumulative').print_stats(PROFILE_TOP)
+        self.stdout.write(report.getvalue())
+        return result
+
+    def _report_metrics(self, metrics):
+        line = (
+            f"Cycle took {metrics['duration'] * 1000:.0f} ms. Stages: {format_stages(metrics['stages'])}. "
+            f"Peak RSS: {metrics['peak_rss_bytes'] / 1e6:.1f} MB"
+        )
+        if 'peak_traced_bytes' in metrics:
+            line += f", peak traced Python memory: {metrics['peak_traced_bytes'] / 1e6:.1f} MB"
+        self.stdout.write(f"{line}.")
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting flight data update via service...'))
         logger.info("Management command 'update_flight_data' initiated.")
 
-        service = FlightDataService()
-        result = service.update_database_from_api()
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive integer.')
+        if options['limit'] is not None and options['limit'] < 0:
+            raise CommandError('--limit must not be negative.')
 
-        if result.get('success'):
+        if options['sources'] or options['source']:
+            if options['tiles'] or options['limit'] is not None:
+                raise CommandError('--sources/--source cannot be combined with --tiles or --limit.')
+            if options['workers'] < 1:
+                raise CommandError('--workers must be a positive integer.')
+            sources = self._build_sources(options)
+            service = FlightDataService(session=build_http_session(pool_size=max(HTTP_POOL_SIZE, options['workers'])))
+            result = self._run(lambda: service.update_database_from_sources(
+                sources,
+                mode=options['mode'],
+                batch_size=options['batch_size'],
+                max_workers=options['workers'],
+            ), options)
+            self._report_sources(result.get('sources', []))
+        elif options['tiles']:
+            tiles = self._parse_tiles(options['tiles'])
+            if options['limit'] is not None:
+                raise CommandError('--limit cannot be combined with --tiles.')
+            if options['workers'] < 1:
+                raise CommandError('--workers must be a positive integer.')
+            service = FlightDataService(session=build_http_session(pool_size=max(HTTP_POOL_SIZE, options['workers'])))
+            result = self._run(lambda: service.update_database_from_tiles(
+                tiles,
+                mode=options['mode'],
+                batch_size=options['batch_size'],
+                max_workers=options['workers'],
+            ), options)
+            self._report_tiles(result.get('tiles', []))
+        else:
+            service = FlightDataService()
+            result = self._run(lambda: service.update_database_from_api(
+                mode=options['mode'],
+                limit=options['limit'],
+                batch_size=options['batch_size'],
+            ), options)
+
+        if result.get('skipped'):
+            self.stdout.write(self.style.SUCCESS(f"Flight data update skipped: {result.get('message')}"))
+            logger.info(f"Service execution skipped: {result.get('message')}")
+        elif result.get('success'):
             total_api = result.get('total_from_api', 'N/A')
             processed = result.get('processed', 0)
             created = result.get('created', 0)
             updated = result.get('updated', 0)
+            unchanged = result.get('unchanged', 0)
+            expired = result.get('expired', 0)
+            deleted = result.get('deleted', 0)
+            batches = result.get('batches', 0)
 
             self.stdout.write(
                 self.style.SUCCESS(
                     f"Flight data update process finished. "
-                    f"Total from API: {total_api}. Processed (limit applied): {processed}. "
-                    f"Created: {created}. Updated: {updated}."
+                    f"Total from API: {total_api}. Processed (limit applied): {processed} in {batches} batches. "
+                    f"Created: {created}. Updated: {updated}. Unchanged: {unchanged}. "
+                    f"Expired: {expired}. Deleted: {deleted}."
                 )
             )
+            if 'stale_tiles' in result:
+                self.stdout.write(
+                    f"Duplicates across tiles: {result.get('duplicates', 0)}. "
+                    f"Stale tiles: {', '.join(result['stale_tiles']) or 'none'}."
+                )
+            if 'stale_sources' in result:
+                self.stdout.write(
+                    f"Aircraft seen by more than one source: {result.get('duplicates', 0)}. "
+                    f"Failed sources: {', '.join(result['stale_sources']) or 'none'}."
+                )
             logger.info(
                 f"Service execution successful: {result.get('message')} - "
-                f"Total API: {total_api}, Processed: {processed}, Created: {created}, Updated: {updated}"
+                f"Total API: {total_api}, Processed: {processed}, Created: {created}, Updated: {updated}, "
+                f"Unchanged: {unchanged}, Expired: {expired}, Deleted: {deleted}"
             )
         else:
             error_message = result.get('message', 'Unknown error occurred in service.')
             self.stderr.write(self.style.ERROR(f"Error during flight data update: {error_message}"))
             logger.error(f"Service execution failed: {error_message}")
 
-        self.stdout.write(self.style.SUCCESS('Flight data update command finished.'))
\ No newline at end of file
+        if 'metrics' in result:
+            self._report_metrics(result['metrics'])
+        self.stdout.write(self.style.SUCCESS('Flight data update command finished.'))
@@ -0,0 +1,178 @@
+# flights/metrics.py
+# Métricas de cada ciclo de ingesta (tiempo por etapa, filas, rechazos, bytes,
+# memoria) y su exposición en formato de texto de Prometheus.
+
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# Orden en el que se muestran las etapas
+STAGES = ('fetch', 'decode', 'normalize', 'aggregate', 'delete', 'upsert', 'history', 'expire', 'commit')
+COUNT_FIELDS = ('total_from_api', 'processed', 'created', 'updated', 'unchanged', 'expired', 'deleted', 'rejected', 'positions', 'batches')
+SUMMARY_QUANTILES = (0.5, 0.95)
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def current_rss_bytes():
+    # RSS actual en Linux; en otros sistemas, el máximo del proceso (ru_maxrss, en KiB en Linux y bytes en macOS)
+    if _PAGE_SIZE:
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * _PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            pass
+    if resource is None:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class CycleMetrics:
+    """
+    Cronómetro de un ciclo. ``stage(nombre)`` acumula el tiempo propio de la
+    etapa: si hay etapas anidadas, su tiempo se descuenta de la que las contiene,
+    así que la suma de etapas no cuenta nada dos veces. La memoria se muestrea al
+    cerrar cada etapa (RSS) y, si tracemalloc está activo, se guarda además el
+    pico de memoria Python del ciclo.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.stages = {}
+        self._stack = []
+        self.peak_rss_bytes = current_rss_bytes()
+        self._tracing = tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name):
+        frame = [time.perf_counter(), 0.0] # inicio, tiempo de las etapas anidadas
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - frame[1]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+            self.peak_rss_bytes = max(self.peak_rss_bytes, current_rss_bytes())
+
+    def finish(self):
+        metrics = {
+            'started_at': self.started_at,
+            'duration': time.perf_counter() - self._started,
+            'stages': {name: self.stages[name] for name in sorted(self.stages, key=_stage_order)},
+            'peak_rss_bytes': self.peak_rss_bytes,
+        }
+        if self._tracing:
+            metrics['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+        return metrics
+
+
+def _stage_order(name):
+    return (STAGES.index(name), name) if name in STAGES else (len(STAGES), name)
+
+
+def format_stages(stages):
+    return ', '.join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in stages.items()) or 'none'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class PrometheusText:
+    """Acumula métricas y las devuelve en el formato de texto de Prometheus (0.0.4)."""
+
+    def __init__(self):
+        self._lines = []
+
+    def metric(self, name, kind, help_text, samples):
+        # samples: lista de (labels dict, valor)
+        self._lines.append(f'# HELP {name} {help_text}')
+        self._lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            self.sample(name, labels, value)
+
+    def sample(self, name, labels, value):
+        label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+        self._lines.append(f"{name}{{{label_text}}} {float(value)!r}" if label_text else f"{name} {float(value)!r}")
+
+    def render(self):
+        return '\n'.join(self._lines) + '\n'
+
+
+def render_prometheus(cycles, ingest_version, snapshot_stats=None):
+    """
+    ``cycles``: IngestCycle del más reciente al más antiguo. El último ciclo se
+    expone como gauges; la ventana completa, como recuento por resultado y
+    resumen (cuantiles) del tiempo por etapa.
+    """
+    out = PrometheusText()
+    out.metric('flights_ingest_version', 'gauge', 'Current IngestState version.', [({}, ingest_version)])
+
+    outcomes = {'success': 0, 'failure': 0, 'skipped': 0}
+    for cycle in cycles:
+        outcomes[cycle.outcome] += 1
+    out.metric(
+        'flights_ingest_recent_cycles', 'gauge', 'Ingest cycles kept in the ring buffer, by outcome.',
+        [({'outcome': outcome}, count) for outcome, count in outcomes.items()],
+    )
+
+    if cycles:
+        last = cycles[0]
+        out.metric('flights_ingest_last_cycle_timestamp_seconds', 'gauge', 'Start time of the most recent ingest cycle.',
+                   [({}, last.started_at.timestamp())])
+        out.metric('flights_ingest_last_cycle_success', 'gauge', '1 if the most recent ingest cycle succeeded.',
+                   [({'source': last.source, 'mode': last.mode}, int(last.success))])
+        out.metric('flights_ingest_last_cycle_duration_seconds', 'gauge', 'Wall time of the most recent ingest cycle.',
+                   [({}, last.duration)])
+        out.metric('flights_ingest_last_cycle_stage_seconds', 'gauge', 'Time spent in each stage of the most recent ingest cycle.',
+                   [({'stage': stage}, seconds) for stage, seconds in last.stages.items()])
+        out.metric('flights_ingest_last_cycle_rows', 'gauge', 'Row counts of the most recent ingest cycle.',
+                   [({'kind': kind}, last.counts.get(kind, 0)) for kind in COUNT_FIELDS])
+        out.metric('flights_ingest_last_cycle_rejected_rows', 'gauge', 'Rejected states of the most recent ingest cycle, by reason.',
+                   [({'reason': reason}, count) for reason, count in sorted(last.reject_reasons.items())])
+        out.metric('flights_ingest_last_cycle_payload_bytes', 'gauge', 'Bytes downloaded in the most recent ingest cycle.',
+                   [({}, last.payload_bytes)])
+        out.metric('flights_ingest_last_cycle_peak_memory_bytes', 'gauge', 'Peak resident memory sampled during the most recent ingest cycle.',
+                   [({}, last.peak_memory_bytes)])
+
+        samples = []
+        stage_names = sorted({stage for cycle in cycles for stage in cycle.stages}, key=_stage_order)
+        for stage in stage_names:
+            values = [cycle.stages[stage] for cycle in cycles if stage in cycle.stages]
+            samples.extend(({'stage': stage, 'quantile': str(q)}, _quantile(values, q)) for q in SUMMARY_QUANTILES)
+        out.metric('flights_ingest_stage_seconds', 'summary', 'Stage time over the ingest cycles in the ring buffer.', samples)
+        for stage in stage_names:
+            # _sum y _count del resumen
+            out.sample('flights_ingest_stage_seconds_sum', {'stage': stage}, sum(cycle.stages.get(stage, 0.0) for cycle in cycles))
+            out.sample('flights_ingest_stage_seconds_count', {'stage': stage}, sum(1 for cycle in cycles if stage in cycle.stages))
+
+    if snapshot_stats is not None:
+        out.metric('flights_snapshot_cache_requests_total', 'counter', 'Snapshot cache lookups in this process, by result.',
+                   [({'result': 'hit'}, snapshot_stats['hits']), ({'result': 'miss'}, snapshot_stats['misses'])])
+        out.metric('flights_snapshot_cache_invalidations_total', 'counter', 'Snapshot cache invalidations in this process.',
+                   [({}, snapshot_stats['invalidations'])])
+        out.metric('flights_snapshot_rows', 'gauge', 'Rows in the snapshot held by this process.',
+                   [({}, snapshot_stats['snapshot_rows'])])
+    return out.render()
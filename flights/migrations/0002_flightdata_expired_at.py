@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flightdata',
+            name='expired_at',
+            field=models.DateTimeField(blank=True, help_text='Cuándo dejó de aparecer en la API (null = activo)', null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0002_flightdata_expired_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightPosition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flight_id', models.CharField(help_text='icao24 / flight_id de FlightData', max_length=100)),
+                ('bucket', models.IntegerField(help_text='Hora desde epoch (timestamp // HISTORY_BUCKET_SECONDS)')),
+                ('timestamp', models.DateTimeField()),
+                ('latitude_e5', models.IntegerField(help_text='Latitud * 1e5')),
+                ('longitude_e5', models.IntegerField(help_text='Longitud * 1e5')),
+                ('altitude_m', models.IntegerField(blank=True, help_text='Altitud en metros', null=True)),
+                ('speed_dms', models.PositiveSmallIntegerField(blank=True, help_text='Velocidad en décimas de m/s', null=True)),
+                ('heading_dd', models.PositiveSmallIntegerField(blank=True, help_text='Rumbo en décimas de grado', null=True)),
+            ],
+            options={
+                'verbose_name': 'Flight Position',
+                'verbose_name_plural': 'Flight Positions',
+                'ordering': ['timestamp'],
+                'indexes': [models.Index(fields=['flight_id', 'bucket', 'timestamp'], name='flightpos_flight_bucket_idx'), models.Index(fields=['bucket'], name='flightpos_bucket_idx')],
+            },
+        ),
+    ]
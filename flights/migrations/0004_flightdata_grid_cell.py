@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:00
+
+import math
+
+from django.db import migrations, models
+
+# Copia de flights.spatial.grid_cell_for en el momento de esta migración (rejilla de 1 grado):
+# una migración no debe depender del código actual
+GRID_CELL_DEGREES = 1.0
+GRID_ROWS = int(180 / GRID_CELL_DEGREES)
+GRID_COLUMNS = int(360 / GRID_CELL_DEGREES)
+
+
+def grid_cell_for(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        return None
+    row = min(max(int(math.floor((latitude + 90.0) / GRID_CELL_DEGREES)), 0), GRID_ROWS - 1)
+    column = min(max(int(math.floor((longitude + 180.0) / GRID_CELL_DEGREES)), 0), GRID_COLUMNS - 1)
+    return row * GRID_COLUMNS + column
+
+
+def backfill_grid_cell(apps, schema_editor):
+    FlightData = apps.get_model('flights', 'FlightData')
+    to_update = []
+    for flight in FlightData.objects.filter(grid_cell__isnull=True).only('id', 'latitude', 'longitude').iterator(chunk_size=1000):
+        flight.grid_cell = grid_cell_for(flight.latitude, flight.longitude)
+        if flight.grid_cell is not None:
+            to_update.append(flight)
+    FlightData.objects.bulk_update(to_update, ['grid_cell'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0003_flightposition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flightdata',
+            name='grid_cell',
+            field=models.IntegerField(blank=True, db_index=True, help_text='Celda de la rejilla espacial (ver flights/spatial.py)', null=True),
+        ),
+        migrations.RunPython(backfill_grid_cell, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0004_flightdata_grid_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Ingest State',
+                'verbose_name_plural': 'Ingest State',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0005_ingeststate'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='flightdata',
+            options={'ordering': ['-timestamp', '-id'], 'verbose_name': 'Flight Data', 'verbose_name_plural': 'Flight Data'},
+        ),
+        migrations.AddIndex(
+            model_name='flightdata',
+            index=models.Index(fields=['timestamp', 'id'], name='flightdata_timestamp_id_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0006_flightdata_timestamp_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingeststate',
+            name='payload_sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='ingeststate',
+            name='source_etag',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='ingeststate',
+            name='source_last_modified',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:18
+
+import json
+import zlib
+
+from django.db import migrations, models
+
+# Copia de flights.models.pack_raw_payload/unpack_raw_payload en el momento de esta
+# migración: una migración no debe depender del código actual
+OPENSKY_FIELD_NAMES = (
+    "icao24", "callsign", "origin_country", "time_position", "last_contact",
+    "longitude", "latitude", "baro_altitude", "on_ground", "velocity",
+    "true_track", "vertical_rate", "sensors", "geo_altitude", "squawk",
+    "spi", "position_source"
+)
+
+
+def pack_raw_payload(raw_data):
+    keys = list(raw_data)
+    if keys == list(OPENSKY_FIELD_NAMES[:len(keys)]):
+        raw_data = list(raw_data.values())
+    return zlib.compress(json.dumps(raw_data, separators=(',', ':')).encode('utf-8'))
+
+
+def unpack_raw_payload(payload):
+    value = json.loads(zlib.decompress(payload))
+    if isinstance(value, list):
+        return dict(zip(OPENSKY_FIELD_NAMES, value))
+    return value
+
+
+def move_raw_data(apps, schema_editor):
+    FlightData = apps.get_model('flights', 'FlightData')
+    FlightRawData = apps.get_model('flights', 'FlightRawData')
+    IngestState = apps.get_model('flights', 'IngestState')
+    version = IngestState.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+    rows = []
+    for flight_id, raw_data in FlightData.objects.filter(raw_data__isnull=False).values_list('flight_id', 'raw_data').iterator(chunk_size=1000):
+        rows.append(FlightRawData(flight_id=flight_id, ingest_version=version, payload=pack_raw_payload(raw_data)))
+        if len(rows) >= 1000:
+            FlightRawData.objects.bulk_create(rows)
+            rows = []
+    FlightRawData.objects.bulk_create(rows)
+
+
+def restore_raw_data(apps, schema_editor):
+    FlightData = apps.get_model('flights', 'FlightData')
+    FlightRawData = apps.get_model('flights', 'FlightRawData')
+    raw_by_id = {}
+    for flight_id, payload in FlightRawData.objects.values_list('flight_id', 'payload').iterator(chunk_size=1000):
+        raw_by_id[flight_id] = unpack_raw_payload(payload)
+    to_update = []
+    for flight in FlightData.objects.filter(flight_id__in=list(raw_by_id)).only('id', 'flight_id').iterator(chunk_size=1000):
+        flight.raw_data = raw_by_id[flight.flight_id]
+        to_update.append(flight)
+    FlightData.objects.bulk_update(to_update, ['raw_data'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0007_ingeststate_source_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightRawData',
+            fields=[
+                ('flight_id', models.CharField(help_text='flight_id de FlightData', max_length=100, primary_key=True, serialize=False)),
+                ('ingest_version', models.PositiveBigIntegerField(default=0, help_text='IngestState.version al escribirlo')),
+                ('payload', models.BinaryField(help_text='raw_data en JSON comprimido (ver pack_raw_payload)')),
+            ],
+            options={
+                'verbose_name': 'Flight Raw Data',
+                'verbose_name_plural': 'Flight Raw Data',
+            },
+        ),
+        migrations.RunPython(move_raw_data, restore_raw_data),
+        migrations.RemoveField(
+            model_name='flightdata',
+            name='raw_data',
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0008_flightrawdata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('source', models.CharField(help_text="'api' (una petición), 'tiles' o 'sources'", max_length=16)),
+                ('mode', models.CharField(max_length=16)),
+                ('success', models.BooleanField()),
+                ('skipped', models.BooleanField(default=False, help_text='Payload sin cambios (304 o mismo sha256)')),
+                ('duration', models.FloatField(help_text='Segundos')),
+                ('stages', models.JSONField(default=dict, help_text='Segundos por etapa')),
+                ('counts', models.JSONField(default=dict, help_text='created, updated, expired, rejected, ...')),
+                ('reject_reasons', models.JSONField(default=dict)),
+                ('payload_bytes', models.PositiveBigIntegerField(default=0)),
+                ('peak_memory_bytes', models.PositiveBigIntegerField(default=0)),
+                ('message', models.CharField(blank=True, default='', max_length=255)),
+            ],
+            options={
+                'verbose_name': 'Ingest Cycle',
+                'verbose_name_plural': 'Ingest Cycles',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
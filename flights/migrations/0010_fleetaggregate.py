@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0009_ingestcycle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('computed_at', models.DateTimeField()),
+                ('ingest_version', models.PositiveBigIntegerField(default=0, help_text='IngestState.version al escribirlo')),
+                ('flights', models.PositiveIntegerField(default=0)),
+                ('document', models.JSONField(default=dict, help_text='Totales y vectores de contadores por celda')),
+            ],
+            options={
+                'verbose_name': 'Fleet Aggregate',
+                'verbose_name_plural': 'Fleet Aggregates',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0010_fleetaggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flightdata',
+            name='raw_data_digest',
+            field=models.BigIntegerField(blank=True, help_text='Hash de raw_data (ver raw_payload_digest)', null=True),
+        ),
+    ]
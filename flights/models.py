@@ -1,4 +1,12 @@
+import hashlib
+import json
+import time
+import zlib
+from datetime import datetime, timezone as dt_timezone
 from django.db import models
+from django.utils import timezone
+from .metrics import COUNT_FIELDS
+from .normalizer import OPENSKY_FIELD_NAMES
 
 class FlightData(models.Model):
     flight_id = models.CharField(max_length=100, unique=True, help_text="Identificador único del vuelo/unidad")
@@ -8,8 +16,10 @@ class FlightData(models.Model):
     speed = models.FloatField(null=True, blank=True, help_text="Velocidad")
     heading = models.FloatField(null=True, blank=True, help_text="Rumbo en grados")
     timestamp = models.DateTimeField(help_text="Fecha y hora de la última actualización de esta posición")
-    raw_data = models.JSONField(null=True, blank=True, help_text="Datos crudos de la API para este vuelo")
     last_updated_by_system = models.DateTimeField(auto_now=True, help_text="Cuándo se actualizó este registro en nuestra BD")
+    expired_at = models.DateTimeField(null=True, blank=True, help_text="Cuándo dejó de aparecer en la API (null = activo)")
+    grid_cell = models.IntegerField(null=True, blank=True, db_index=True, help_text="Celda de la rejilla espacial (ver flights/spatial.py)")
+    raw_data_digest = models.BigIntegerField(null=True, blank=True, help_text="Hash de raw_data (ver raw_payload_digest)")
 
     def __str__(self):
         return f"Flight {self.flight_id} - {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -17,4 +27,285 @@ class FlightData(models.Model):
     class Meta:
         verbose_name = "Flight Data"
         verbose_name_plural = "Flight Data"
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp', '-id']
+        indexes = [
+            # Orden por defecto y paginación keyset sobre (timestamp, id)
+            models.Index(fields=['timestamp', 'id'], name='flightdata_timestamp_id_idx'),
+        ]
+
+def _encode_raw_payload(raw_data):
+    # Si las claves son los campos de OpenSky en orden se guarda sólo la lista de valores
+    keys = list(raw_data)
+    if keys == list(OPENSKY_FIELD_NAMES[:len(keys)]):
+        raw_data = list(raw_data.values())
+    return json.dumps(raw_data, separators=(',', ':')).encode('utf-8')
+
+
+def pack_raw_payload(raw_data):
+    """
+    raw_data -> bytes (JSON comprimido con zlib). Si las claves son los campos de
+    OpenSky en orden se guarda sólo la lista de valores, que ocupa un tercio.
+    """
+    return zlib.compress(_encode_raw_payload(raw_data))
+
+
+def raw_payload_digest(raw_data):
+    """
+    Entero de 64 bits con signo que identifica el contenido de raw_data (None si
+    no hay). La ingesta lo guarda en FlightData para saber si cambió algún campo
+    que no tiene columna propia (squawk, callsign, vertical_rate...) sin leer
+    FlightRawData.
+    """
+    if raw_data is None:
+        return None
+    digest = hashlib.blake2b(_encode_raw_payload(raw_data), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+
+def unpack_raw_payload(payload):
+    value = json.loads(zlib.decompress(payload))
+    if isinstance(value, list):
+        return dict(zip(OPENSKY_FIELD_NAMES, value))
+    return value
+
+
+class FlightRawData(models.Model):
+    """
+    Payload crudo de la API para cada vuelo, fuera de la fila de FlightData para
+    que el listado no lo lea. Guarda el último estado visto de cada flight_id y la
+    versión de ingesta que lo escribió; sólo se carga cuando un cliente pide raw_data.
+    """
+    flight_id = models.CharField(max_length=100, primary_key=True, help_text="flight_id de FlightData")
+    ingest_version = models.PositiveBigIntegerField(default=0, help_text="IngestState.version al escribirlo")
+    payload = models.BinaryField(help_text="raw_data en JSON comprimido (ver pack_raw_payload)")
+
+    def __str__(self):
+        return f"Raw data {self.flight_id} (version {self.ingest_version})"
+
+    @property
+    def raw_data(self):
+        return unpack_raw_payload(self.payload)
+
+    @classmethod
+    def load(cls, flight_ids):
+        # {flight_id: raw_data} para los vuelos pedidos (los que no tengan payload no aparecen)
+        rows = cls.objects.filter(flight_id__in=list(flight_ids)).values_list('flight_id', 'payload')
+        return {flight_id: unpack_raw_payload(payload) for flight_id, payload in rows}
+
+    class Meta:
+        verbose_name = "Flight Raw Data"
+        verbose_name_plural = "Flight Raw Data"
+
+# Tamaño de cada bucket temporal del histórico (una hora)
+HISTORY_BUCKET_SECONDS = 3600
+
+# Escalas de cuantización de FlightPosition
+COORDINATE_SCALE = 100000  # 1e-5 grados (~1 m)
+SPEED_SCALE = 10           # décimas de m/s
+HEADING_SCALE = 10         # décimas de grado
+
+
+def history_bucket_for(timestamp):
+    return int(timestamp.timestamp()) // HISTORY_BUCKET_SECONDS
+
+
+def _dequantize(value, scale):
+    return None if value is None else value / scale
+
+
+class FlightPosition(models.Model):
+    """
+    Histórico append-only de posiciones. Columnas enteras cuantizadas en lugar
+    de floats y sin raw_data; `bucket` agrupa por hora para poder consultar y
+    compactar ventanas de tiempo sin recorrer toda la tabla.
+    """
+    flight_id = models.CharField(max_length=100, help_text="icao24 / flight_id de FlightData")
+    bucket = models.IntegerField(help_text="Hora desde epoch (timestamp // HISTORY_BUCKET_SECONDS)")
+    timestamp = models.DateTimeField()
+    latitude_e5 = models.IntegerField(help_text="Latitud * 1e5")
+    longitude_e5 = models.IntegerField(help_text="Longitud * 1e5")
+    altitude_m = models.IntegerField(null=True, blank=True, help_text="Altitud en metros")
+    speed_dms = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Velocidad en décimas de m/s")
+    heading_dd = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Rumbo en décimas de grado")
+
+    def __str__(self):
+        return f"Position {self.flight_id} - {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
+
+    @classmethod
+    def from_processed(cls, processed_data):
+        # processed_data: dict con el formato de _process_api_item. None si no hay posición.
+        latitude, longitude = processed_data['latitude'], processed_data['longitude']
+        if latitude is None or longitude is None or latitude != latitude or longitude != longitude:
+            return None
+        speed, heading, altitude = processed_data['speed'], processed_data['heading'], processed_data['altitude']
+        return cls(
+            flight_id=processed_data['flight_id'],
+            bucket=history_bucket_for(processed_data['timestamp']),
+            timestamp=processed_data['timestamp'],
+            latitude_e5=round(latitude * COORDINATE_SCALE),
+            longitude_e5=round(longitude * COORDINATE_SCALE),
+            altitude_m=None if altitude is None or altitude != altitude else round(altitude),
+            speed_dms=None if speed is None or not 0 <= speed <= 3276 else round(speed * SPEED_SCALE),
+            heading_dd=None if heading is None or not 0 <= heading <= 360 else round(heading * HEADING_SCALE),
+        )
+
+    @property
+    def latitude(self):
+        return _dequantize(self.latitude_e5, COORDINATE_SCALE)
+
+    @property
+    def longitude(self):
+        return _dequantize(self.longitude_e5, COORDINATE_SCALE)
+
+    @property
+    def speed(self):
+        return _dequantize(self.speed_dms, SPEED_SCALE)
+
+    @property
+    def heading(self):
+        return _dequantize(self.heading_dd, HEADING_SCALE)
+
+    class Meta:
+        verbose_name = "Flight Position"
+        verbose_name_plural = "Flight Positions"
+        ordering = ['timestamp']
+        indexes = [
+            # Track de un vuelo en una ventana: igualdad en flight_id + rango de bucket/timestamp
+            models.Index(fields=['flight_id', 'bucket', 'timestamp'], name='flightpos_flight_bucket_idx'),
+            # Retención/compactación por bucket
+            models.Index(fields=['bucket'], name='flightpos_bucket_idx'),
+        ]
+
+
+class IngestState(models.Model):
+    """
+    Fila única (pk=1) con la versión de los datos. La ingesta la incrementa en la
+    misma transacción en la que escribe FlightData, así que cualquier proceso
+    puede saber si su snapshot en memoria sigue vigente con una consulta por PK.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Validadores del último payload ingerido completo, para peticiones condicionales
+    source_etag = models.CharField(max_length=255, blank=True, default='')
+    source_last_modified = models.CharField(max_length=64, blank=True, default='')
+    payload_sha256 = models.CharField(max_length=64, blank=True, default='')
+
+    def __str__(self):
+        return f"Ingest version {self.version}"
+
+    @classmethod
+    def current_version(cls):
+        version = cls.objects.filter(pk=1).values_list('version', flat=True).first()
+        return version or 0
+
+    @classmethod
+    def bump(cls):
+        # Debe llamarse dentro de la transacción que modifica los datos; devuelve la nueva versión
+        if not cls.objects.filter(pk=1).update(version=models.F('version') + 1, updated_at=timezone.now()):
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
+        return cls.current_version()
+
+    @classmethod
+    def source_fingerprint(cls):
+        row = cls.objects.filter(pk=1).values('source_etag', 'source_last_modified', 'payload_sha256').first()
+        return row or {'source_etag': '', 'source_last_modified': '', 'payload_sha256': ''}
+
+    @classmethod
+    def save_source_fingerprint(cls, etag, last_modified, payload_sha256):
+        fingerprint = {
+            'source_etag': etag or '',
+            'source_last_modified': last_modified or '',
+            'payload_sha256': payload_sha256 or '',
+        }
+        cls.objects.update_or_create(pk=1, defaults=fingerprint)
+
+    class Meta:
+        verbose_name = "Ingest State"
+        verbose_name_plural = "Ingest State"
+
+
+class IngestCycle(models.Model):
+    """
+    Ring buffer de los últimos ciclos de ingesta con sus métricas (ver
+    flights/metrics.py). Vive en la base de datos porque la ingesta corre en otro
+    proceso (cron o run_ingest_worker) que el que sirve /metrics.
+    """
+    started_at = models.DateTimeField()
+    source = models.CharField(max_length=16, help_text="'api' (una petición), 'tiles' o 'sources'")
+    mode = models.CharField(max_length=16)
+    success = models.BooleanField()
+    skipped = models.BooleanField(default=False, help_text="Payload sin cambios (304 o mismo sha256)")
+    duration = models.FloatField(help_text="Segundos")
+    stages = models.JSONField(default=dict, help_text="Segundos por etapa")
+    counts = models.JSONField(default=dict, help_text="created, updated, expired, rejected, ...")
+    reject_reasons = models.JSONField(default=dict)
+    payload_bytes = models.PositiveBigIntegerField(default=0)
+    peak_memory_bytes = models.PositiveBigIntegerField(default=0)
+    message = models.CharField(max_length=255, blank=True, default='')
+
+    def __str__(self):
+        return f"Ingest cycle {self.started_at:%Y-%m-%d %H:%M:%S} ({self.outcome})"
+
+    @property
+    def outcome(self):
+        if not self.success:
+            return 'failure'
+        return 'skipped' if self.skipped else 'success'
+
+    @classmethod
+    def record(cls, source, mode, result, keep):
+        # Guarda el ciclo y borra los que quedan fuera de los `keep` más recientes
+        metrics = result.get('metrics', {})
+        cycle = cls.objects.create(
+            started_at=datetime.fromtimestamp(metrics.get('started_at', time.time()), tz=dt_timezone.utc),
+            source=source,
+            mode=mode,
+            success=bool(result.get('success')),
+            skipped=bool(result.get('skipped')),
+            duration=metrics.get('duration', 0.0),
+            stages=metrics.get('stages', {}),
+            counts={field: result[field] for field in COUNT_FIELDS if field in result},
+            reject_reasons=result.get('reject_reasons', {}),
+            payload_bytes=result.get('payload_bytes', 0),
+            peak_memory_bytes=metrics.get('peak_rss_bytes', 0),
+            message=str(result.get('message', ''))[:255],
+        )
+        cls.objects.filter(pk__lte=cycle.pk - keep).delete()
+        return cycle
+
+    class Meta:
+        verbose_name = "Ingest Cycle"
+        verbose_name_plural = "Ingest Cycles"
+        ordering = ['-id']
+
+
+class FleetAggregate(models.Model):
+    """
+    Fila única (pk=1) con las estadísticas de la flota activa que calculó el
+    último ciclo de ingesta (ver flights/aggregates.py). Se escribe en la
+    transacción que cierra el ciclo, junto con el incremento de IngestState.version.
+    """
+    computed_at = models.DateTimeField()
+    ingest_version = models.PositiveBigIntegerField(default=0, help_text="IngestState.version al escribirlo")
+    flights = models.PositiveIntegerField(default=0)
+    document = models.JSONField(default=dict, help_text="Totales y vectores de contadores por celda")
+
+    def __str__(self):
+        return f"Fleet aggregate {self.computed_at:%Y-%m-%d %H:%M:%S} ({self.flights} flights)"
+
+    @classmethod
+    def save_document(cls, document, flights, ingest_version):
+        cls.objects.update_or_create(pk=1, defaults={
+            'computed_at': timezone.now(),
+            'ingest_version': ingest_version,
+            'flights': flights,
+            'document': document,
+        })
+
+    @classmethod
+    def latest(cls):
+        return cls.objects.filter(pk=1).first()
+
+    class Meta:
+        verbose_name = "Fleet Aggregate"
+        verbose_name_plural = "Fleet Aggregates"
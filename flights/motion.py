@@ -0,0 +1,134 @@
+# flights/motion.py
+# Estima dónde está cada aeronave entre dos ciclos de ingesta (dead reckoning):
+# desde la última posición observada avanza en línea recta con la velocidad y el
+# rumbo reportados, y cambia la altitud con la tasa vertical de OpenSky. Las
+# columnas se preparan una vez por versión de ingesta; proyectar a un instante
+# es una pasada sobre arrays, sin tocar la base de datos.
+
+import math
+from array import array
+from .models import FlightData, FlightRawData, unpack_raw_payload
+from .spatial import EARTH_RADIUS_KM
+
+DEFAULT_MAX_EXTRAPOLATION_SECONDS = 300
+# Por encima de esta latitud el avance en longitud no es fiable: sólo se mueve en latitud
+MAX_EAST_LATITUDE = 89.0
+_MICROSECONDS = 1000000
+_DEGREES_PER_METER = 180.0 / (math.pi * EARTH_RADIUS_KM * 1000)
+
+
+def load_vertical_motion(flight_ids):
+    """
+    {flight_id: (vertical_rate m/s o None, on_ground)} desde FlightRawData. La
+    tasa vertical sólo está en el payload crudo, así que se lee una vez por versión.
+    Sólo se leen los payloads de vuelos activos (subconsulta, sin una lista de ids
+    como parámetros); ``flight_ids`` descarta los que no están en el snapshot.
+    """
+    wanted = set(flight_ids)
+    motion = {}
+    active = FlightData.objects.filter(expired_at__isnull=True).values('flight_id')
+    payloads = FlightRawData.objects.filter(flight_id__in=active).values_list('flight_id', 'payload')
+    for flight_id, payload in payloads.iterator(chunk_size=5000):
+        if flight_id not in wanted:
+            continue
+        raw = unpack_raw_payload(payload)
+        if isinstance(raw, dict):
+            rate = raw.get('vertical_rate')
+            motion[flight_id] = (float(rate) if isinstance(rate, (int, float)) else None, bool(raw.get('on_ground')))
+    return motion
+
+
+class FleetMotion:
+    """
+    Columnas por fila de un FlightSnapshot (mismo orden): instante observado,
+    posición, altitud y las tasas en grados/s y m/s ya calculadas. Las filas sin
+    posición, velocidad o rumbo se devuelven sin mover.
+    """
+
+    def __init__(self, snapshot, vertical_motion=None):
+        vertical_motion = vertical_motion or {}
+        rows = snapshot.rows
+        size = len(rows)
+        self.version = snapshot.version
+        # snapshot.keys[i][0] es el timestamp en microsegundos (ver pagination.timestamp_key)
+        self.observed = array('d', (key[0] / _MICROSECONDS for key in snapshot.keys))
+        self.latitude = array('d', bytes(8 * size))
+        self.longitude = array('d', bytes(8 * size))
+        self.altitude = array('d', bytes(8 * size))
+        self.north = array('d', bytes(8 * size)) # grados de latitud por segundo
+        self.east = array('d', bytes(8 * size))  # grados de longitud por segundo
+        self.climb = array('d', bytes(8 * size)) # metros por segundo
+        self.movable = bytearray(size)
+        for index, row in enumerate(rows):
+            latitude, longitude, speed, heading = row['latitude'], row['longitude'], row['speed'], row['heading']
+            if latitude is None or longitude is None or speed is None or heading is None:
+                continue
+            self.latitude[index], self.longitude[index] = latitude, longitude
+            self.altitude[index] = row['altitude'] or 0.0
+            track = math.radians(heading)
+            degrees_per_second = speed * _DEGREES_PER_METER
+            self.north[index] = degrees_per_second * math.cos(track)
+            if abs(latitude) < MAX_EAST_LATITUDE:
+                self.east[index] = degrees_per_second * math.sin(track) / math.cos(math.radians(latitude))
+            rate, on_ground = vertical_motion.get(row['flight_id'], (None, False))
+            if rate is not None and not on_ground:
+                self.climb[index] = rate
+            self.movable[index] = 1
+
+    def __len__(self):
+        return len(self.observed)
+
+    def project(self, at, indices=None, max_seconds=DEFAULT_MAX_EXTRAPOLATION_SECONDS):
+        """
+        Posiciones en el instante ``at`` (segundos epoch) para ``indices`` (por
+        defecto, toda la flota): lista de (latitud, longitud, altitud), o None en
+        las filas que no se mueven o cuyo dato es posterior a ``at``. El avance
+        se acota a ``max_seconds``: no se extrapola sin límite.
+        """
+        if indices is None:
+            indices = range(len(self.observed))
+        observed, movable = self.observed, self.movable
+        latitude, longitude, altitude = self.latitude, self.longitude, self.altitude
+        north, east, climb = self.north, self.east, self.climb
+        projected = []
+        append = projected.append
+        for index in indices:
+            if not movable[index]:
+                append(None)
+                continue
+            elapsed = at - observed[index]
+            if elapsed <= 0.0:
+                append(None)
+                continue
+            if elapsed > max_seconds:
+                elapsed = max_seconds
+            new_latitude = latitude[index] + north[index] * elapsed
+            new_longitude = longitude[index] + east[index] * elapsed
+            # Cruzar un polo o el antimeridiano
+            if new_latitude > 90.0:
+                new_latitude = 180.0 - new_latitude
+                new_longitude += 180.0
+            elif new_latitude < -90.0:
+                new_latitude = -180.0 - new_latitude
+                new_longitude += 180.0
+            new_longitude = (new_longitude + 180.0) % 360.0 - 180.0
+            rate = climb[index]
+            new_altitude = altitude[index] + rate * elapsed
+            if rate < 0.0 and new_altitude < 0.0:
+                # Un descenso se detiene en el suelo; una altitud observada negativa se deja como está
+                new_altitude = altitude[index] if altitude[index] < 0.0 else 0.0
+            append((new_latitude, new_longitude, new_altitude))
+        return projected
+
+
+def project_rows(rows, positions):
+    # Copias de las filas con la posición proyectada, redondeada a ~1 m (las que no se mueven se devuelven tal cual)
+    return [
+        row if position is None else {
+            **row,
+            'latitude': round(position[0], 5),
+            'longitude': round(position[1], 5),
+            'altitude': round(position[2], 1),
+        }
+        for row, position in zip(rows, positions)
+    ]
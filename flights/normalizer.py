@@ -0,0 +1,141 @@
+# flights/normalizer.py
+# Normalizador por lotes para los state vectors de OpenSky. Produce exactamente
+# los mismos dicts que FlightDataService._process_api_item, pero con lo que se
+# repite en cada fila resuelto una vez por lote (hora actual, conversión de
+# timestamps) y sin un log por cada fila rechazada: los rechazos se cuentan.
+
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from django.utils import timezone as django_timezone
+
+OPENSKY_FIELD_NAMES = (
+    "icao24", "callsign", "origin_country", "time_position", "last_contact",
+    "longitude", "latitude", "baro_altitude", "on_ground", "velocity",
+    "true_track", "vertical_rate", "sensors", "geo_altitude", "squawk",
+    "spi", "position_source"
+)
+
+# Como _process_api_item: se lee hasta true_track (índice 10) y geo_altitude (13) sólo
+# si baro_altitude viene vacío; un array que no llega al campo que se lee se rechaza
+MIN_STATE_LENGTH = 11
+GEO_ALTITUDE_INDEX = 13
+
+REJECT_NOT_A_LIST = 'not a list'
+REJECT_TOO_SHORT = 'array too short'
+REJECT_MISSING_ID = 'missing flight_id'
+REJECT_BAD_NUMBER = 'non-numeric position/speed'
+REJECT_BAD_TIMESTAMP = 'timestamp out of range'
+
+
+class SourceState(list):
+    """
+    State vector que recuerda de qué fuente viene (ver flights/sources.py). La
+    normalización guarda la fuente en raw_data['source'].
+    """
+    __slots__ = ('source',)
+
+    def __init__(self, values=(), source=None):
+        super().__init__(values)
+        self.source = source
+
+
+class NormalizedStates:
+    """
+    Resultado de ``normalize_states``: ``rows`` son dicts con el formato de
+    _process_api_item, en el orden de entrada, y ``rejects`` una lista de
+    ``(índice_en_el_lote, motivo)``.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.rejects = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def reject_counts(self):
+        return Counter(reason for _, reason in self.rejects)
+
+
+def normalize_states(states, now=None):
+    """
+    Normaliza una lista de state vectors (listas posicionales de OpenSky).
+    ``now`` se usa cuando el estado no trae timestamp; por defecto es la hora
+    actual, calculada una sola vez para todo el lote.
+    """
+    result = NormalizedStates()
+    rows, rejects = result.rows, result.rejects
+    if now is None:
+        now = django_timezone.now()
+
+    field_names = OPENSKY_FIELD_NAMES
+    from_timestamp = datetime.fromtimestamp
+    utc = dt_timezone.utc
+    # Muchas aeronaves comparten el mismo segundo: cada timestamp se convierte una vez
+    timestamp_cache = {}
+
+    for index, item in enumerate(states):
+        if not isinstance(item, list):
+            rejects.append((index, REJECT_NOT_A_LIST))
+            continue
+        length = len(item)
+        if length < MIN_STATE_LENGTH:
+            rejects.append((index, REJECT_TOO_SHORT))
+            continue
+
+        raw_id = item[0]
+        flight_identifier = str(raw_id).strip() if raw_id else None
+        if not flight_identifier:
+            rejects.append((index, REJECT_MISSING_ID))
+            continue
+
+        raw_altitude = item[7]
+        if not raw_altitude:
+            if length <= GEO_ALTITUDE_INDEX:
+                rejects.append((index, REJECT_TOO_SHORT))
+                continue
+            raw_altitude = item[GEO_ALTITUDE_INDEX] or 0.0
+
+        raw_lat, raw_lon, raw_speed, raw_heading = item[6], item[5], item[9], item[10]
+        try:
+            latitude = float(raw_lat) if raw_lat is not None else None
+            longitude = float(raw_lon) if raw_lon is not None else None
+            altitude = float(raw_altitude)
+            speed = float(raw_speed) if raw_speed is not None else None
+            heading = float(raw_heading) if raw_heading is not None else None
+        except (TypeError, ValueError):
+            rejects.append((index, REJECT_BAD_NUMBER))
+            continue
+
+        raw_timestamp = item[3] if item[3] else item[4]
+        parsed_timestamp = now
+        if raw_timestamp:
+            parsed_timestamp = timestamp_cache.get(raw_timestamp)
+            if parsed_timestamp is None:
+                try:
+                    parsed_timestamp = from_timestamp(int(raw_timestamp), tz=utc)
+                except (ValueError, TypeError):
+                    parsed_timestamp = now
+                except (OverflowError, OSError):
+                    rejects.append((index, REJECT_BAD_TIMESTAMP))
+                    continue
+                try:
+                    timestamp_cache[raw_timestamp] = parsed_timestamp
+                except TypeError:
+                    pass # valor no hasheable (p. ej. una lista); no se cachea
+
+        raw = dict(zip(field_names, item))
+        if item.__class__ is SourceState:
+            raw['source'] = item.source
+        rows.append({
+            'flight_id': flight_identifier,
+            'latitude': latitude,
+            'longitude': longitude,
+            'altitude': altitude,
+            'speed': speed,
+            'heading': heading,
+            'timestamp': parsed_timestamp,
+            'raw_data': raw,
+        })
+
+    return result
@@ -0,0 +1,129 @@
+# flights/pagination.py
+
+import base64
+import binascii
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def timestamp_key(timestamp):
+    # Microsegundos desde epoch (aritmética entera, sin pérdida); comparable sin depender de la zona horaria
+    return (timestamp - EPOCH) // MICROSECOND
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación keyset sobre el orden (-timestamp, -id). El cursor codifica la
+    última fila entregada, así que cada página es una búsqueda por índice sin
+    COUNT(*) ni OFFSET, y no se salta ni repite filas si los datos cambian.
+
+    Se activa con ``?pagination=keyset`` (primera página) o ``?cursor=``.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    mode_value = 'keyset'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE or 100
+        self.request = None
+        self.next_key = None
+
+    @classmethod
+    def is_requested(cls, request):
+        params = request.query_params
+        return cls.cursor_query_param in params or params.get(cls.mode_query_param) == cls.mode_value
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value:
+            try:
+                size = int(value)
+            except ValueError:
+                size = 0
+            if size > 0:
+                return min(size, self.max_page_size)
+        return self.page_size
+
+    def encode_cursor(self, key):
+        timestamp_us, pk = key
+        return base64.urlsafe_b64encode(f'{timestamp_us}:{pk}'.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        value = request.query_params.get(self.cursor_query_param)
+        if not value:
+            return None
+        try:
+            decoded = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+            timestamp_us, pk = (int(part) for part in decoded.split(':'))
+            EPOCH + timestamp_us * MICROSECOND # valida el rango
+            return timestamp_us, pk
+        except (binascii.Error, UnicodeDecodeError, ValueError, OverflowError):
+            raise NotFound('Invalid cursor.')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # queryset debe venir ordenado por ('-timestamp', '-id')
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            timestamp_us, pk = cursor
+            timestamp = EPOCH + timestamp_us * MICROSECOND
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+        page = list(queryset[:page_size + 1])
+        self.next_key = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_key = (timestamp_key(page[-1].timestamp), page[-1].pk)
+        return page
+
+    def paginate_keys(self, keys, request):
+        """
+        Variante en memoria: ``keys`` son las claves (timestamp_us, id) de un snapshot
+        ordenado de forma descendente. Devuelve el rango de índices de la página.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        start = 0
+        if cursor is not None:
+            # Las claves están en orden descendente: se busca sobre las negadas
+            negated = _NegatedKeys(keys)
+            start = bisect_right(negated, (-cursor[0], -cursor[1]))
+        end = min(start + page_size, len(keys))
+        self.next_key = keys[end - 1] if end < len(keys) else None
+        return range(start, end)
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.mode_query_param, self.mode_value)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_key))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
+class _NegatedKeys:
+    # Vista ascendente de una secuencia de claves descendentes, para bisect sin copiarla
+    def __init__(self, keys):
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, index):
+        timestamp_us, pk = self.keys[index]
+        return -timestamp_us, -pk
@@ -0,0 +1,41 @@
+# flights/renderers.py
+
+import json
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from .binary import MEDIA_TYPE as FLIGHT_BINARY_MEDIA_TYPE
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    JSON delimitado por saltos de línea (un objeto por línea). El export arma
+    su propio StreamingHttpResponse; este renderer sirve para la negociación
+    (Accept / ?format=ndjson) y para las respuestas de error.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return b''.join(json.dumps(row, ensure_ascii=False, separators=(',', ':')).encode() + b'\n' for row in rows)
+
+
+class FlightBinaryRenderer(BaseRenderer):
+    """
+    Formato binario de flights/binary.py (Accept: application/x-flight-snapshot
+    o ?format=bin). La vista entrega los bytes ya codificados; las respuestas de
+    error, que son dicts, se devuelven como JSON.
+    """
+    media_type = FLIGHT_BINARY_MEDIA_TYPE
+    format = 'bin'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data)
@@ -1,8 +1,21 @@
 from rest_framework import serializers
-from .models import FlightData
+from .models import FlightData, FlightPosition
 
 class FlightDataSerializer(serializers.ModelSerializer):
     class Meta:
         model = FlightData
-        fields = '__all__' # O especifica los campos que quieres exponer:
-                           # ['flight_id', 'latitude', 'longitude', 'altitude', 'speed', 'heading', 'timestamp']
\ No newline at end of file
+        # Columnas internas de la ingesta (expiración, índice espacial, hash de raw_data): no forman
+        # parte de la API. Los fragmentos del snapshot y del camino rápido salen de este serializer.
+        exclude = ('expired_at', 'grid_cell', 'raw_data_digest')
+
+class FlightPositionSerializer(serializers.ModelSerializer):
+    # Las columnas cuantizadas se exponen ya convertidas a sus unidades
+    latitude = serializers.FloatField(read_only=True)
+    longitude = serializers.FloatField(read_only=True)
+    altitude = serializers.IntegerField(source='altitude_m', read_only=True)
+    speed = serializers.FloatField(read_only=True)
+    heading = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = FlightPosition
+        fields = ['timestamp', 'latitude', 'longitude', 'altitude', 'speed', 'heading']
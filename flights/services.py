@@ -1,46 +1,158 @@
 # flights/services.py
 
-import requests
 import os
 import logging
+import threading
+import time
+from collections import Counter
+from functools import partial
+from itertools import islice
+from django.conf import settings
 from django.utils import timezone as django_timezone
 from datetime import datetime, timezone as dt_timezone
-from .models import FlightData # Asegúrate de que FlightData esté importado
+from .aggregates import FleetAggregator
+from .metrics import CycleMetrics
+from .models import FleetAggregate, FlightData, FlightPosition, FlightRawData, IngestCycle, IngestState, pack_raw_payload, raw_payload_digest, HISTORY_BUCKET_SECONDS, history_bucket_for
 from django.db import transaction # Para operaciones atómicas
+from .normalizer import OPENSKY_FIELD_NAMES, normalize_states
+from .sharding import merge_states
+from .sources import OpenSkyParser
+from .spatial import grid_cell_for
 
 logger = logging.getLogger(__name__)
 
 MODULE_EXTERNAL_API_URL = os.environ.get('EXTERNAL_API_URL')
 MODULE_EXTERNAL_API_KEY = os.environ.get('EXTERNAL_API_KEY')
 
+INGEST_MODE_UPSERT = 'upsert'   # Diff por flight_id, expira los que faltan
+INGEST_MODE_REPLACE = 'replace' # Borra todo y recarga (comportamiento original)
+INGEST_MODES = (INGEST_MODE_UPSERT, INGEST_MODE_REPLACE)
+
+UPSERT_BATCH_SIZE = 1000
+STREAM_CHUNK_SIZE = 64 * 1024 # Bytes leídos de la respuesta HTTP en cada iteración
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024 # El cuerpo descargado pasa a disco por encima de este tamaño
+REQUEST_TIMEOUT = 30
+HTTP_POOL_SIZE = 10
+DEFAULT_TILE_WORKERS = 4
+DEFAULT_SOURCE_WORKERS = 4
+DEFAULT_METRICS_HISTORY = 50 # Ciclos que se guardan en IngestCycle
+
+# Campos que se comparan para decidir si una fila cambió; raw_data (en FlightRawData) se compara
+# por su hash, FlightData.raw_data_digest
+COMPARED_FIELDS = ('latitude', 'longitude', 'altitude', 'speed', 'heading', 'timestamp')
+UPSERT_UPDATE_FIELDS = [*COMPARED_FIELDS, 'grid_cell', 'raw_data_digest', 'expired_at', 'last_updated_by_system']
+
+EMPTY_STATS = {'created': 0, 'updated': 0, 'unchanged': 0, 'expired': 0, 'deleted': 0, 'processed': 0, 'batches': 0, 'rejected': 0, 'positions': 0}
+
+# requests (y urllib3, certifi), tempfile, hashlib y concurrent.futures se importan al usarlos:
+# importar este módulo no debe costar lo mismo que un ciclo con red (ver benchmark_startup)
+
+def build_http_session(pool_size=HTTP_POOL_SIZE):
+    # Sesión con pool de conexiones keep-alive; los reintentos los decide el worker
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_SESSION_LOCK = threading.Lock()
+
+
+def _request_exception():
+    # Para los except: requests ya está importado si hubo una petición
+    from requests.exceptions import RequestException
+    return RequestException
+
+
+def _thread_pool(max_workers):
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
 class FlightDataService:
-    def __init__(self):
+    def __init__(self, session=None, timeout=REQUEST_TIMEOUT, parser=None):
         self.api_url = MODULE_EXTERNAL_API_URL
         self.api_key = MODULE_EXTERNAL_API_KEY
+        # Formato de EXTERNAL_API_URL (ver flights/sources.py); por defecto, /states/all de OpenSky
+        self.parser = parser or OpenSkyParser()
+        # Un proceso de larga duración (run_ingest_worker) reutiliza la misma sesión en cada ciclo;
+        # sin sesión se crea en la primera petición
+        self._session = session
+        self.timeout = timeout
+        # Métricas del ciclo en curso (ver _measured)
+        self._metrics = CycleMetrics()
 
         if not self.api_url:
             logger.error("FlightDataService initialized, but EXTERNAL_API_URL is not set/empty in environment.")
 
-    def _fetch_data_from_external_api(self):
-        if not self.api_url:
+    @property
+    def session(self):
+        # Las teselas y fuentes se piden desde varios hilos: una sola sesión por servicio
+        if self._session is None:
+            with _SESSION_LOCK:
+                if self._session is None:
+                    self._session = build_http_session()
+        return self._session
+
+    def _fetch_data_from_external_api(self, conditional_headers=None, params=None, url=None):
+        # Devuelve la respuesta HTTP abierta en modo stream (puede ser un 304); el cuerpo se lee después
+        url = url or self.api_url
+        if not url:
             logger.error("Cannot fetch data: api_url is not configured or is empty.")
             return None
-        headers = {}
-        if self.api_key:
+        headers = dict(conditional_headers or {})
+        if self.api_key and url == self.api_url:
             # Ejemplo: headers['Authorization'] = f'Bearer {self.api_key}'
             pass # Adapta según tu API
-        params = None
         try:
-            logger.info(f"Fetching data from {self.api_url}")
-            response = requests.get(self.api_url, headers=headers, params=params, timeout=30)
+            logger.info(f"Fetching data from {url}{f' {params}' if params else ''}")
+            response = self.session.get(url, headers=headers, params=params, timeout=self.timeout, stream=True)
+            if not response.ok:
+                self._discard_body(response)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return response
+        except _request_exception() as e:
             logger.error(f"Error fetching data from API: {e}")
             return None
-        except ValueError as e:
-            logger.error(f"Error parsing JSON response from API: {e}")
-            return None
+
+    def _discard_body(self, response):
+        # Leer el cuerpo (vacío o corto) devuelve la conexión al pool; response.close() la cerraría
+        for _ in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+            pass
+
+    def _conditional_headers(self, fingerprint):
+        headers = {}
+        if fingerprint['source_etag']:
+            headers['If-None-Match'] = fingerprint['source_etag']
+        if fingerprint['source_last_modified']:
+            headers['If-Modified-Since'] = fingerprint['source_last_modified']
+        return headers
+
+    def _download(self, response):
+        # Copia el cuerpo a un archivo temporal (en memoria hasta SPOOL_MAX_MEMORY) calculando su hash,
+        # para poder descartar un payload idéntico antes de procesarlo.
+        import hashlib
+        import tempfile
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        digest = hashlib.sha256()
+        try:
+            with response:
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    digest.update(chunk)
+                    body.write(chunk)
+        except BaseException:
+            body.close()
+            raise
+        size = body.tell()
+        body.seek(0)
+        return body, digest.hexdigest(), size
+
+    def _iter_api_states(self, body, parser=None, source=None):
+        # El parser traduce el formato de la API a state vectors de OpenSky (ver flights/sources.py)
+        return (parser or self.parser).parse(iter(partial(body.read, STREAM_CHUNK_SIZE), b''), source)
 
     def _process_api_item(self, item_array): # ADAPTADO PARA EL EJEMPLO DE OpenSky
         try:
@@ -62,13 +174,7 @@ class FlightDataService:
             speed_val = float(item_array[9]) if item_array[9] is not None else None
             heading_val = float(item_array[10]) if item_array[10] is not None else None
             
-            fields_names = [
-                "icao24", "callsign", "origin_country", "time_position", "last_contact",
-                "longitude", "latitude", "baro_altitude", "on_ground", "velocity",
-                "true_track", "vertical_rate", "sensors", "geo_altitude", "squawk",
-                "spi", "position_source"
-            ]
-            raw_data_dict = {fields_names[i]: item_array[i] for i in range(min(len(fields_names), len(item_array)))}
+            raw_data_dict = {OPENSKY_FIELD_NAMES[i]: item_array[i] for i in range(min(len(OPENSKY_FIELD_NAMES), len(item_array)))}
 
             return {
                 'flight_id': flight_identifier,
@@ -87,83 +193,527 @@ class FlightDataService:
             logger.error(f'Error processing item {item_array[0] if item_array and len(item_array)>0 else "N/A"}: {e}')
             return None
 
-    @transaction.atomic # Envuelve la operación en una transacción de base de datos
-    def update_database_from_api(self):
-        api_response = self._fetch_data_from_external_api()
+    def _has_changed(self, existing, processed_data, digest):
+        # Una fila expirada que reaparece en la API siempre cuenta como actualizada
+        if existing['expired_at'] is not None:
+            return True
+        # Un cambio sólo en raw_data (squawk, callsign, vertical_rate...) también es un cambio
+        if existing['raw_data_digest'] != digest:
+            return True
+        return any(existing[field] != processed_data[field] for field in COMPARED_FIELDS)
 
-        if api_response is None:
-            # No se borran los datos si no se pudo obtener nada de la API
-            return {'success': False, 'message': 'Failed to fetch data from API. Database not modified.', 'created': 0, 'deleted': 0, 'processed': 0}
+    def _build_flight(self, processed_data, digest=None):
+        # La celda espacial se calcula aquí para que quede indexada desde la ingesta
+        if digest is None:
+            digest = raw_payload_digest(processed_data['raw_data'])
+        return FlightData(
+            expired_at=None,
+            grid_cell=grid_cell_for(processed_data['latitude'], processed_data['longitude']),
+            raw_data_digest=digest,
+            **{field: value for field, value in processed_data.items() if field != 'raw_data'},
+        )
+
+    def _write_raw_data(self, chunk, version):
+        # El payload crudo de los vuelos nuevos o modificados se sobrescribe sin leerlo antes
+        raw_rows = [
+            FlightRawData(flight_id=d['flight_id'], ingest_version=version, payload=pack_raw_payload(d['raw_data']))
+            for d in chunk if d['raw_data'] is not None
+        ]
+        if raw_rows:
+            FlightRawData.objects.bulk_create(
+                raw_rows,
+                update_conflicts=True,
+                unique_fields=['flight_id'],
+                update_fields=['ingest_version', 'payload'],
+            )
+
+    def _upsert_chunk(self, chunk):
+        # chunk: lista de dicts ya procesados por _process_api_item. Devuelve también las
+        # filas escritas (nuevas o modificadas), las únicas cuyo raw_data hay que guardar
+        existing_rows = {
+            row['flight_id']: row
+            for row in FlightData.objects.filter(flight_id__in=[d['flight_id'] for d in chunk])
+            .values('flight_id', 'expired_at', 'raw_data_digest', *COMPARED_FIELDS)
+        }
+        to_upsert = []
+        written = []
+        new_positions = []
+        created = updated = unchanged = 0
+        for processed_data in chunk:
+            existing = existing_rows.get(processed_data['flight_id'])
+            digest = raw_payload_digest(processed_data['raw_data'])
+            if existing is None:
+                created += 1
+            elif self._has_changed(existing, processed_data, digest):
+                updated += 1
+            else:
+                unchanged += 1
+                continue
+            to_upsert.append(self._build_flight(processed_data, digest))
+            written.append(processed_data)
+            # Al histórico sólo va una posición nueva, no un cambio de otros campos
+            if existing is None or existing['timestamp'] != processed_data['timestamp']:
+                new_positions.append(processed_data)
+
+        if to_upsert:
+            FlightData.objects.bulk_create(
+                to_upsert,
+                update_conflicts=True,
+                unique_fields=['flight_id'],
+                update_fields=UPSERT_UPDATE_FIELDS,
+            )
+        positions = self._append_history(new_positions)
+        return created, updated, unchanged, positions, written
 
-        # --- ADAPTAR ESTA PARTE A LA ESTRUCTURA DE RESPUESTA DE TU API ---
-        api_data_list_full = api_response.get('states') # Ejemplo para OpenSky
-        # ---------------------------------------------------------------
+    def _append_history(self, rows):
+        # Escribe las posiciones en el histórico append-only (FlightPosition)
+        with self._metrics.stage('history'):
+            positions = [position for position in map(FlightPosition.from_processed, rows) if position is not None]
+            if positions:
+                FlightPosition.objects.bulk_create(positions)
+        return len(positions)
 
-        if api_data_list_full is None:
-            logger.warning(f"API data does not contain expected data key or it's None. Response: {str(api_response)[:500]}")
-            # No se borran los datos si la estructura de la API no es la esperada
-            return {'success': False, 'message': "API data structure not as expected. Database not modified.", 'created': 0, 'deleted': 0, 'processed': 0}
+    def _normalize_batch(self, raw_batch, counters):
+        # Normalización del lote; los rechazos se resumen en una sola línea de log
+        normalized = normalize_states(raw_batch)
+        if normalized.rejects:
+            reject_counts = normalized.reject_counts()
+            counters['rejected'] += len(normalized.rejects)
+            for reason, count in reject_counts.items():
+                counters['reject_reasons'][reason] = counters['reject_reasons'].get(reason, 0) + count
+            logger.warning(f"Rejected {len(normalized.rejects)} of {len(raw_batch)} items in batch: {dict(reject_counts)}")
+        # Se deduplica por flight_id (la última aparición gana) para que el upsert no choque consigo mismo
+        processed_by_id = {row['flight_id']: row for row in normalized.rows}
+        counters['processed'] += len(processed_by_id)
+        return list(processed_by_id.values())
 
-        if not isinstance(api_data_list_full, list):
-            logger.warning(f"Expected data from API is not a list: {type(api_data_list_full)}. Data: {str(api_data_list_full)[:200]}")
-            # No se borran los datos si la estructura de la API no es la esperada
-            return {'success': False, 'message': "Expected data from API is not a list. Database not modified.", 'created': 0, 'deleted': 0, 'processed': 0}
+    def _save_aggregate(self, version):
+        # Se llama dentro de la transacción que cierra el ciclo
+        with self._metrics.stage('aggregate'):
+            FleetAggregate.save_document(self._aggregator.document(), len(self._aggregator), version)
 
-        # --- Borrar todos los registros existentes de FlightData ---
+    def _iter_processed_batches(self, states, limit, batch_size, counters):
+        # Normaliza los estados en lotes de tamaño fijo. Los elementos por encima de
+        # `limit` se cuentan pero no se procesan. El parser JSON es perezoso: leer
+        # el lote es la etapa de decodificación. Cada lote normalizado alimenta las
+        # estadísticas de la flota (flights/aggregates.py).
+        states = iter(states)
+        while True:
+            with self._metrics.stage('decode'):
+                raw_batch = list(islice(states, batch_size))
+            if not raw_batch:
+                return
+            start = counters['total_from_api']
+            counters['total_from_api'] += len(raw_batch)
+            if limit is not None:
+                if start >= limit:
+                    continue
+                raw_batch = raw_batch[:limit - start]
+            with self._metrics.stage('normalize'):
+                processed = self._normalize_batch(raw_batch, counters)
+            with self._metrics.stage('aggregate'):
+                self._aggregator.add_rows(processed)
+            if processed:
+                yield processed
+
+    def _ingest_replace(self, batches, stats):
+        # Modo original: borrar todo y recargar, todo dentro de una sola transacción
         try:
-            num_deleted, _ = FlightData.objects.all().delete()
+            with self._metrics.stage('delete'):
+                num_deleted, _ = FlightData.objects.all().delete()
+                FlightRawData.objects.all().delete()
+                stats['deleted'] = num_deleted
+                version = IngestState.bump()
             logger.info(f"Successfully deleted {num_deleted} existing flight data records.")
         except Exception as e:
             logger.error(f"Error deleting existing flight data records: {e}")
-            # Decide si quieres continuar o fallar aquí. Por ahora, continuamos pero reportamos.
-            return {'success': False, 'message': f"Error deleting existing flight data: {e}", 'created': 0, 'deleted': 0, 'processed': 0}
-        # ---------------------------------------------------------
-
-        if not api_data_list_full:
-            logger.info('No data items received from API or extracted list is empty. All previous data deleted.')
-            return {'success': True, 'message': 'No new data items to process. All previous data deleted.', 'created': 0, 'deleted': num_deleted, 'processed': 0}
-
-        limit = 350
-        api_data_list_limited = api_data_list_full[:limit]
-        logger.info(f"Obtained {len(api_data_list_full)} items from API. Processing up to {len(api_data_list_limited)} items after deleting old data.")
-
-        created_count = 0
-        processed_in_batch = 0
-        
-        # Lista para bulk_create
-        flights_to_create = []
-
-        for item_data in api_data_list_limited:
-            if not isinstance(item_data, list): # Adaptar si tu API devuelve lista de dicts
-                logger.warning(f"Skipping non-list item in API data: {item_data}")
-                continue
-
-            processed_data = self._process_api_item(item_data)
-            if not processed_data:
-                continue
-            
-            # En lugar de update_or_create, creamos instancias para bulk_create
-            flights_to_create.append(FlightData(**processed_data))
-            processed_in_batch +=1
+            return {'success': False, 'message': f"Error deleting existing flight data: {e}"}
 
-        # --- Insertar los nuevos registros usando bulk_create para eficiencia ---
-        if flights_to_create:
+        for batch in batches:
             try:
-                FlightData.objects.bulk_create(flights_to_create)
-                created_count = len(flights_to_create)
-                logger.info(f"Successfully bulk created {created_count} new flight data records.")
+                with self._metrics.stage('upsert'):
+                    FlightData.objects.bulk_create([self._build_flight(d) for d in batch])
+                    self._write_raw_data(batch, version)
+                    stats['positions'] += self._append_history(batch)
             except Exception as e:
                 logger.error(f"Error bulk creating new flight data records: {e}")
-                # Si bulk_create falla, la transacción debería hacer rollback debido a @transaction.atomic
-                return {'success': False, 'message': f"Error bulk creating new flight data: {e}", 'created': 0, 'deleted': num_deleted, 'processed': processed_in_batch}
-        # --------------------------------------------------------------------
+                return {'success': False, 'message': f"Error bulk creating new flight data: {e}"}
+            stats['created'] += len(batch)
+            stats['batches'] += 1
 
-        logger.info(f'Flight data update complete. Processed: {processed_in_batch}. Created: {created_count}. Previous Deleted: {num_deleted}.')
+        try:
+            self._save_aggregate(version)
+        except Exception as e:
+            logger.error(f"Error saving fleet aggregates: {e}")
+            return {'success': False, 'message': f"Error saving fleet aggregates: {e}"}
+
+        logger.info(f"Successfully bulk created {stats['created']} new flight data records.")
+        return {'success': True, 'message': 'Data update process finished (delete and reload).'}
+
+    def _ingest_upsert(self, batches, stats, stale_regions=(), expire=True):
+        # Modo incremental: sólo se escriben las filas nuevas o modificadas. Se llama dentro de
+        # la transacción del ciclo (ver _ingest_states). Los vuelos dentro de `stale_regions`
+        # (teselas o fuentes que fallaron) no se expiran; con expire=False no se expira ninguno.
+        seen_ids = set()
+        # Una sola versión por ciclo: se sube con el primer cambio y, desde ahí, la fila de
+        # IngestState queda bloqueada hasta el commit
+        version = None
+        for batch in batches:
+            try:
+                with self._metrics.stage('upsert'):
+                    created, updated, unchanged, positions, written = self._upsert_chunk(batch)
+                    if written:
+                        if version is None:
+                            version = IngestState.bump()
+                        self._write_raw_data(written, version)
+            except Exception as e:
+                logger.error(f"Error upserting flight data records: {e}")
+                return {'success': False, 'message': f"Error upserting flight data: {e}"}
+            stats['created'] += created
+            stats['updated'] += updated
+            stats['unchanged'] += unchanged
+            stats['positions'] += positions
+            stats['batches'] += 1
+            seen_ids.update(d['flight_id'] for d in batch)
+
+        # Los vuelos que ya no vienen en la API se marcan como expirados, no se borran.
+        # Sólo se llega aquí si el snapshot se leyó completo. Las estadísticas del ciclo
+        # se guardan con la versión del ciclo: quien vea los datos nuevos ve también sus
+        # estadísticas.
+        try:
+            stale_ids = []
+            if expire:
+                with self._metrics.stage('expire'):
+                    active = FlightData.objects.filter(expired_at__isnull=True)
+                    for region in stale_regions:
+                        active = active.exclude(region.region_q())
+                    if stale_regions:
+                        # Un vuelo sin posición no cae en ninguna región: pudo venir de la que falló
+                        active = active.exclude(latitude__isnull=True).exclude(longitude__isnull=True)
+                    stale_ids = [
+                        flight_id for flight_id in active.values_list('flight_id', flat=True)
+                        if flight_id not in seen_ids
+                    ]
+                    now = django_timezone.now()
+                    for start in range(0, len(stale_ids), UPSERT_BATCH_SIZE):
+                        stats['expired'] += FlightData.objects.filter(
+                            flight_id__in=stale_ids[start:start + UPSERT_BATCH_SIZE]
+                        ).update(expired_at=now)
+            if version is None:
+                version = IngestState.bump() if stale_ids else IngestState.current_version()
+            self._save_aggregate(version)
+        except Exception as e:
+            logger.error(f"Error expiring stale flight data records or saving fleet aggregates: {e}")
+            return {'success': False, 'message': f"Error expiring stale flight data or saving fleet aggregates: {e}"}
+
+        if not expire:
+            logger.info(f"Upsert finished without expiring stale flights. Created: {stats['created']}. Updated: {stats['updated']}.")
+            return {'success': True, 'message': 'Data update process finished (incremental upsert, nothing expired).'}
+        logger.info(
+            f"Upsert finished. Created: {stats['created']}. Updated: {stats['updated']}. "
+            f"Unchanged: {stats['unchanged']}. Expired: {stats['expired']}."
+        )
+        return {'success': True, 'message': 'Data update process finished (incremental upsert).'}
+
+    def _ingest_states(self, states, mode, limit, batch_size, stats, stale_regions=(), expire=True):
+        # Núcleo común: normaliza `states` por lotes y los escribe según el modo
+        self._aggregator = FleetAggregator()
+        # Con teselas o fuentes caídas siguen activos vuelos que este ciclo no leyó: las estadísticas no los cuentan
+        self._aggregator.complete = expire and not stale_regions
+        try:
+            batches = self._iter_processed_batches(states, limit, batch_size, stats)
+            # El ciclo completo es una transacción con una sola versión: quien lee ve el
+            # ciclo anterior o éste entero, nunca unos lotes nuevos y otros viejos
+            with self._metrics.stage('commit'), transaction.atomic():
+                if mode == INGEST_MODE_REPLACE:
+                    result = self._ingest_replace(batches, stats)
+                else:
+                    result = self._ingest_upsert(batches, stats, stale_regions, expire)
+                if not result['success']:
+                    # Forzamos el rollback de lo que se haya escrito en esta transacción
+                    transaction.set_rollback(True)
+        except ValueError as e:
+            # Estructura inesperada o JSON truncado/mal formado
+            logger.warning(f"Error reading API payload after {stats['total_from_api']} items: {e}")
+            result = {'success': False, 'message': f"API data stream not as expected: {e}. Database not modified."}
+
+        if not result['success']:
+            # La transacción se revirtió: nada de lo borrado/creado/expirado quedó aplicado
+            stats.update({'created': 0, 'updated': 0, 'unchanged': 0, 'expired': 0, 'deleted': 0, 'batches': 0, 'positions': 0})
+        return result
+
+    def _measured(self, source, mode, run):
+        # Ejecuta un ciclo midiendo sus etapas; el resultado lleva 'metrics' y queda en IngestCycle
+        self._metrics = CycleMetrics()
+        result = run()
+        result['metrics'] = self._metrics.finish()
+        try:
+            IngestCycle.record(source, mode, result, getattr(settings, 'FLIGHTS_METRICS_HISTORY', DEFAULT_METRICS_HISTORY))
+        except Exception as e:
+            logger.warning(f"Could not record ingest cycle metrics: {e}")
+        return result
+
+    def update_database_from_api(self, mode=INGEST_MODE_UPSERT, limit=None, batch_size=UPSERT_BATCH_SIZE):
+        # limit=None procesa el snapshot completo; batch_size acota la memoria y el tamaño de cada escritura
+        if mode not in INGEST_MODES:
+            return {'success': False, 'message': f"Unknown ingest mode '{mode}'. Database not modified.", **EMPTY_STATS}
+        return self._measured('api', mode, lambda: self._update_from_api(mode, limit, batch_size))
+
+    def _update_from_api(self, mode, limit, batch_size):
+        # Las peticiones condicionales sólo aplican a ingestas completas: con `limit` el resultado depende del corte
+        use_fingerprint = limit is None
+        fingerprint = IngestState.source_fingerprint() if use_fingerprint else None
+        with self._metrics.stage('fetch'):
+            response = self._fetch_data_from_external_api(self._conditional_headers(fingerprint) if fingerprint else None)
+
+        if response is None:
+            # No se borran los datos si no se pudo obtener nada de la API
+            return {'success': False, 'message': 'Failed to fetch data from API. Database not modified.', **EMPTY_STATS}
+
+        if response.status_code == 304:
+            self._discard_body(response)
+            logger.info("Source not modified (HTTP 304). Skipping processing.")
+            return {'success': True, 'skipped': True, 'message': 'Source not modified (HTTP 304). Database not modified.', **EMPTY_STATS}
+
+        try:
+            with self._metrics.stage('fetch'):
+                body, payload_sha256, payload_bytes = self._download(response)
+        except _request_exception() as e:
+            logger.error(f"Error downloading data from API: {e}")
+            return {'success': False, 'message': f'Failed to download data from API: {e}. Database not modified.', **EMPTY_STATS}
+
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if fingerprint and payload_sha256 == fingerprint['payload_sha256']:
+            body.close()
+            IngestState.save_source_fingerprint(etag, last_modified, payload_sha256)
+            logger.info(f"Payload identical to the last ingested one (sha256 {payload_sha256[:12]}). Skipping processing.")
+            return {
+                'success': True, 'skipped': True, 'payload_bytes': payload_bytes,
+                'message': 'Payload unchanged since last ingest. Database not modified.', **EMPTY_STATS,
+            }
+
+        stats = {**EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {}, 'payload_bytes': payload_bytes}
+        logger.info(f"Processing {payload_bytes} bytes from API ({mode} mode, limit: {limit or 'none'}, batch size: {batch_size}).")
+
+        with body:
+            result = self._ingest_states(self._iter_api_states(body), mode, limit, batch_size, stats)
+
+        if result['success'] and use_fingerprint:
+            IngestState.save_source_fingerprint(etag, last_modified, payload_sha256)
+        stats.update(result)
+        logger.info(f"Flight data update complete ({mode}). Stats: {stats}")
+        return stats
+
+    def _fetch_tile(self, tile):
+        # Descarga y parsea una tesela; nunca lanza: el error queda en el informe de la tesela
+        report = {'tile': tile.name, 'success': False, 'latency': 0.0, 'rows': 0, 'bytes': 0, 'states': [], 'error': None}
+        started = time.monotonic()
+        try:
+            response = self._fetch_data_from_external_api(params=tile.params)
+            if response is None:
+                report['error'] = 'fetch failed'
+            else:
+                body, _, report['bytes'] = self._download(response)
+                with body:
+                    report['states'] = list(self._iter_api_states(body))
+                report['rows'] = len(report['states'])
+                report['success'] = True
+        except (ValueError, _request_exception()) as e:
+            report['error'] = str(e)
+        report['latency'] = time.monotonic() - started
+        if not report['success']:
+            logger.warning(f"Tile {tile.name} failed after {report['latency']:.2f}s: {report['error']}. Region marked stale.")
+        return report
+
+    def update_database_from_tiles(self, tiles, mode=INGEST_MODE_UPSERT, batch_size=UPSERT_BATCH_SIZE, max_workers=DEFAULT_TILE_WORKERS):
+        """
+        Pide cada tesela (bbox de OpenSky) en paralelo, deduplica por icao24 y
+        hace una sola ingesta. Una tesela que falla sólo deja su región sin
+        actualizar: sus vuelos no se expiran. En modo 'replace' cualquier fallo
+        aborta el ciclo, porque borrar todo perdería esas regiones.
+        """
+        if mode not in INGEST_MODES:
+            return {'success': False, 'message': f"Unknown ingest mode '{mode}'. Database not modified.", **EMPTY_STATS, 'tiles': []}
+        return self._measured('tiles', mode, lambda: self._update_from_tiles(tiles, mode, batch_size, max_workers))
+
+    def _update_from_tiles(self, tiles, mode, batch_size, max_workers):
+        # Las teselas se decodifican en los hilos: 'fetch' incluye su parseo JSON
+        with self._metrics.stage('fetch'), _thread_pool(max(1, min(max_workers, len(tiles)))) as executor:
+            reports = list(executor.map(self._fetch_tile, tiles))
+
+        failed = [tile for tile, report in zip(tiles, reports) if not report['success']]
+        tile_stats = [{key: value for key, value in report.items() if key != 'states'} for report in reports]
+        stats = {
+            **EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {},
+            'payload_bytes': sum(report['bytes'] for report in reports),
+            'tiles': tile_stats, 'stale_tiles': [tile.name for tile in failed],
+        }
+
+        if len(failed) == len(tiles):
+            stats.update({'success': False, 'message': 'All tiles failed. Database not modified.'})
+            return stats
+        if failed and mode == INGEST_MODE_REPLACE:
+            stats.update({'success': False, 'message': f"{len(failed)} tiles failed; replace mode needs every tile. Database not modified."})
+            return stats
+
+        states = merge_states(report.pop('states') for report in reports)
+        stats['duplicates'] = sum(report['rows'] for report in reports) - len(states)
+        logger.info(
+            f"Fetched {len(tiles) - len(failed)}/{len(tiles)} tiles: {len(states)} unique states "
+            f"({stats['duplicates']} cross-tile duplicates)."
+        )
+        result = self._ingest_states(iter(states), mode, None, batch_size, stats, stale_regions=failed)
+        stats.update(result)
+        if failed and result['success']:
+            stats['message'] += f" {len(failed)} tiles failed; their regions were not expired."
+        summary = {key: value for key, value in stats.items() if key != 'tiles'}
+        logger.info(f"Sharded flight data update complete ({mode}). Stats: {summary}")
+        return stats
+
+    def _fetch_source(self, source):
+        # Descarga (o lee del disco) y parsea una fuente; nunca lanza: el error queda en su informe
+        report = {
+            'source': source.name, 'parser': source.parser_name, 'success': False, 'latency': 0.0,
+            'rows': 0, 'bytes': 0, 'merged': 0, 'states': [], 'error': None,
+        }
+        started = time.monotonic()
+        try:
+            if source.path:
+                with open(source.path, 'rb') as body:
+                    report['bytes'] = os.fstat(body.fileno()).st_size
+                    report['states'] = list(self._iter_api_states(body, source.parser, source.name))
+                report['success'] = True
+            else:
+                response = self._fetch_data_from_external_api(params=source.params, url=source.url)
+                if response is None:
+                    report['error'] = 'fetch failed'
+                else:
+                    body, _, report['bytes'] = self._download(response)
+                    with body:
+                        report['states'] = list(self._iter_api_states(body, source.parser, source.name))
+                    report['success'] = True
+            report['rows'] = len(report['states'])
+        except (OSError, ValueError, _request_exception()) as e:
+            report['states'] = []
+            report['error'] = str(e)
+        report['latency'] = time.monotonic() - started
+        if not report['success']:
+            logger.warning(f"Source {source.name} failed after {report['latency']:.2f}s: {report['error']}.")
+        return report
+
+    def update_database_from_sources(self, sources, mode=INGEST_MODE_UPSERT, batch_size=UPSERT_BATCH_SIZE, max_workers=DEFAULT_SOURCE_WORKERS):
+        """
+        Lee varias fuentes (flights/sources.py) en paralelo, une sus estados por
+        aeronave quedándose con el last_contact más reciente y hace una sola
+        ingesta. raw_data['source'] guarda de qué fuente viene cada vuelo. Una
+        fuente que falla no deja expirar los vuelos de su región (o ninguno si
+        no declara bbox); en modo 'replace' cualquier fallo aborta el ciclo.
+        """
+        if mode not in INGEST_MODES:
+            return {'success': False, 'message': f"Unknown ingest mode '{mode}'. Database not modified.", **EMPTY_STATS, 'sources': []}
+        if not sources:
+            return {'success': False, 'message': 'No sources configured. Database not modified.', **EMPTY_STATS, 'sources': []}
+        return self._measured('sources', mode, lambda: self._update_from_sources(sources, mode, batch_size, max_workers))
+
+    def _update_from_sources(self, sources, mode, batch_size, max_workers):
+        # Como en las teselas, cada fuente se parsea en su hilo: 'fetch' incluye la decodificación
+        with self._metrics.stage('fetch'), _thread_pool(max(1, min(max_workers, len(sources)))) as executor:
+            reports = list(executor.map(self._fetch_source, sources))
+
+        failed = [source for source, report in zip(sources, reports) if not report['success']]
+        stats = {
+            **EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {},
+            'payload_bytes': sum(report['bytes'] for report in reports),
+            'sources': reports, 'stale_sources': [source.name for source in failed],
+        }
+
+        if len(failed) == len(sources):
+            stats.update({'success': False, 'message': 'All sources failed. Database not modified.'})
+            return stats
+        if failed and mode == INGEST_MODE_REPLACE:
+            stats.update({'success': False, 'message': f"{len(failed)} sources failed; replace mode needs every source. Database not modified."})
+            return stats
+
+        with self._metrics.stage('decode'):
+            states = merge_states(report.pop('states') for report in reports)
+            merged_by_source = Counter(getattr(state, 'source', None) for state in states)
+        for report in reports:
+            report['merged'] = merged_by_source.get(report['source'], 0)
+        stats['duplicates'] = sum(report['rows'] for report in reports) - len(states)
+        logger.info(
+            f"Read {len(sources) - len(failed)}/{len(sources)} sources: {len(states)} unique states "
+            f"({stats['duplicates']} seen by more than one source)."
+        )
+
+        stale_regions = [source.coverage for source in failed]
+        expire = None not in stale_regions
+        result = self._ingest_states(
+            iter(states), mode, None, batch_size, stats,
+            stale_regions=stale_regions if expire else (), expire=expire,
+        )
+        stats.update(result)
+        if failed and result['success']:
+            stats['message'] += f" {len(failed)} sources failed; their flights were not expired."
+        summary = {key: value for key, value in stats.items() if key != 'sources'}
+        logger.info(f"Multi-source flight data update complete ({mode}). Stats: {summary}")
+        return stats
+
+
+class FlightHistoryService:
+    # Retención y compactación del histórico de posiciones (FlightPosition)
+
+    def compact(self, retention_days=7, downsample_after_hours=24, interval_seconds=300, now=None):
+        now = now or django_timezone.now()
+        current_bucket = history_bucket_for(now)
+        retention_cutoff = current_bucket - retention_days * 24 * 3600 // HISTORY_BUCKET_SECONDS
+        downsample_cutoff = current_bucket - downsample_after_hours * 3600 // HISTORY_BUCKET_SECONDS
+
+        # 1) Retención: se borran buckets completos, el filtro usa el índice por bucket
+        try:
+            num_expired, _ = FlightPosition.objects.filter(bucket__lt=retention_cutoff).delete()
+            logger.info(f"Deleted {num_expired} history positions older than {retention_days} days.")
+        except Exception as e:
+            logger.error(f"Error deleting old history positions: {e}")
+            return {'success': False, 'message': f"Error deleting old history positions: {e}", 'deleted': 0, 'downsampled': 0, 'buckets': 0}
+
+        # 2) Compactación: en los buckets viejos se deja una posición por vuelo y por intervalo
+        buckets = list(
+            FlightPosition.objects.filter(bucket__gte=retention_cutoff, bucket__lt=downsample_cutoff)
+            .values_list('bucket', flat=True).distinct().order_by('bucket')
+        )
+        num_downsampled = 0
+        try:
+            for bucket in buckets:
+                num_downsampled += self._downsample_bucket(bucket, interval_seconds)
+        except Exception as e:
+            logger.error(f"Error downsampling history positions: {e}")
+            return {'success': False, 'message': f"Error downsampling history positions: {e}", 'deleted': num_expired, 'downsampled': num_downsampled, 'buckets': len(buckets)}
+
+        logger.info(f"History compaction finished. Deleted: {num_expired}. Downsampled: {num_downsampled} in {len(buckets)} buckets.")
         return {
             'success': True,
-            'message': 'Data update process finished (delete and reload).',
-            'created': created_count,
-            'deleted': num_deleted,
-            'processed': processed_in_batch,
-            'total_from_api': len(api_data_list_full)
-        }
\ No newline at end of file
+            'message': 'History compaction finished.',
+            'deleted': num_expired,
+            'downsampled': num_downsampled,
+            'buckets': len(buckets),
+        }
+
+    @transaction.atomic
+    def _downsample_bucket(self, bucket, interval_seconds):
+        rows = (
+            FlightPosition.objects.filter(bucket=bucket)
+            .order_by('flight_id', 'timestamp')
+            .values_list('id', 'flight_id', 'timestamp')
+        )
+        kept_slots = set()
+        redundant_ids = []
+        for position_id, flight_id, timestamp in rows.iterator(chunk_size=UPSERT_BATCH_SIZE):
+            slot = (flight_id, int(timestamp.timestamp()) // interval_seconds)
+            if slot in kept_slots:
+                redundant_ids.append(position_id)
+            else:
+                kept_slots.add(slot)
+
+        for start in range(0, len(redundant_ids), UPSERT_BATCH_SIZE):
+            FlightPosition.objects.filter(id__in=redundant_ids[start:start + UPSERT_BATCH_SIZE]).delete()
+        return len(redundant_ids)
@@ -0,0 +1,76 @@
+# flights/sharding.py
+# División del mundo en teselas lat/lon para pedir /states/all por regiones en paralelo.
+
+from django.db.models import Q
+
+# Índices del state vector de OpenSky usados para deduplicar
+ICAO24_INDEX = 0
+LAST_CONTACT_INDEX = 4
+
+
+class Tile:
+    def __init__(self, lamin, lomin, lamax, lomax):
+        self.lamin, self.lomin, self.lamax, self.lomax = lamin, lomin, lamax, lomax
+
+    @property
+    def name(self):
+        return f"[{self.lamin:g},{self.lomin:g}]..[{self.lamax:g},{self.lomax:g}]"
+
+    @property
+    def params(self):
+        # Parámetros de bounding box de la API de OpenSky
+        return {'lamin': self.lamin, 'lomin': self.lomin, 'lamax': self.lamax, 'lomax': self.lomax}
+
+    def region_q(self):
+        # Filtro de FlightData para las posiciones dentro de la tesela
+        return Q(
+            latitude__gte=self.lamin, latitude__lte=self.lamax,
+            longitude__gte=self.lomin, longitude__lte=self.lomax,
+        )
+
+    def __repr__(self):
+        return f"Tile({self.name})"
+
+
+def build_tiles(lat_divisions, lon_divisions):
+    """Divide el mundo en ``lat_divisions`` x ``lon_divisions`` teselas del mismo tamaño."""
+    if lat_divisions < 1 or lon_divisions < 1:
+        raise ValueError('Tile divisions must be positive integers.')
+    lat_step = 180.0 / lat_divisions
+    lon_step = 360.0 / lon_divisions
+    return [
+        Tile(
+            round(-90.0 + row * lat_step, 6), round(-180.0 + column * lon_step, 6),
+            round(-90.0 + (row + 1) * lat_step, 6), round(-180.0 + (column + 1) * lon_step, 6),
+        )
+        for row in range(lat_divisions)
+        for column in range(lon_divisions)
+    ]
+
+
+def _last_contact(state):
+    value = state[LAST_CONTACT_INDEX] if len(state) > LAST_CONTACT_INDEX else None
+    return value if isinstance(value, (int, float)) else float('-inf')
+
+
+def merge_states(state_lists):
+    """
+    Une los estados de varias teselas o fuentes deduplicando por icao24: una
+    aeronave en el borde de dos teselas, o vista por dos fuentes, se queda con
+    el estado de last_contact más reciente; con el mismo last_contact gana la
+    primera lista. Una sola pasada con un dict: O(n) en el total de estados.
+    Los elementos que no son listas o no tienen icao24 se pasan tal cual para
+    que la normalización los rechace con su motivo.
+    """
+    merged = {}
+    passthrough = []
+    for states in state_lists:
+        for state in states:
+            if not isinstance(state, list) or not state or not state[ICAO24_INDEX]:
+                passthrough.append(state)
+                continue
+            key = state[ICAO24_INDEX]
+            current = merged.get(key)
+            if current is None or _last_contact(state) > _last_contact(current):
+                merged[key] = state
+    return list(merged.values()) + passthrough
@@ -0,0 +1,240 @@
+# flights/snapshot.py
+# Caché en memoria del proceso, versionada por IngestState.version.
+# Sustituye a cache_page + DatabaseCache: un acierto no toca la base de datos más
+# allá de leer la versión, y la invalidación ocurre justo cuando la ingesta confirma
+# nuevos datos (la versión cambia en la misma transacción).
+
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from .models import FlightData, IngestState
+from .pagination import timestamp_key
+from .serializers import FlightDataSerializer
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_HISTORY_SIZE = 4
+# Lecturas optimistas de build_snapshot antes de bloquear la fila de IngestState
+SNAPSHOT_READ_ATTEMPTS = 3
+
+# Campos cuyo cambio convierte a una aeronave en "moved" en un delta
+DELTA_FIELDS = ('latitude', 'longitude', 'altitude', 'speed', 'heading', 'timestamp')
+
+
+# Campos que se omiten con ?compact=1 (raw_data sólo aparece si se carga aparte)
+COMPACT_EXCLUDED_FIELDS = ('raw_data',)
+
+
+def project_row(row, fields=None, compact=False):
+    # Copia del dict con sólo los campos pedidos (fields tiene prioridad sobre compact)
+    if fields is not None:
+        return {name: row[name] for name in fields if name in row}
+    if compact:
+        return {name: value for name, value in row.items() if name not in COMPACT_EXCLUDED_FIELDS}
+    return row
+
+
+class FlightSnapshot:
+    """
+    Vista inmutable de los vuelos activos para una versión: ``rows`` en el orden
+    del listado y ``by_id`` (id -> posición) para el detalle. Cada fila se
+    renderiza a JSON una sola vez, completa (``fragments``) y sin los campos de
+    COMPACT_EXCLUDED_FIELDS (``compact_fragments``, la misma tupla si las filas
+    no los tienen); las páginas se arman uniendo esos bytes.
+    Los dicts no deben modificarse.
+    """
+
+    def __init__(self, version, rows, keys=()):
+        self.version = version
+        self.rows = tuple(rows)
+        # Claves (timestamp_us, id) en el mismo orden que rows, para la paginación keyset
+        self.keys = tuple(keys)
+        self.by_id = {row['id']: index for index, row in enumerate(self.rows)}
+        renderer = JSONRenderer()
+        self.fragments = tuple(renderer.render(row) for row in self.rows)
+        if self.rows and any(name in self.rows[0] for name in COMPACT_EXCLUDED_FIELDS):
+            self.compact_fragments = tuple(renderer.render(project_row(row, compact=True)) for row in self.rows)
+        else:
+            # raw_data vive en FlightRawData: las filas del snapshot ya son compactas
+            self.compact_fragments = self.fragments
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def diff_snapshots(previous, current, fields=DELTA_FIELDS):
+    """
+    Compara dos snapshots por flight_id. Devuelve ``(added, moved, removed)``:
+    índices en ``current`` de las aeronaves nuevas, pares ``(índice en current,
+    fila anterior)`` de las que cambiaron algún campo de ``fields`` y filas de
+    ``previous`` que ya no están.
+    """
+    before_by_id = {row['flight_id']: row for row in previous.rows}
+    added, moved = [], []
+    for index, row in enumerate(current.rows):
+        before = before_by_id.pop(row['flight_id'], None)
+        if before is None:
+            added.append(index)
+        elif any(row[name] != before[name] for name in fields):
+            moved.append((index, before))
+    return added, moved, list(before_by_id.values())
+
+
+def _active_flights():
+    # Vuelos activos en el orden del listado (-timestamp, -id)
+    return list(FlightData.objects.filter(expired_at__isnull=True).order_by('-timestamp', '-id'))
+
+
+def build_snapshot(version):
+    """
+    FlightSnapshot con las filas que corresponden exactamente a su versión.
+    ``version`` es la que leyó quien lo pide; si la ingesta confirma otra antes
+    de que termine la consulta, las filas se vuelven a leer y el snapshot lleva
+    la versión nueva. Cada ciclo confirma sus filas y su versión en la misma
+    transacción, así que la misma versión antes y después de la consulta
+    garantiza que las filas son las suyas. Si sigue cambiando, se lee con la
+    fila de IngestState bloqueada (FOR UPDATE) para que no pueda confirmarse
+    otra versión entre las dos lecturas.
+    """
+    for _ in range(SNAPSHOT_READ_ATTEMPTS):
+        flights = _active_flights()
+        current = IngestState.current_version()
+        if current == version:
+            break
+        version = current
+    else:
+        with transaction.atomic():
+            version = IngestState.objects.select_for_update().filter(pk=1).values_list('version', flat=True).first() or 0
+            flights = _active_flights()
+    keys = [(timestamp_key(flight.timestamp), flight.pk) for flight in flights]
+    return FlightSnapshot(version, FlightDataSerializer(flights, many=True).data, keys)
+
+
+class SnapshotCache:
+    """
+    Guarda un FlightSnapshot y un LRU acotado de respuestas derivadas (filtros,
+    tracks) para la versión actual, más los datos derivados de toda la flota que
+    no deben salir del LRU (``get_pinned``). Cuando llega una versión distinta se
+    descarta todo de una vez; el snapshot saliente pasa a un historial de
+    ``history_size`` versiones para poder calcular deltas (``get_history``).
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, history_size=DEFAULT_HISTORY_SIZE):
+        self.max_entries = max_entries
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._version = None
+        self._snapshot = None
+        self._pinned = {}
+        self._entries = OrderedDict()
+        self._history = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _sync_version(self, version):
+        # Llamar con el lock tomado. La caché sólo avanza: con una versión anterior a la
+        # actual (una petición que la leyó antes de otro ciclo) devuelve False y no toca nada
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            if self._version is not None:
+                self.invalidations += 1
+            if self._snapshot is not None and self.history_size:
+                self._history[self._snapshot.version] = self._snapshot
+                while len(self._history) > self.history_size:
+                    self._history.popitem(last=False)
+            self._version = version
+            self._snapshot = None
+            self._pinned.clear()
+            self._entries.clear()
+        return True
+
+    def get_snapshot(self, version, builder):
+        """
+        builder(version) -> FlightSnapshot; se construye fuera del lock. El
+        snapshot devuelto puede ser de una versión posterior a ``version`` (ver
+        build_snapshot): quien responde debe usar ``snapshot.version``.
+        """
+        with self._lock:
+            self._sync_version(version)
+            if self._snapshot is not None:
+                self.hits += 1
+                return self._snapshot
+            self.misses += 1
+        snapshot = builder(version)
+        with self._lock:
+            # Si otra petición ya vio una versión posterior, este snapshot no se guarda
+            if self._sync_version(snapshot.version) and self._snapshot is None:
+                self._snapshot = snapshot
+        return snapshot
+
+    def get_pinned(self, version, key, builder):
+        # Como get_snapshot, para otro valor por versión (p. ej. FleetMotion): fuera del LRU
+        with self._lock:
+            if self._sync_version(version) and key in self._pinned:
+                self.hits += 1
+                return self._pinned[key]
+            self.misses += 1
+        value = builder()
+        with self._lock:
+            if self._version == version:
+                value = self._pinned.setdefault(key, value)
+        return value
+
+    def get_history(self, version):
+        # Snapshot de una versión ya vista por este proceso, o None
+        with self._lock:
+            if self._snapshot is not None and self._snapshot.version == version:
+                return self._snapshot
+            return self._history.get(version)
+
+    def get_or_build(self, version, key, builder):
+        # builder() -> valor a cachear para (version, key); el de una versión anterior no se guarda
+        with self._lock:
+            if self._sync_version(version) and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = builder()
+        with self._lock:
+            if self._version != version:
+                return value
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._snapshot = None
+            self._pinned.clear()
+            self._entries.clear()
+            self._history.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self._version,
+                'snapshot_rows': len(self._snapshot) if self._snapshot is not None else 0,
+                'pinned': list(self._pinned),
+                'entries': len(self._entries),
+                'history': list(self._history),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+snapshot_cache = SnapshotCache(
+    getattr(settings, 'FLIGHTS_SNAPSHOT_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+    getattr(settings, 'FLIGHTS_SNAPSHOT_HISTORY', DEFAULT_HISTORY_SIZE),
+)
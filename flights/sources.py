@@ -0,0 +1,300 @@
+# flights/sources.py
+# Fuentes de posiciones y sus parsers. Cada parser registrado convierte el
+# formato de su fuente (arrays de OpenSky, JSON con un objeto por vuelo, líneas
+# SBS/BaseStation) en state vectors con el orden posicional de OpenSky, que es
+# lo que entiende la normalización por lotes (flights/normalizer.py). Añadir un
+# feed es registrar un parser: la normalización, el upsert y el snapshot no cambian.
+
+import calendar
+import json
+import logging
+import time
+from .normalizer import OPENSKY_FIELD_NAMES, SourceState
+from .sharding import Tile
+from .streaming import iter_json_array_items, iter_lines
+
+logger = logging.getLogger(__name__)
+
+FEET_TO_METERS = 0.3048
+KNOTS_TO_MPS = 1852.0 / 3600.0
+FEET_PER_MINUTE_TO_MPS = 0.3048 / 60.0
+
+FIELD_INDEX = {name: index for index, name in enumerate(OPENSKY_FIELD_NAMES)}
+# Valores de un state vector recién creado (sin datos salvo los booleanos y la fuente de posición)
+EMPTY_STATE = (None, None, None, None, None, None, None, None, False, None, None, None, None, None, None, False, 0)
+
+PARSERS = {}
+
+
+def register_parser(name):
+    """Registra una clase parser con ``name``, el valor de 'parser' en la configuración de una fuente."""
+    def decorator(cls):
+        cls.parser_name = name
+        PARSERS[name] = cls
+        return cls
+    return decorator
+
+
+def get_parser(name, **options):
+    try:
+        parser_class = PARSERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown source parser '{name}'. Available: {', '.join(sorted(PARSERS))}.")
+    try:
+        return parser_class(**options)
+    except TypeError as e:
+        raise ValueError(f"Invalid options for source parser '{name}': {e}")
+
+
+class SourceParser:
+    """
+    ``parse(chunks, source)`` recibe el cuerpo de la fuente en trozos (bytes) y
+    genera state vectors; con ``source`` cada uno es un SourceState de esa fuente.
+    Los elementos mal formados se dejan pasar para que la normalización los
+    rechace con su motivo.
+    """
+    parser_name = None
+
+    def parse(self, chunks, source=None):
+        raise NotImplementedError
+
+
+@register_parser('opensky')
+class OpenSkyParser(SourceParser):
+    # /states/all: {"time": ..., "states": [[icao24, callsign, ...], ...]}
+
+    def __init__(self, key='states'):
+        self.key = key
+
+    def parse(self, chunks, source=None):
+        items = iter_json_array_items(chunks, self.key)
+        if source is None:
+            return items
+        return (SourceState(item, source) if isinstance(item, list) else item for item in items)
+
+
+def _scaled(value, factor):
+    return value * factor if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+
+
+@register_parser('json')
+class JsonFeedParser(SourceParser):
+    """
+    JSON con un objeto por vuelo en el array ``key``. ``fields`` da, para cada
+    campo de OpenSky, la clave que usa el feed (por defecto el mismo nombre) y
+    ``scale`` el factor que pasa sus valores numéricos a las unidades de OpenSky
+    (metros, m/s).
+    """
+
+    def __init__(self, key='aircraft', fields=None, scale=None):
+        fields, scale = fields or {}, scale or {}
+        unknown = (set(fields) | set(scale)) - set(OPENSKY_FIELD_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown OpenSky fields: {', '.join(sorted(unknown))}.")
+        self.key = key
+        self.columns = [fields.get(name, name) for name in OPENSKY_FIELD_NAMES]
+        self.scale = [(FIELD_INDEX[name], factor) for name, factor in scale.items()]
+
+    def _state(self, record, source):
+        values = map(record.get, self.columns)
+        state = SourceState(values, source) if source is not None else list(values)
+        for index, factor in self.scale:
+            state[index] = _scaled(state[index], factor)
+        return state
+
+    def parse(self, chunks, source=None):
+        for record in iter_json_array_items(chunks, self.key):
+            yield self._state(record, source) if isinstance(record, dict) else record
+
+
+@register_parser('dump1090')
+class Dump1090Parser(SourceParser):
+    """
+    aircraft.json de dump1090/readsb: {"now": ..., "aircraft": [{"hex", "flight",
+    "lat", "lon", "alt_baro", "gs", ...}]}, con altitudes en pies, velocidades en
+    nudos y las edades "seen"/"seen_pos" relativas a "now". Son feeds de un
+    receptor local (cientos de aeronaves): se decodifican de una vez.
+    """
+
+    def parse(self, chunks, source=None):
+        try:
+            document = json.loads(b''.join(chunks))
+        except ValueError as e:
+            raise ValueError(f"Malformed dump1090 JSON: {e}")
+        if not isinstance(document, dict) or not isinstance(document.get('aircraft'), list):
+            raise ValueError("dump1090 JSON has no 'aircraft' list")
+        now = document.get('now')
+        now = now if isinstance(now, (int, float)) else time.time()
+        for record in document['aircraft']:
+            yield self._state(record, now, source) if isinstance(record, dict) else record
+
+    def _state(self, record, now, source):
+        state = SourceState(EMPTY_STATE, source) if source is not None else list(EMPTY_STATE)
+        get = record.get
+        altitude = get('alt_baro')
+        seen, seen_pos = get('seen'), get('seen_pos')
+        state[0] = get('hex')
+        state[1] = get('flight')
+        state[4] = now - seen if isinstance(seen, (int, float)) else now
+        if get('lat') is not None and get('lon') is not None:
+            state[5], state[6] = get('lon'), get('lat')
+            state[3] = now - seen_pos if isinstance(seen_pos, (int, float)) else state[4]
+        if altitude == 'ground':
+            state[8] = True
+        else:
+            state[7] = _scaled(altitude, FEET_TO_METERS)
+        state[9] = _scaled(get('gs'), KNOTS_TO_MPS)
+        state[10] = get('track')
+        rate = get('baro_rate', get('geom_rate'))
+        state[11] = _scaled(rate, FEET_PER_MINUTE_TO_MPS)
+        state[13] = _scaled(get('alt_geom'), FEET_TO_METERS)
+        state[14] = get('squawk')
+        return state
+
+
+# Columnas de un mensaje SBS-1 (BaseStation, puerto 30003 de dump1090)
+SBS_MIN_FIELDS = 22
+SBS_HEX, SBS_DATE, SBS_TIME = 4, 6, 7
+SBS_CALLSIGN, SBS_ALTITUDE, SBS_SPEED, SBS_TRACK = 10, 11, 12, 13
+SBS_LATITUDE, SBS_LONGITUDE, SBS_VERTICAL_RATE, SBS_SQUAWK, SBS_SPI, SBS_ON_GROUND = 14, 15, 16, 17, 20, 21
+SBS_TRUE = ('-1', '1')
+
+
+def _sbs_number(text, factor=1.0):
+    # Un valor no numérico se deja como texto: la normalización rechaza la fila con su motivo
+    try:
+        return float(text) * factor
+    except ValueError:
+        return text
+
+
+@register_parser('sbs')
+class SbsParser(SourceParser):
+    """
+    Líneas CSV SBS-1/BaseStation ("MSG,<tipo>,..."). Cada mensaje trae sólo
+    algunos campos (posición, velocidad, identificación...): se acumulan por
+    aeronave en una pasada y se emite un state vector por aeronave con los
+    últimos valores de cada campo. Fecha y hora del mensaje se toman como UTC.
+    Las líneas que no son MSG (SEL, ID, AIR, STA, CLK) se ignoran.
+    """
+
+    def parse(self, chunks, source=None):
+        aircraft = {}
+        day_epochs = {}
+        for line in iter_lines(chunks):
+            fields = line.split(',')
+            if fields[0] != 'MSG':
+                continue
+            if len(fields) < SBS_MIN_FIELDS or not fields[SBS_HEX]:
+                yield line # mensaje mal formado: la normalización lo rechaza
+                continue
+            key = fields[SBS_HEX].strip().lower()
+            state = aircraft.get(key)
+            if state is None:
+                state = SourceState(EMPTY_STATE, source) if source is not None else list(EMPTY_STATE)
+                state[0] = key
+                aircraft[key] = state
+
+            contact = self._epoch(fields[SBS_DATE], fields[SBS_TIME], day_epochs)
+            if contact is not None and (state[4] is None or contact >= state[4]):
+                state[4] = contact
+            if fields[SBS_CALLSIGN]:
+                state[1] = fields[SBS_CALLSIGN]
+            if fields[SBS_ALTITUDE]:
+                state[7] = _sbs_number(fields[SBS_ALTITUDE], FEET_TO_METERS)
+            if fields[SBS_SPEED]:
+                state[9] = _sbs_number(fields[SBS_SPEED], KNOTS_TO_MPS)
+            if fields[SBS_TRACK]:
+                state[10] = _sbs_number(fields[SBS_TRACK])
+            if fields[SBS_LATITUDE] and fields[SBS_LONGITUDE]:
+                state[6] = _sbs_number(fields[SBS_LATITUDE])
+                state[5] = _sbs_number(fields[SBS_LONGITUDE])
+                state[3] = contact
+            if fields[SBS_VERTICAL_RATE]:
+                rate = _sbs_number(fields[SBS_VERTICAL_RATE], FEET_PER_MINUTE_TO_MPS)
+                state[11] = rate if isinstance(rate, float) else None
+            if fields[SBS_SQUAWK]:
+                state[14] = fields[SBS_SQUAWK]
+            if fields[SBS_SPI]:
+                state[15] = fields[SBS_SPI] in SBS_TRUE
+            if fields[SBS_ON_GROUND]:
+                state[8] = fields[SBS_ON_GROUND].strip() in SBS_TRUE
+        yield from aircraft.values()
+
+    def _epoch(self, day, clock, day_epochs):
+        # "2024/01/31" + "12:34:56.789" -> segundos epoch; la fecha se convierte una vez
+        try:
+            midnight = day_epochs.get(day)
+            if midnight is None:
+                midnight = day_epochs[day] = calendar.timegm(time.strptime(day, '%Y/%m/%d'))
+            hours, minutes, seconds = clock.split(':')
+            return midnight + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        except ValueError:
+            return None
+
+
+class Source:
+    """
+    Una fuente configurada: ``url`` (HTTP, con la sesión del servicio), ``path``
+    (fichero local, p. ej. un volcado SBS) o ninguna de las dos para usar
+    EXTERNAL_API_URL. ``bbox`` (lamin, lomin, lamax, lomax) es la región que
+    cubre: si la fuente falla, los vuelos de esa región no se expiran en el
+    ciclo; sin ``bbox`` una fuente caída no deja expirar ningún vuelo.
+    """
+
+    def __init__(self, name, parser='opensky', url=None, path=None, params=None, bbox=None, options=None):
+        if url and path:
+            raise ValueError(f"Source '{name}' sets both url and path.")
+        self.name = name
+        self.parser = get_parser(parser, **(options or {}))
+        self.url = url
+        self.path = path
+        self.params = params
+        self.coverage = Tile(*bbox) if bbox else None
+
+    @property
+    def parser_name(self):
+        return self.parser.parser_name
+
+    def __repr__(self):
+        return f"Source({self.name}, {self.parser_name})"
+
+
+def load_source_configs(value):
+    """
+    Lista de configuraciones de fuente a partir de ``value``: el JSON del setting
+    FLIGHTS_INGEST_SOURCES o una lista ya decodificada. Lanza ValueError si no es
+    un array JSON.
+    """
+    if isinstance(value, (str, bytes)):
+        try:
+            value = json.loads(value or '[]')
+        except ValueError as e:
+            raise ValueError(f"Malformed JSON: {e}")
+    if not isinstance(value, (list, tuple)):
+        raise ValueError(f"Expected a list of sources, got {type(value).__name__}.")
+    return list(value)
+
+
+def build_sources(configs):
+    """
+    Lista de Source a partir de dicts con las claves de Source, o del JSON que
+    los contiene (p. ej. el setting FLIGHTS_INGEST_SOURCES). Lanza ValueError si
+    alguna no es válida.
+    """
+    sources = []
+    configs = load_source_configs(configs)
+    for index, config in enumerate(configs):
+        if not isinstance(config, dict):
+            raise ValueError(f"Source #{index + 1} must be an object, got {type(config).__name__}.")
+        config = dict(config)
+        name = config.pop('name', None) or f"{config.get('parser', 'opensky')}-{index + 1}"
+        try:
+            sources.append(Source(name, **config))
+        except TypeError as e:
+            raise ValueError(f"Invalid configuration for source '{name}': {e}")
+    names = [source.name for source in sources]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"Duplicated source names: {', '.join(duplicated)}.")
+    return sources
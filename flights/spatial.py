@@ -0,0 +1,108 @@
+# flights/spatial.py
+# Índice espacial por celdas de una rejilla lat/lon fija. Funciona igual en SQLite
+# y Postgres (sin PostGIS): la celda es un entero indexado en FlightData.grid_cell.
+
+import math
+from django.db.models import Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+GRID_CELL_DEGREES = 1.0
+GRID_ROWS = int(180 / GRID_CELL_DEGREES)
+GRID_COLUMNS = int(360 / GRID_CELL_DEGREES)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def _row_for(latitude):
+    return min(max(int(math.floor((latitude + 90.0) / GRID_CELL_DEGREES)), 0), GRID_ROWS - 1)
+
+
+def _column_for(longitude):
+    return min(max(int(math.floor((longitude + 180.0) / GRID_CELL_DEGREES)), 0), GRID_COLUMNS - 1)
+
+
+def grid_cell_for(latitude, longitude):
+    # None si la posición no es válida (nula, NaN o fuera de rango)
+    if latitude is None or longitude is None:
+        return None
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        return None
+    return _row_for(latitude) * GRID_COLUMNS + _column_for(longitude)
+
+
+def bbox_cell_ranges(min_lon, min_lat, max_lon, max_lat):
+    """
+    Rangos contiguos ``(primera_celda, última_celda)`` que cubren el bbox: uno por
+    fila de la rejilla, o dos si el bbox cruza el antimeridiano (min_lon > max_lon).
+    """
+    if min_lon <= max_lon:
+        column_spans = [(_column_for(min_lon), _column_for(max_lon))]
+    else:
+        column_spans = [(_column_for(min_lon), GRID_COLUMNS - 1), (0, _column_for(max_lon))]
+    ranges = []
+    for row in range(_row_for(min_lat), _row_for(max_lat) + 1):
+        base = row * GRID_COLUMNS
+        ranges.extend((base + first, base + last) for first, last in column_spans)
+    return ranges
+
+
+def filter_bbox(queryset, min_lon, min_lat, max_lon, max_lat):
+    # Primero se acota por celdas (índice) y después por las coordenadas exactas
+    cells = Q()
+    for first, last in bbox_cell_ranges(min_lon, min_lat, max_lon, max_lat):
+        cells |= Q(grid_cell=first) if first == last else Q(grid_cell__range=(first, last))
+    queryset = queryset.filter(cells, latitude__gte=min_lat, latitude__lte=max_lat)
+    if min_lon <= max_lon:
+        return queryset.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+    return queryset.filter(Q(longitude__gte=min_lon) | Q(longitude__lte=max_lon))
+
+
+def bbox_contains(bbox, latitude, longitude):
+    # Mismo criterio que filter_bbox, en Python (para filtrar filas ya cargadas)
+    if latitude is None or longitude is None:
+        return False
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if not min_lat <= latitude <= max_lat:
+        return False
+    if min_lon <= max_lon:
+        return min_lon <= longitude <= max_lon
+    return longitude >= min_lon or longitude <= max_lon
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    # bbox que contiene el círculo; cerca de los polos abarca todas las longitudes
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    min_lat, max_lat = max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if min_lat <= -90.0 or max_lat >= 90.0 or cos_lat <= 0.0:
+        return -180.0, min_lat, 180.0, max_lat
+    lon_delta = radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+    if lon_delta >= 180.0:
+        return -180.0, min_lat, 180.0, max_lat
+    min_lon, max_lon = longitude - lon_delta, longitude + lon_delta
+    if min_lon < -180.0:
+        min_lon += 360.0
+    if max_lon > 180.0:
+        max_lon -= 360.0
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    # Misma fórmula que filter_near, en Python (para posiciones que no están en la base de datos)
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    value = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(value), 1.0))
+
+
+def filter_near(queryset, latitude, longitude, radius_km):
+    # bbox por celdas + distancia haversine exacta calculada en la base de datos
+    queryset = filter_bbox(queryset, *radius_bbox(latitude, longitude, radius_km))
+    lat_rad, lon_rad = math.radians(latitude), math.radians(longitude)
+    haversine = (
+        Power(Sin((Radians('latitude') - lat_rad) / 2), 2.0)
+        + math.cos(lat_rad) * Cos(Radians('latitude')) * Power(Sin((Radians('longitude') - lon_rad) / 2), 2.0)
+    )
+    # Least() evita que el redondeo deje el argumento de ASIN por encima de 1
+    distance = 2 * EARTH_RADIUS_KM * ASin(Least(Sqrt(haversine), Value(1.0)))
+    return queryset.annotate(distance_km=distance).filter(distance_km__lte=radius_km)
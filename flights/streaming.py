@@ -0,0 +1,119 @@
+# flights/streaming.py
+# Utilidades para leer respuestas JSON grandes sin cargarlas completas en memoria.
+
+import codecs
+import json
+import re
+
+# Cuánto texto ya consumido se tolera en el buffer antes de recortarlo
+_BUFFER_TRIM_THRESHOLD = 64 * 1024
+# Tamaño máximo de un elemento del array: un estado de OpenSky ocupa unos cientos de caracteres
+MAX_ITEM_CHARS = 1024 * 1024
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_json_array_items(chunks, key, max_item_chars=MAX_ITEM_CHARS):
+    """
+    Genera uno a uno los elementos del array ``key`` de un objeto JSON que llega
+    en trozos (bytes o str), p. ej. ``response.iter_content()``.
+
+    Sólo se mantiene en memoria el elemento que se está decodificando más un
+    trozo de lectura. Lanza ``ValueError`` si la clave no existe, no es un
+    array, el JSON está truncado/mal formado o un elemento supera
+    ``max_item_chars`` caracteres (un elemento roto no hace crecer el buffer
+    hasta el final de la respuesta).
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    key_pattern = re.compile(r'"%s"\s*:\s*' % re.escape(key))
+    chunks = iter(chunks)
+    buffer = ''
+    exhausted = False
+
+    def read_more():
+        nonlocal buffer, exhausted
+        for chunk in chunks:
+            text = utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                buffer += text
+                return True
+        buffer += utf8.decode(b'', final=True)
+        exhausted = True
+        return False
+
+    # 1) Buscar la clave y el inicio del array
+    while True:
+        match = key_pattern.search(buffer)
+        if match and match.end() < len(buffer):
+            pos = match.end()
+            break
+        if not read_more():
+            raise ValueError(f"Key '{key}' not found in JSON stream")
+        if not match and len(buffer) > _BUFFER_TRIM_THRESHOLD:
+            buffer = buffer[-(len(key) + 64):]
+
+    if buffer[pos] != '[':
+        raise ValueError(f"Value of '{key}' in JSON stream is not a list")
+    pos += 1
+
+    # 2) Decodificar elemento por elemento
+    expect_item = True
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buffer):
+            if not read_more():
+                raise ValueError(f"Unexpected end of JSON stream inside '{key}'")
+            continue
+
+        char = buffer[pos]
+        if char == ']':
+            return
+        if not expect_item:
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' in '{key}' at position {pos}")
+            pos += 1
+            expect_item = True
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            end = None
+        # Elemento incompleto, o un número al final del buffer que podría seguir: se lee más
+        if end is None or (end == len(buffer) and not exhausted):
+            if len(buffer) - pos > max_item_chars:
+                raise ValueError(f"Item in '{key}' is malformed or longer than {max_item_chars} characters")
+            if read_more() or end is not None:
+                continue
+            raise ValueError(f"Malformed or truncated item in '{key}'")
+
+        yield item
+        pos = end
+        expect_item = False
+        if pos > _BUFFER_TRIM_THRESHOLD:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def iter_lines(chunks):
+    """
+    Genera las líneas (str, sin el salto de línea) de un flujo de texto que llega
+    en trozos (bytes o str). Las líneas vacías se omiten.
+    """
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    for chunk in chunks:
+        text = utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if not text:
+            continue
+        lines = (pending + text).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            line = line.rstrip('\r')
+            if line:
+                yield line
+    pending = (pending + utf8.decode(b'', final=True)).rstrip('\r')
+    if pending:
+        yield pending
+
@@ -0,0 +1,153 @@
+# flights/synthetic.py
+# Generador determinista de payloads sintéticos con el formato de OpenSky (/states/all),
+# usado por los comandos de benchmark.
+
+import json
+import random
+from datetime import datetime, timezone as dt_timezone
+
+BASE_TIMESTAMP = 1_700_000_000
+COUNTRIES = ("Mexico", "United States", "Canada", "Spain", "Germany", "Brazil", "Japan", "France")
+MALFORMED_KINDS = 6
+
+
+def _malformed_state(rng, index, kind):
+    # Distintos tipos de filas inválidas que aparecen en feeds reales
+    if kind == 0:
+        return [None] + [0] * 16            # sin icao24
+    if kind == 1:
+        return [f"bad{index:05x}", "X"]      # array truncado
+    if kind == 2:
+        state = _valid_state(rng, index)
+        state[6] = "not-a-number"            # latitud no numérica
+        return state
+    if kind == 3:
+        state = _valid_state(rng, index)[:12]
+        state[7] = None                      # sin baro_altitude ni geo_altitude que leer
+        return state
+    if kind == 4:
+        state = _valid_state(rng, index)
+        state[3] = 10 ** 20                  # timestamp fuera de rango
+        return state
+    return {"icao24": f"obj{index:05x}"}     # objeto en lugar de array
+
+
+def _valid_state(rng, index):
+    on_ground = rng.random() < 0.1
+    time_position = BASE_TIMESTAMP - rng.randint(0, 30)
+    return [
+        f"{index:06x}",                                  # icao24
+        f"SYN{index % 10000:04d}  ",                     # callsign
+        COUNTRIES[index % len(COUNTRIES)],               # origin_country
+        time_position if rng.random() > 0.05 else None,  # time_position
+        time_position + rng.randint(0, 5),               # last_contact
+        round(rng.uniform(-180.0, 180.0), 4),            # longitude
+        round(rng.uniform(-85.0, 85.0), 4),              # latitude
+        None if on_ground else round(rng.uniform(0, 12500), 2),  # baro_altitude
+        on_ground,                                       # on_ground
+        round(rng.uniform(0, 20) if on_ground else rng.uniform(60, 300), 2),  # velocity
+        round(rng.uniform(0, 360), 2),                   # true_track
+        0.0 if on_ground else round(rng.uniform(-15, 15), 2),  # vertical_rate
+        None,                                            # sensors
+        None if on_ground else round(rng.uniform(0, 12800), 2),  # geo_altitude
+        f"{rng.randint(0, 7777):04d}",                   # squawk
+        False,                                           # spi
+        0,                                               # position_source
+    ]
+
+
+def generate_states(count, seed=0, malformed_ratio=0.01, short_ratio=0.01):
+    """
+    Lista determinista de ``count`` state vectors; ``malformed_ratio`` de ellos
+    inválidos y ``short_ratio`` válidos pero cortados tras true_track (11 a 13
+    campos, siempre con baro_altitude), como los de algunos feeds.
+    """
+    rng = random.Random(seed)
+    malformed_every = int(1 / malformed_ratio) if malformed_ratio else 0
+    short_every = int(1 / short_ratio) if short_ratio else 0
+    states = []
+    malformed = 0
+    for index in range(count):
+        if malformed_every and index % malformed_every == malformed_every - 1:
+            # Se rota por las filas inválidas, no por el índice: con cualquier ratio salen todos los tipos
+            states.append(_malformed_state(rng, index, malformed % MALFORMED_KINDS))
+            malformed += 1
+            continue
+        state = _valid_state(rng, index)
+        if short_every and index % short_every == short_every // 2 and state[7] is not None:
+            state = state[:11 + index % 3]
+        states.append(state)
+    return states
+
+
+def generate_payload(count, seed=0, malformed_ratio=0.01, short_ratio=0.01):
+    """Respuesta completa de /states/all con ``count`` estados."""
+    return {'time': BASE_TIMESTAMP, 'states': generate_states(count, seed=seed, malformed_ratio=malformed_ratio, short_ratio=short_ratio)}
+
+
+def advance_states(states, seconds=10, moved_ratio=0.3, seed=0):
+    """
+    Siguiente respuesta de la misma flota, ``seconds`` después: una fracción
+    ``moved_ratio`` de las aeronaves válidas avanza de posición y de timestamp.
+    Las filas inválidas se repiten tal cual.
+    """
+    rng = random.Random(seed)
+    advanced = []
+    for state in states:
+        if isinstance(state, list) and len(state) > 10 and isinstance(state[6], float) and rng.random() < moved_ratio:
+            state = list(state)
+            state[3] = state[3] + seconds if state[3] is not None else None
+            state[4] += seconds
+            state[5] = round(max(-180.0, min(180.0, state[5] + rng.uniform(-0.05, 0.05))), 4)
+            state[6] = round(max(-85.0, min(85.0, state[6] + rng.uniform(-0.05, 0.05))), 4)
+        advanced.append(state)
+    return advanced
+
+
+def _valid_states(states):
+    return [state for state in states if isinstance(state, list) and len(state) >= 17 and isinstance(state[6], float)]
+
+
+def render_json_feed(states):
+    """Los estados válidos como feed JSON con un objeto por vuelo (nombres de campo de OpenSky)."""
+    from .normalizer import OPENSKY_FIELD_NAMES
+    aircraft = [dict(zip(OPENSKY_FIELD_NAMES, state)) for state in _valid_states(states)]
+    return json.dumps({'now': BASE_TIMESTAMP, 'aircraft': aircraft}).encode()
+
+
+def render_dump1090(states):
+    """Los estados válidos como aircraft.json de dump1090 (pies, nudos, edades relativas a "now")."""
+    now = BASE_TIMESTAMP + 30
+    aircraft = []
+    for state in _valid_states(states):
+        record = {
+            'hex': state[0], 'flight': state[1], 'lat': state[6], 'lon': state[5],
+            'alt_baro': 'ground' if state[8] else round(state[7] / 0.3048),
+            'gs': round(state[9] * 3600 / 1852, 1), 'track': state[10],
+            'baro_rate': round(state[11] * 60 / 0.3048), 'squawk': state[14],
+            'seen': now - state[4], 'seen_pos': now - (state[3] or state[4]),
+        }
+        if state[13] is not None:
+            record['alt_geom'] = round(state[13] / 0.3048)
+        aircraft.append(record)
+    return json.dumps({'now': now, 'aircraft': aircraft}).encode()
+
+
+def render_sbs(states):
+    """
+    Los estados válidos como líneas SBS-1: por aeronave un mensaje de
+    identificación (MSG,1), uno de posición (MSG,3) y uno de velocidad (MSG,4).
+    """
+    lines = []
+    for state in _valid_states(states):
+        moment = datetime.fromtimestamp(state[4], tz=dt_timezone.utc)
+        day, clock = moment.strftime('%Y/%m/%d'), moment.strftime('%H:%M:%S.000')
+        prefix = f"111,11111,{state[0].upper()},111111,{day},{clock},{day},{clock}"
+        altitude = '' if state[8] else str(round((state[7] or 0) / 0.3048))
+        on_ground = '-1' if state[8] else '0'
+        lines.append(f"MSG,1,{prefix},{state[1].strip()},,,,,,,,,,,{on_ground}")
+        lines.append(f"MSG,3,{prefix},,{altitude},,,{state[6]},{state[5]},,,0,0,0,{on_ground}")
+        lines.append(
+            f"MSG,4,{prefix},,,{round(state[9] * 3600 / 1852, 1)},{state[10]},,,{round(state[11] * 60 / 0.3048)},,0,0,0,{on_ground}"
+        )
+    return ('\r\n'.join(lines) + '\r\n').encode()
@@ -1,3 +1,882 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import logging
+import random
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qsl, urlsplit
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from .benchmarking import StubOpenSkyServer
+from .binary import MEDIA_TYPE as BINARY_MEDIA_TYPE, cached_payload, decode, encode_delta, encode_snapshot
+from .fastpath import FastReadApplication
+from .live import LiveFeed, SnapshotDelta
+from .management.commands import run_ingest_worker
+from .management.commands.benchmark_fast_path import _call
+from .views import FlightDataViewSet
+from .models import FleetAggregate, FlightData, FlightRawData, IngestState
+from .motion import FleetMotion, load_vertical_motion
+from .normalizer import (
+    REJECT_BAD_NUMBER, REJECT_BAD_TIMESTAMP, REJECT_MISSING_ID, REJECT_NOT_A_LIST, REJECT_TOO_SHORT, normalize_states,
+)
+from .sharding import Tile
+from .streaming import iter_json_array_items
+from .spatial import GRID_COLUMNS, GRID_ROWS, bbox_contains, filter_bbox, filter_near, grid_cell_for
+from .snapshot import FlightSnapshot, SnapshotCache, build_snapshot, snapshot_cache
+from .snapshot import _active_flights as active_flights
+from .services import EMPTY_STATS, INGEST_MODE_UPSERT, FlightDataService
+from .synthetic import BASE_TIMESTAMP, MALFORMED_KINDS, _malformed_state, advance_states, generate_payload, generate_states
+from .worker import IngestWorker
 
-# Create your tests here.
+# Memoria máxima (trazada por tracemalloc) de una ingesta de INGEST_STATES estados en
+# lotes de INGEST_BATCH_SIZE, con el cuerpo de la respuesta en disco: depende del lote,
+# de los flight_id vistos y de la rejilla de agregados, no del payload completo.
+# Medido: ~7.5 MB con 5000 estados (payload de ~0.75 MB).
+INGEST_STATES = 5000
+INGEST_BATCH_SIZE = 500
+INGEST_MEMORY_CEILING = 10 * 1024 * 1024
+
+
+def _service(url):
+    with mock.patch('flights.services.MODULE_EXTERNAL_API_URL', url):
+        return FlightDataService()
+
+
+def _ingest(service, states, batch_size=50):
+    # Un ciclo en modo upsert sin red; devuelve las estadísticas junto con el resultado
+    stats = {**EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {}}
+    stats.update(service._ingest_states(iter(states), INGEST_MODE_UPSERT, None, batch_size, stats))
+    return stats
+
+
+class StreamingIngestMemoryTests(TestCase):
+
+    def test_peak_memory_stays_under_ceiling(self):
+        payload = json.dumps(generate_payload(INGEST_STATES, malformed_ratio=0)).encode()
+        with StubOpenSkyServer(payload) as server, mock.patch('flights.services.SPOOL_MAX_MEMORY', 1024):
+            service = _service(server.url)
+            tracemalloc.start()
+            try:
+                result = service.update_database_from_api(batch_size=INGEST_BATCH_SIZE)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        self.assertTrue(result['success'], result['message'])
+        self.assertEqual(result['created'], INGEST_STATES)
+        self.assertEqual(FlightData.objects.count(), INGEST_STATES)
+        self.assertLess(peak, INGEST_MEMORY_CEILING, f"Peak traced memory {peak / 1e6:.1f} MB for a {len(payload) / 1e6:.1f} MB payload")
+
+
+class NormalizerEquivalenceTests(TestCase):
+
+    def setUp(self):
+        # _process_api_item registra cada fila rechazada
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+    def test_rows_match_process_api_item(self):
+        service = _service('http://127.0.0.1:9/')
+        states = generate_states(3000, seed=7, malformed_ratio=0.05, short_ratio=0.05)
+        normalized = normalize_states(states)
+        expected = [service._process_api_item(state) if isinstance(state, list) else None for state in states]
+        self.assertEqual(normalized.rows, [row for row in expected if row is not None])
+        self.assertEqual([index for index, _ in normalized.rejects], [index for index, row in enumerate(expected) if row is None])
+
+    def test_reject_reasons(self):
+        rng = random.Random(0)
+        states = [_malformed_state(rng, index, kind) for index, kind in enumerate(range(MALFORMED_KINDS))]
+        self.assertEqual([reason for _, reason in normalize_states(states).rejects], [
+            REJECT_MISSING_ID, REJECT_TOO_SHORT, REJECT_BAD_NUMBER, REJECT_TOO_SHORT, REJECT_BAD_TIMESTAMP, REJECT_NOT_A_LIST,
+        ])
+
+
+class ChunkedOpenSkyServer:
+    """
+    Stub de /states/all que responde con Transfer-Encoding: chunked, opcionalmente
+    en gzip, con ETag y 304 para If-None-Match. ``cut_at`` corta la conexión tras
+    ese número de bytes del cuerpo, sin el chunk final.
+    """
+
+    def __init__(self, body, gzipped=False, chunk_size=4096, etag='"v1"', cut_at=None):
+        self.body, self.gzipped, self.chunk_size, self.etag, self.cut_at = body, gzipped, chunk_size, etag, cut_at
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests.append(dict(self.headers))
+                if self.headers.get('If-None-Match') == stub.etag:
+                    self.send_response(304)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = gzip.compress(stub.body) if stub.gzipped else stub.body
+                if stub.cut_at is not None:
+                    body = body[:stub.cut_at]
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.send_header('ETag', stub.etag)
+                if stub.gzipped:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.end_headers()
+                for start in range(0, len(body), stub.chunk_size):
+                    chunk = body[start:start + stub.chunk_size]
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                if stub.cut_at is None:
+                    self.wfile.write(b'0\r\n\r\n')
+                else:
+                    self.close_connection = True
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}/'
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+# La conexión a la base de datos se cierra en cada ciclo del worker: sin la transacción de TestCase
+class IngestWorkerStubServerTests(TransactionTestCase):
+    STATES = 1000
+    BATCH_SIZE = 100
+
+    def setUp(self):
+        # 1% de filas inválidas: se cuentan como rechazadas, no se escriben
+        self.payload = generate_payload(self.STATES, malformed_ratio=0.01)
+        self.body = json.dumps(self.payload).encode()
+        self.valid = self.STATES - self.STATES // 100
+
+    def _worker(self, server):
+        return IngestWorker(service=_service(server.url), batch_size=self.BATCH_SIZE)
+
+    def test_chunked_gzip_body_counts_match(self):
+        with ChunkedOpenSkyServer(self.body, gzipped=True) as server:
+            worker = self._worker(server)
+            result = worker.run_cycle()
+            self.assertTrue(result['success'], result['message'])
+            self.assertEqual(result['total_from_api'], self.STATES)
+            self.assertEqual(result['rejected'], self.STATES - self.valid)
+            self.assertEqual(result['created'], self.valid)
+            self.assertEqual(result['batches'], self.STATES // self.BATCH_SIZE)
+            self.assertEqual(FlightData.objects.filter(expired_at__isnull=True).count(), self.valid)
+
+            # El segundo ciclo manda If-None-Match y el 304 no toca la base de datos
+            second = worker.run_cycle()
+            self.assertTrue(second['success'])
+            self.assertTrue(second.get('skipped'))
+            self.assertEqual(server.requests[-1].get('If-None-Match'), server.etag)
+            self.assertEqual(worker.consecutive_failures, 0)
+
+    def test_plain_chunked_body_counts_match(self):
+        with ChunkedOpenSkyServer(self.body, chunk_size=777) as server:
+            result = self._worker(server).run_cycle()
+        self.assertTrue(result['success'], result['message'])
+        self.assertEqual(result['total_from_api'], self.STATES)
+        self.assertEqual(result['created'], self.valid)
+
+    def test_truncated_body_does_not_expire_flights(self):
+        with ChunkedOpenSkyServer(self.body) as server:
+            self.assertTrue(self._worker(server).run_cycle()['success'])
+
+        # El JSON se corta a mitad del array, pero la respuesta HTTP termina bien
+        truncated = self.body[:len(self.body) // 2]
+        with ChunkedOpenSkyServer(truncated, etag='"v2"') as server:
+            worker = self._worker(server)
+            result = worker.run_cycle()
+        self.assertFalse(result['success'])
+        self.assertIn('not as expected', result['message'])
+        self.assertGreater(result['total_from_api'], 0)
+        self.assertLess(result['total_from_api'], self.STATES)
+        self.assertEqual(result['expired'], 0)
+        self.assertEqual(worker.consecutive_failures, 1)
+        self.assertEqual(FlightData.objects.filter(expired_at__isnull=True).count(), self.valid)
+
+    def test_connection_cut_mid_body_leaves_database_untouched(self):
+        with ChunkedOpenSkyServer(self.body) as server:
+            self.assertTrue(self._worker(server).run_cycle()['success'])
+
+        with ChunkedOpenSkyServer(self.body, etag='"v2"', cut_at=len(self.body) // 3) as server:
+            worker = self._worker(server)
+            result = worker.run_cycle()
+        self.assertFalse(result['success'])
+        self.assertIn('Failed to download', result['message'])
+        self.assertEqual(worker.consecutive_failures, 1)
+        self.assertEqual(FlightData.objects.filter(expired_at__isnull=True).count(), self.valid)
+
+
+class ShardedExpiryTests(TestCase):
+
+    def _report(self, tile, states=None):
+        # Informe de _fetch_tile: con ``states`` la tesela respondió, sin ellos falló
+        ok = states is not None
+        return {
+            'tile': tile.name, 'success': ok, 'latency': 0.0, 'rows': len(states or ()), 'bytes': 0,
+            'states': states or [], 'error': None if ok else 'fetch failed',
+        }
+
+    def test_failed_tile_keeps_flights_without_position(self):
+        south, north = Tile(-90, -180, 0, 180), Tile(0, -180, 90, 180)
+        states = generate_payload(20, malformed_ratio=0, short_ratio=0)['states']
+        service = _service('http://127.0.0.1:9/')
+        reports = {south.name: self._report(south, states), north.name: self._report(north, [])}
+        with mock.patch.object(service, '_fetch_tile', side_effect=lambda tile: {**reports[tile.name], 'states': list(reports[tile.name]['states'])}):
+            self.assertTrue(service.update_database_from_tiles([south, north])['success'])
+
+            # El vuelo sin posición deja de venir mientras la tesela norte falla: no se expira
+            unpositioned = list(states[0])
+            unpositioned[5] = unpositioned[6] = None
+            reports[south.name] = self._report(south, [unpositioned] + states[1:])
+            self.assertTrue(service.update_database_from_tiles([south, north])['success'])
+            reports[south.name] = self._report(south, states[1:])
+            reports[north.name] = self._report(north)
+            result = service.update_database_from_tiles([south, north])
+
+        self.assertTrue(result['success'], result['message'])
+        self.assertEqual(result['expired'], 0)
+        self.assertIsNone(FlightData.objects.get(flight_id=states[0][0]).expired_at)
+
+
+class RawDataWriteTests(TestCase):
+
+    def test_only_created_and_changed_rows_rewrite_raw_data(self):
+        states = generate_payload(200, malformed_ratio=0)['states']
+        service = _service('http://127.0.0.1:9/')
+        stats = {**EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {}}
+        self.assertTrue(service._ingest_states(iter(states), INGEST_MODE_UPSERT, None, 50, dict(stats))['success'])
+        first_version = IngestState.current_version()
+
+        second = dict(stats)
+        result = service._ingest_states(iter(advance_states(states, moved_ratio=0.2)), INGEST_MODE_UPSERT, None, 50, second)
+        self.assertTrue(result['success'], result['message'])
+        self.assertGreater(second['updated'], 0)
+        self.assertGreater(second['unchanged'], 0)
+        rewritten = FlightRawData.objects.filter(ingest_version__gt=first_version).count()
+        self.assertEqual(rewritten, second['updated'])
+        self.assertEqual(FlightRawData.objects.count(), len(states))
+
+    def test_change_only_in_raw_data_is_an_update(self):
+        states = generate_payload(20, malformed_ratio=0, short_ratio=0)['states']
+        service = _service('http://127.0.0.1:9/')
+        stats = {**EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {}}
+        service._ingest_states(iter(states), INGEST_MODE_UPSERT, None, 50, dict(stats))
+        first_version = IngestState.current_version()
+
+        # Sólo cambia el squawk: ninguna columna de FlightData
+        changed = [list(state) for state in states]
+        changed[0][14] = '7700'
+        second = dict(stats)
+        self.assertTrue(service._ingest_states(iter(changed), INGEST_MODE_UPSERT, None, 50, second)['success'])
+        self.assertEqual((second['updated'], second['unchanged']), (1, len(states) - 1))
+        self.assertGreater(IngestState.current_version(), first_version)
+        self.assertEqual(FlightRawData.objects.get(flight_id=states[0][0]).raw_data['squawk'], '7700')
+
+
+class IngestVersionTests(TestCase):
+
+    def test_one_version_per_cycle(self):
+        states = generate_payload(200, malformed_ratio=0)['states']
+        service = _service('http://127.0.0.1:9/')
+        stats = {**EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {}}
+        before = IngestState.current_version()
+        first = dict(stats)
+        self.assertTrue(service._ingest_states(iter(states), INGEST_MODE_UPSERT, None, 50, first)['success'])
+        self.assertEqual(first['batches'], 4)
+        self.assertEqual(IngestState.current_version(), before + 1)
+        self.assertEqual(set(FlightRawData.objects.values_list('ingest_version', flat=True)), {before + 1})
+
+        # Sin cambios no hay versión nueva
+        service._ingest_states(iter(states), INGEST_MODE_UPSERT, None, 50, dict(stats))
+        self.assertEqual(IngestState.current_version(), before + 1)
+
+    def test_failed_cycle_rolls_back_every_batch(self):
+        states = generate_payload(200, malformed_ratio=0)['states']
+        service = _service('http://127.0.0.1:9/')
+
+        def broken():
+            yield from states
+            raise ValueError('truncated')
+
+        result = {**EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {}}
+        self.assertFalse(service._ingest_states(broken(), INGEST_MODE_UPSERT, None, 50, result)['success'])
+        self.assertEqual((result['created'], result['batches']), (0, 0))
+        self.assertFalse(FlightData.objects.exists())
+        self.assertEqual(IngestState.current_version(), 0)
+
+
+class SnapshotVersionTests(TestCase):
+
+    def test_cache_never_moves_backwards(self):
+        cache = SnapshotCache()
+        newer = cache.get_snapshot(2, lambda version: FlightSnapshot(version, []))
+        cache.get_or_build(2, 'page', lambda: 'v2')
+
+        # Una petición lenta que leyó la versión 1 recibe el snapshot de la 2 y no vacía la caché
+        self.assertIs(cache.get_snapshot(1, lambda version: FlightSnapshot(version, [])), newer)
+        self.assertEqual(cache.get_or_build(1, 'page', lambda: 'v1'), 'v1')
+        self.assertEqual(cache.get_or_build(2, 'page', lambda: 'rebuilt'), 'v2')
+        self.assertEqual(cache.stats()['version'], 2)
+        self.assertEqual(cache.stats()['history'], [])
+        self.assertIsNone(cache.get_history(1))
+
+        # Un builder que devuelve una versión posterior hace avanzar la caché
+        cache.get_snapshot(3, lambda version: FlightSnapshot(4, []))
+        self.assertEqual(cache.stats()['version'], 4)
+        self.assertEqual(cache.stats()['history'], [2])
+
+    def test_snapshot_rows_match_its_version(self):
+        states = generate_payload(10, malformed_ratio=0, short_ratio=0)['states']
+        service = _service('http://127.0.0.1:9/')
+        calls = []
+
+        def racing_read():
+            # Un ciclo de ingesta confirma entre la consulta de filas y la relectura de la versión
+            rows = active_flights()
+            if not calls:
+                service._ingest_states(iter(states), INGEST_MODE_UPSERT, None, 50, {**EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {}})
+            calls.append(len(rows))
+            return rows
+
+        with mock.patch('flights.snapshot._active_flights', side_effect=racing_read):
+            snapshot = build_snapshot(IngestState.current_version())
+        self.assertEqual(calls, [0, len(states)])
+        self.assertEqual(snapshot.version, IngestState.current_version())
+        self.assertEqual(len(snapshot), len(states))
+
+
+class MotionCacheTests(TestCase):
+
+    def test_pinned_value_survives_lru_eviction(self):
+        cache = SnapshotCache(max_entries=2)
+        builds = []
+        for page in range(10):
+            cache.get_pinned(1, 'motion', lambda: builds.append(1) or 'motion')
+            cache.get_or_build(1, ('list', page), lambda: page)
+        self.assertEqual(len(builds), 1)
+        cache.get_pinned(2, 'motion', lambda: builds.append(2) or 'motion')
+        self.assertEqual(builds, [1, 2])
+
+    def test_vertical_motion_skips_expired_flights(self):
+        states = generate_payload(10, malformed_ratio=0, short_ratio=0)['states']
+        service = _service('http://127.0.0.1:9/')
+        service._ingest_states(iter(states), INGEST_MODE_UPSERT, None, 50, {**EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {}})
+        expired_id = states[0][0]
+        FlightData.objects.filter(flight_id=expired_id).update(expired_at=FlightData.objects.get(flight_id=expired_id).timestamp)
+        motion = load_vertical_motion(state[0] for state in states)
+        self.assertEqual(set(motion), {state[0] for state in states[1:]})
+
+
+    def test_altitude_only_clamped_when_descending(self):
+        rows = [
+            _flight_row(1, 'aaaaaa', 40.0, -3.0, altitude=100.0),
+            _flight_row(2, 'bbbbbb', 31.5, 35.5, altitude=-400.0),
+            _flight_row(3, 'cccccc', 31.6, 35.6, altitude=-400.0),
+            _flight_row(4, 'dddddd', 41.0, -3.0, altitude=100.0),
+        ]
+        motion = FleetMotion(_snapshot(1, rows), {
+            'aaaaaa': (-10.0, False), 'bbbbbb': (None, False), 'cccccc': (-5.0, False), 'dddddd': (5.0, False),
+        })
+        altitudes = [position[2] for position in motion.project(BASE_TIMESTAMP + 60)]
+        # El descenso se detiene en el suelo; bajo el nivel del mar (Mar Muerto) no se corrige
+        self.assertEqual(altitudes, [0.0, -400.0, -400.0, 400.0])
+
+
+# Campos de FlightData que ve un cliente (sin expired_at ni grid_cell)
+PUBLIC_FLIGHT_FIELDS = (
+    'flight_id', 'latitude', 'longitude', 'altitude', 'speed', 'heading', 'timestamp', 'last_updated_by_system',
+)
+
+# Middlewares y DRF de tracker_project/settings_lean.py
+LEAN_MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+LEAN_REST_FRAMEWORK = {
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class FastPathHeaderTests(TestCase):
+
+    def setUp(self):
+        states = generate_payload(20, malformed_ratio=0, short_ratio=0)['states']
+        service = _service('http://127.0.0.1:9/')
+        service._ingest_states(iter(states), INGEST_MODE_UPSERT, None, 50, {**EMPTY_STATS, 'total_from_api': 0, 'reject_reasons': {}})
+        self.flight_id = states[0][0]
+
+    def _assert_same_responses(self):
+        full = WSGIHandler()
+        fast = FastReadApplication(full)
+        factory = RequestFactory()
+        for path in ('/api/flightdata/', f'/api/flightdata/{self.flight_id}/'):
+            self.assertEqual(_call(fast, factory.get(path).environ), _call(full, factory.get(path).environ), path)
+
+    def test_full_settings(self):
+        self._assert_same_responses()
+
+    def test_rows_expose_only_public_fields(self):
+        fast = FastReadApplication(WSGIHandler())
+        factory = RequestFactory()
+        _, _, body = _call(fast, factory.get('/api/flightdata/', {'page_size': 1}).environ)
+        row = json.loads(body)['results'][0]
+        self.assertEqual(set(row), {'id', *PUBLIC_FLIGHT_FIELDS})
+        _, _, body = _call(fast, factory.get(f'/api/flightdata/{row["id"]}/').environ)
+        self.assertEqual(set(json.loads(body)), {'id', *PUBLIC_FLIGHT_FIELDS, 'raw_data'})
+
+    def test_lean_settings(self):
+        # Las clases de la vista se fijan al importarla: se sustituyen como las dejaría settings_lean
+        with override_settings(MIDDLEWARE=LEAN_MIDDLEWARE, REST_FRAMEWORK=LEAN_REST_FRAMEWORK), \
+                mock.patch.object(FlightDataViewSet, 'renderer_classes', [JSONRenderer]), \
+                mock.patch.object(FlightDataViewSet, 'authentication_classes', []):
+            self._assert_same_responses()
+
+
+def _flight_row(pk, flight_id, latitude, longitude, seconds=BASE_TIMESTAMP, altitude=1000.0, speed=200.0, heading=90.0):
+    return {
+        'id': pk, 'flight_id': flight_id, 'latitude': latitude, 'longitude': longitude,
+        'altitude': altitude, 'speed': speed, 'heading': heading, 'timestamp': seconds,
+    }
+
+
+def _snapshot(version, rows):
+    # Las claves llevan el timestamp en microsegundos, como las de build_snapshot
+    return FlightSnapshot(version, rows, [(row['timestamp'] * 1000000, row['id']) for row in rows])
+
+
+class BinaryFormatTests(TestCase):
+
+    def setUp(self):
+        snapshot_cache.clear()
+
+    def test_encode_decode_round_trip(self):
+        rows = [
+            _flight_row(1, 'abc123', 40.41678, -3.70379, altitude=10972.8, speed=231.49, heading=359.96),
+            _flight_row(2, 'N12345-X', -33.8688, 151.2093, seconds=BASE_TIMESTAMP + 7, altitude=-12.0, speed=None),
+            _flight_row(3, '00ff00', None, None, heading=None),
+        ]
+        payload = decode(encode_snapshot(_snapshot(5, rows)))
+        self.assertEqual((payload['kind'], payload['version'], payload['removed']), ('snapshot', 5, []))
+        self.assertEqual(payload['flights'], [
+            {'flight_id': 'abc123', 'latitude': 40.41678, 'longitude': -3.70379, 'altitude': 10973, 'speed': 231.5, 'heading': 0.0, 'timestamp': BASE_TIMESTAMP},
+            {'flight_id': 'N12345-X', 'latitude': -33.8688, 'longitude': 151.2093, 'altitude': -12, 'speed': None, 'heading': 90.0, 'timestamp': BASE_TIMESTAMP + 7},
+            {'flight_id': '00ff00', 'latitude': None, 'longitude': None, 'altitude': 1000, 'speed': 200.0, 'heading': None, 'timestamp': BASE_TIMESTAMP},
+        ])
+        with self.assertRaises(ValueError):
+            decode(encode_snapshot(_snapshot(5, rows))[:-3])
+
+    def test_bbox_filters_snapshot_and_delta(self):
+        bbox = (-10.0, 35.0, 5.0, 45.0)
+        before = _snapshot(1, [
+            _flight_row(1, 'aaaaaa', 40.0, -3.0), _flight_row(2, 'bbbbbb', 40.0, 0.0), _flight_row(3, 'cccccc', 10.0, 10.0),
+        ])
+        after = _snapshot(2, [
+            # aaaaaa se mueve dentro, bbbbbb sale de la zona, cccccc entra y dddddd aparece fuera
+            _flight_row(1, 'aaaaaa', 40.1, -3.0), _flight_row(2, 'bbbbbb', 50.0, 0.0),
+            _flight_row(3, 'cccccc', 41.0, 1.0), _flight_row(4, 'dddddd', 10.0, 10.0),
+        ])
+        self.assertEqual([flight['flight_id'] for flight in decode(encode_snapshot(before, bbox))['flights']], ['aaaaaa', 'bbbbbb'])
+        delta = decode(encode_delta(before, after, bbox))
+        self.assertEqual((delta['kind'], delta['version'], delta['previous_version']), ('delta', 2, 1))
+        self.assertEqual([flight['flight_id'] for flight in delta['flights']], ['aaaaaa', 'cccccc'])
+        self.assertEqual(delta['removed'], ['bbbbbb'])
+
+    def test_since_returns_delta_against_history(self):
+        service = _service('http://127.0.0.1:9/')
+        states = generate_payload(40, malformed_ratio=0, short_ratio=0)['states']
+        _ingest(service, states)
+        first = IngestState.current_version()
+        self.assertEqual(decode(cached_payload(first))['kind'], 'snapshot')
+
+        advanced = advance_states(states[1:], moved_ratio=0.5)
+        moved = {state[0] for state, old in zip(advanced, states[1:]) if state is not old}
+        self.assertTrue(moved)
+        added = list(states[0])
+        added[0] = 'fffff0'
+        _ingest(service, advanced + [added])
+        second = IngestState.current_version()
+
+        delta = decode(cached_payload(second, since=first))
+        self.assertEqual((delta['kind'], delta['version'], delta['previous_version']), ('delta', second, first))
+        self.assertEqual({flight['flight_id'] for flight in delta['flights']}, moved | {'fffff0'})
+        self.assertEqual(delta['removed'], [states[0][0]])
+
+    def test_unknown_since_falls_back_to_full_snapshot(self):
+        _ingest(_service('http://127.0.0.1:9/'), generate_payload(30, malformed_ratio=0, short_ratio=0)['states'])
+        version = IngestState.current_version()
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            response = self.client.get('/api/flightdata/', {'format': 'bin', 'since': version + 100})
+        self.assertEqual(response['Content-Type'], BINARY_MEDIA_TYPE)
+        payload = decode(response.content)
+        self.assertEqual((payload['kind'], payload['version'], len(payload['flights'])), ('snapshot', version, 30))
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        snapshot_cache.clear()
+        states = generate_payload(10, malformed_ratio=0, short_ratio=0)['states']
+        for index, state in enumerate(states):
+            # Ocho vuelos en el mismo segundo: el orden dentro de él lo decide el id
+            state[3] = state[4] = BASE_TIMESTAMP if index < 8 else BASE_TIMESTAMP - 60
+            state[5], state[6] = 1.0 + index * 0.1, 40.0
+        _ingest(_service('http://127.0.0.1:9/'), states)
+        self.expected = list(FlightData.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+    def _walk(self, get, params):
+        ids, params = [], {**params, 'pagination': 'keyset', 'page_size': 3}
+        while True:
+            status, page = get(params)
+            self.assertEqual(status, 200)
+            ids.extend(row['id'] for row in page['results'])
+            if page['next'] is None:
+                return ids
+            params = dict(parse_qsl(urlsplit(page['next']).query))
+
+    def _view_get(self, params):
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            response = self.client.get('/api/flightdata/', params)
+        return response.status_code, (response.json() if response.status_code == 200 else None)
+
+    def _fast_get(self, params):
+        fast = FastReadApplication(WSGIHandler())
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            status, _, body = _call(fast, RequestFactory().get('/api/flightdata/', params).environ)
+        code = int(status.split()[0])
+        return code, (json.loads(body) if code == 200 else None)
+
+    def test_pages_through_equal_timestamps(self):
+        self.assertEqual(self._walk(self._view_get, {}), self.expected)
+        self.assertEqual(self._walk(self._fast_get, {}), self.expected)
+        # Con bbox se pagina sobre la consulta a la BD en lugar del snapshot
+        self.assertEqual(self._walk(self._view_get, {'bbox': '0,30,10,50'}), self.expected)
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ('not-a-cursor', 'YTpi', '!!!'):
+            for params in ({'cursor': cursor}, {'cursor': cursor, 'bbox': '0,30,10,50'}):
+                self.assertEqual(self._view_get(params)[0], 404, params)
+            self.assertEqual(self._fast_get({'cursor': cursor})[0], 404, cursor)
+
+
+class StatsEndpointTests(TestCase):
+
+    def setUp(self):
+        snapshot_cache.clear()
+        self.service = _service('http://127.0.0.1:9/')
+        self.states = generate_states(4, malformed_ratio=0, short_ratio=0)
+        fleet = [
+            # país, lat, lon, altitud, en tierra, velocidad
+            ('Spain', 40.0, -3.0, 500.0, False, 10.0),
+            ('Spain', 41.0, -4.0, 10000.0, False, 250.0),
+            ('France', 48.0, 2.0, 3500.0, False, 200.0),
+            ('France', 49.0, 2.5, 0.0, True, 5.0),
+        ]
+        for state, (country, latitude, longitude, altitude, on_ground, speed) in zip(self.states, fleet):
+            state[2], state[6], state[5], state[7], state[13], state[8], state[9] = (
+                country, latitude, longitude, altitude, altitude, on_ground, speed,
+            )
+
+    def _get(self, params=None):
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            response = self.client.get('/api/flightdata/stats/', params or {})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_aggregates_after_ingest_cycles(self):
+        _ingest(self.service, self.states)
+        response = self._get()
+        stats = response.json()
+        self.assertEqual(int(response['X-Ingest-Version']), stats['version'])
+        self.assertEqual(stats['version'], IngestState.current_version())
+        self.assertEqual((stats['flights'], stats['airborne'], stats['on_ground']), (4, 3, 1))
+        self.assertEqual(stats['by_country'], [{'country': 'France', 'flights': 2}, {'country': 'Spain', 'flights': 2}])
+        self.assertEqual([band['flights'] for band in stats['altitude_bands']], [1, 0, 1, 0, 1, 0])
+        self.assertEqual(sum(bin['flights'] for bin in stats['speed_histogram']), 4)
+        self.assertEqual(self._get({'bbox': '-10,35,0,45'}).json()['by_country'], [{'country': 'Spain', 'flights': 2}])
+
+        # Segundo ciclo: un vuelo expira y otro sólo cambia de país en raw_data
+        next_states = [list(state) for state in self.states[:3]]
+        next_states[0][2] = 'Portugal'
+        _ingest(self.service, next_states)
+        stats = self._get().json()
+        self.assertEqual(stats['version'], IngestState.current_version())
+        self.assertEqual((stats['flights'], stats['airborne'], stats['on_ground']), (3, 3, 0))
+        self.assertEqual(stats['by_country'], [
+            {'country': 'France', 'flights': 1}, {'country': 'Portugal', 'flights': 1}, {'country': 'Spain', 'flights': 1},
+        ])
+
+    def test_cached_per_version(self):
+        _ingest(self.service, self.states)
+        with mock.patch.object(FleetAggregate, 'latest', wraps=FleetAggregate.latest) as latest:
+            first = self._get().json()
+            self.assertEqual(self._get().json(), first)
+            self._get({'bbox': '-10,35,0,45', 'by': 'cell'})
+            self.assertEqual(latest.call_count, 1)
+            _ingest(self.service, self.states[:2])
+            self.assertEqual(self._get().json()['flights'], 2)
+            self.assertEqual(latest.call_count, 2)
+
+
+class UpsertCycleTests(TestCase):
+
+    def setUp(self):
+        snapshot_cache.clear()
+        self.service = _service('http://127.0.0.1:9/')
+        self.states = generate_states(5, malformed_ratio=0, short_ratio=0)
+
+    def _counts(self, stats):
+        return {key: stats[key] for key in ('created', 'updated', 'unchanged', 'expired')}
+
+    def _get(self, path):
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            return self.client.get(path)
+
+    def test_cycle_counts(self):
+        self.assertEqual(self._counts(_ingest(self.service, self.states)), {'created': 5, 'updated': 0, 'unchanged': 0, 'expired': 0})
+        next_states = [list(state) for state in self.states[:4]]
+        next_states[1][4] += 10
+        next_states[1][6] += 0.01
+        added = list(self.states[0])
+        added[0] = 'fffff0'
+        stats = _ingest(self.service, next_states + [added])
+        self.assertEqual(self._counts(stats), {'created': 1, 'updated': 1, 'unchanged': 3, 'expired': 1})
+        self.assertEqual(FlightData.objects.count(), 6)
+        self.assertEqual(list(FlightData.objects.exclude(expired_at=None).values_list('flight_id', flat=True)), [self.states[4][0]])
+        # Un ciclo idéntico no cambia nada
+        stats = _ingest(self.service, next_states + [added])
+        self.assertEqual(self._counts(stats), {'created': 0, 'updated': 0, 'unchanged': 5, 'expired': 0})
+
+    def test_expired_flight_comes_back(self):
+        _ingest(self.service, self.states)
+        _ingest(self.service, self.states[1:])
+        flight = FlightData.objects.get(flight_id=self.states[0][0])
+        self.assertIsNotNone(flight.expired_at)
+        # Reaparece con los mismos datos: cuenta como actualizado y vuelve a estar activo
+        stats = _ingest(self.service, self.states)
+        self.assertEqual(self._counts(stats), {'created': 0, 'updated': 1, 'unchanged': 4, 'expired': 0})
+        flight.refresh_from_db()
+        self.assertIsNone(flight.expired_at)
+        self.assertEqual(self._get(f'/api/flightdata/{flight.pk}/').status_code, 200)
+
+    def test_expired_flight_is_not_found(self):
+        _ingest(self.service, self.states)
+        pk = FlightData.objects.get(flight_id=self.states[0][0]).pk
+        self.assertEqual(self._get(f'/api/flightdata/{pk}/track/').status_code, 200)
+        _ingest(self.service, self.states[1:])
+        for path in (f'/api/flightdata/{pk}/', f'/api/flightdata/{pk}/track/'):
+            self.assertEqual(self._get(path).status_code, 404, path)
+        fast = FastReadApplication(WSGIHandler())
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            status, _, _ = _call(fast, RequestFactory().get(f'/api/flightdata/{pk}/').environ)
+        self.assertTrue(status.startswith('404'), status)
+        listed = {row['id'] for row in self._get('/api/flightdata/?page_size=100').json()['results']}
+        self.assertNotIn(pk, listed)
+        self.assertEqual(len(listed), 4)
+
+
+class SpatialFilterTests(TestCase):
+
+    POSITIONS = [
+        # Bordes de celda, antimeridiano y polos
+        (0.0, 0.0), (1.0, 1.0), (2.0, 2.0), (0.99999, 1.5), (2.00001, 1.5), (1.5, 0.99999), (1.5, 2.00001),
+        (0.0, 180.0), (0.0, -180.0), (5.0, 179.5), (-5.0, -179.5), (0.0, 179.9), (0.0, -179.9), (0.0, 170.0),
+        (90.0, 180.0), (-90.0, -180.0), (45.0, -0.00001), (-45.0, 0.00001),
+    ]
+    BBOXES = [
+        (1.0, 1.0, 2.0, 2.0),
+        (0.0, 0.0, 0.0, 0.0),
+        (170.0, -10.0, -170.0, 10.0),
+        (179.5, -10.0, -179.5, 10.0),
+        (-180.0, -90.0, 180.0, 90.0),
+        (-1.0, -50.0, 1.0, 50.0),
+        (180.0, 0.0, -180.0, 0.0),
+    ]
+
+    def setUp(self):
+        snapshot_cache.clear()
+        states = generate_states(len(self.POSITIONS), malformed_ratio=0, short_ratio=0)
+        for state, (latitude, longitude) in zip(states, self.POSITIONS):
+            state[6], state[5] = latitude, longitude
+        _ingest(_service('http://127.0.0.1:9/'), states)
+
+    def test_grid_cell_edges(self):
+        self.assertEqual(grid_cell_for(-90.0, -180.0), 0)
+        self.assertEqual(grid_cell_for(90.0, 180.0), GRID_ROWS * GRID_COLUMNS - 1)
+        self.assertEqual(grid_cell_for(0.0, 0.0), 90 * GRID_COLUMNS + 180)
+        # El borde inferior de una celda pertenece a ella; el superior, a la siguiente
+        self.assertEqual(grid_cell_for(1.0, 1.0), grid_cell_for(1.99999, 1.99999))
+        self.assertEqual(grid_cell_for(0.99999, 1.0) + GRID_COLUMNS, grid_cell_for(1.0, 1.0))
+        for latitude, longitude in ((None, 0.0), (0.0, None), (90.00001, 0.0), (0.0, -180.00001), (float('nan'), 0.0)):
+            self.assertIsNone(grid_cell_for(latitude, longitude), (latitude, longitude))
+        for flight in FlightData.objects.all():
+            self.assertEqual(flight.grid_cell, grid_cell_for(flight.latitude, flight.longitude), flight.flight_id)
+
+    def test_filter_bbox_matches_exact_containment(self):
+        flights = list(FlightData.objects.all())
+        for bbox in self.BBOXES:
+            expected = {flight.pk for flight in flights if bbox_contains(bbox, flight.latitude, flight.longitude)}
+            self.assertEqual(set(filter_bbox(FlightData.objects.all(), *bbox).values_list('pk', flat=True)), expected, bbox)
+        crossing = {(flight.latitude, flight.longitude) for flight in filter_bbox(FlightData.objects.all(), 170.0, -10.0, -170.0, 10.0)}
+        self.assertEqual(crossing, {(0.0, 180.0), (0.0, -180.0), (5.0, 179.5), (-5.0, -179.5), (0.0, 179.9), (0.0, -179.9), (0.0, 170.0)})
+
+    def test_near_crosses_antimeridian(self):
+        near = {(flight.latitude, flight.longitude) for flight in filter_near(FlightData.objects.all(), 0.0, 179.9, 50.0)}
+        self.assertEqual(near, {(0.0, 180.0), (0.0, -180.0), (0.0, 179.9), (0.0, -179.9)})
+
+    def test_bbox_parameter(self):
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            response = self.client.get('/api/flightdata/', {'bbox': '1,1,2,2', 'page_size': 100})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                {(row['latitude'], row['longitude']) for row in response.json()['results']},
+                {(1.0, 1.0), (2.0, 2.0)},
+            )
+            for bbox in ('1,2,3', '0,10,1,5', '0,0,181,1', 'a,b,c,d'):
+                self.assertEqual(self.client.get('/api/flightdata/', {'bbox': bbox}).status_code, 400, bbox)
+
+
+def _parse_event(message):
+    # Evento SSE -> (id, tipo, datos JSON)
+    fields = dict(line.split(': ', 1) for line in message.decode().strip().split('\n'))
+    return int(fields['id']), fields['event'], json.loads(fields['data'])
+
+
+class LiveDeltaTests(TestCase):
+
+    BBOX = (-10.0, 35.0, 5.0, 45.0)
+
+    def setUp(self):
+        snapshot_cache.clear()
+        self.service = _service('http://127.0.0.1:9/')
+        self.states = generate_states(5, malformed_ratio=0, short_ratio=0)
+        # A y B dentro del bbox, C fuera, D dentro y sin cambios, E dentro y desaparece
+        positions = [(40.0, -3.0), (40.0, 0.0), (10.0, 10.0), (41.0, -2.0), (42.0, -1.0)]
+        for state, (latitude, longitude) in zip(self.states, positions):
+            state[6], state[5] = latitude, longitude
+        self.ids = [state[0] for state in self.states]
+        _ingest(self.service, self.states)
+        self.previous = build_snapshot(IngestState.current_version())
+
+        # A se mueve dentro, B sale, C entra, D igual, E expira y F aparece fuera
+        next_states = [list(state) for state in self.states[:4]]
+        for state, (latitude, longitude) in zip(next_states[:3], [(40.1, -3.0), (50.0, 0.0), (41.0, 1.0)]):
+            state[6], state[5] = latitude, longitude
+            state[3] += 10
+            state[4] += 10
+        added = list(self.states[2])
+        added[0] = 'fffff0'
+        _ingest(self.service, next_states + [added])
+        self.current = build_snapshot(IngestState.current_version())
+
+    def test_delta_between_versions(self):
+        event_id, event, data = _parse_event(SnapshotDelta(self.previous, self.current).encode())
+        self.assertEqual((event_id, event), (self.current.version, 'delta'))
+        self.assertEqual((data['version'], data['previous_version']), (self.current.version, self.previous.version))
+        self.assertEqual([flight['flight_id'] for flight in data['added']], ['fffff0'])
+        self.assertNotIn('raw_data', data['added'][0])
+        self.assertEqual({change['flight_id'] for change in data['moved']}, set(self.ids[:3]))
+        moved = {change['flight_id']: change for change in data['moved']}
+        self.assertEqual((moved[self.ids[0]]['latitude'], moved[self.ids[0]]['longitude']), (40.1, -3.0))
+        self.assertEqual(data['removed'], [self.ids[4]])
+
+    def test_delta_seen_from_bbox(self):
+        delta = SnapshotDelta(self.previous, self.current)
+        _, _, data = _parse_event(delta.encode(self.BBOX))
+        # C entra en la zona como fila completa y B, que sale, como eliminado
+        self.assertEqual([flight['flight_id'] for flight in data['added']], [self.ids[2]])
+        self.assertEqual([change['flight_id'] for change in data['moved']], [self.ids[0]])
+        self.assertEqual(set(data['removed']), {self.ids[1], self.ids[4]})
+        self.assertIsNone(delta.encode((100.0, -10.0, 110.0, 0.0)))
+
+    def test_refresh_publishes_once_per_version(self):
+        feed = LiveFeed()
+        feed.snapshot = self.previous
+        subscription = feed.broker.subscribe()
+        delta = async_to_sync(feed.refresh)()
+        self.assertEqual(delta.counts(), {'added': 1, 'moved': 3, 'removed': 1})
+        self.assertEqual(_parse_event(subscription.queue.get_nowait())[0], self.current.version)
+        self.assertIsNone(async_to_sync(feed.refresh)())
+        self.assertTrue(subscription.queue.empty())
+
+
+class JsonArrayStreamTests(TestCase):
+
+    def _chunks(self, text, size=7):
+        # Trozos pequeños para que los elementos y los números queden partidos; cuenta los leídos
+        self.read = 0
+        for start in range(0, len(text), size):
+            self.read += 1
+            yield text[start:start + size].encode()
+
+    def test_items_split_across_chunks(self):
+        text = '{"time": 1, "states": [["abc", 12345.5, null], {"a": "\u00f1"}, 1234567, -0.5e3 ] , "x": 2}'
+        self.assertEqual(
+            list(iter_json_array_items(self._chunks(text), 'states')),
+            [['abc', 12345.5, None], {'a': 'ñ'}, 1234567, -500.0],
+        )
+
+    def test_malformed_item_stops_at_the_size_limit(self):
+        # Un elemento roto seguido de muchos válidos: no se lee el resto de la respuesta
+        text = '{"states": [[1, 2], [3, }, ' + ', '.join(['[4, 5]'] * 10000) + ']}'
+        items = iter_json_array_items(self._chunks(text), 'states', max_item_chars=200)
+        self.assertEqual(next(items), [1, 2])
+        with self.assertRaisesRegex(ValueError, 'longer than 200 characters'):
+            next(items)
+        self.assertLess(self.read * 7, 300)
+
+    def test_truncated_stream(self):
+        with self.assertRaisesRegex(ValueError, 'Malformed or truncated'):
+            list(iter_json_array_items(self._chunks('{"states": [[1, 2], [3, 4'), 'states'))
+        with self.assertRaisesRegex(ValueError, 'Unexpected end'):
+            list(iter_json_array_items(self._chunks('{"states": [[1, 2], 42'), 'states'))
+
+
+class RunIngestWorkerCommandTests(TestCase):
+
+    def _run(self, environ, *args):
+        # Sin bucle real ni manejadores de señales: sólo se comprueba con qué intervalo se crea el worker
+        with mock.patch.dict('os.environ', environ), \
+                mock.patch.object(run_ingest_worker, 'IngestWorker') as worker, \
+                mock.patch.object(run_ingest_worker.signal, 'signal'):
+            call_command('run_ingest_worker', *args, stdout=io.StringIO())
+        return worker.call_args.kwargs['interval']
+
+    def test_interval_from_environment(self):
+        self.assertEqual(self._run({'INGEST_POLL_INTERVAL': '2.5'}), 2.5)
+        self.assertEqual(self._run({'INGEST_POLL_INTERVAL': ''}), run_ingest_worker.DEFAULT_POLL_INTERVAL)
+        self.assertEqual(self._run({'INGEST_POLL_INTERVAL': 'oops'}, '--interval', '4'), 4.0)
+
+    def test_malformed_interval(self):
+        with self.assertRaisesRegex(CommandError, 'INGEST_POLL_INTERVAL'):
+            self._run({'INGEST_POLL_INTERVAL': 'oops'})
+        for value in ('0', '-1', 'nan'):
+            with self.assertRaisesRegex(CommandError, 'must be positive'):
+                self._run({'INGEST_POLL_INTERVAL': value})
+
+    def test_help_ignores_malformed_environment(self):
+        with mock.patch.dict('os.environ', {'INGEST_POLL_INTERVAL': 'oops'}):
+            parser = run_ingest_worker.Command().create_parser('manage.py', 'run_ingest_worker')
+            self.assertIn('--interval', parser.format_help())
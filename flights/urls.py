@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FlightDataViewSet
+from .views import FlightDataViewSet, live_feed
 
 router = DefaultRouter()
 router.register(r'flightdata', FlightDataViewSet, basename='flightdata')
 
 urlpatterns = [
+    # Antes que el router: flightdata/<pk>/ también casaría con 'live'
+    path('flightdata/live/', live_feed, name='flightdata-live'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
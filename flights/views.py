@@ -1,21 +1,479 @@
-from rest_framework import viewsets, permissions
-from .models import FlightData
-from .serializers import FlightDataSerializer
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_headers # Para caché
+from datetime import datetime, timedelta, timezone as dt_timezone
+from rest_framework import viewsets, permissions, serializers
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from .aggregates import summarize
+from .metrics import render_prometheus
+from .models import FleetAggregate, FlightData, FlightPosition, FlightRawData, IngestCycle, IngestState, history_bucket_for
+from .serializers import FlightDataSerializer, FlightPositionSerializer
+from .pagination import KeysetPagination
+from .binary import cached_payload
+from .renderers import FlightBinaryRenderer, NDJSONRenderer
+from .snapshot import build_snapshot, project_row, snapshot_cache
+from .spatial import bbox_contains, filter_bbox, filter_near, haversine_km
+from django.utils import timezone as django_timezone
+from django.utils.dateparse import parse_datetime
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.http import require_GET
+from .live import get_live_feed, iter_live_events
+from .motion import DEFAULT_MAX_EXTRAPOLATION_SECONDS, FleetMotion, load_vertical_motion, project_rows
+from django.conf import settings
+
+TRACK_DEFAULT_WINDOW = timedelta(hours=1)
+TRACK_MAX_WINDOW = timedelta(hours=24)
+MAX_RADIUS_KM = 20000
+SPATIAL_PARAMS = ('bbox', 'near')
+TRUE_VALUES = ('1', 'true', 'True', 'yes')
+EXPORT_CHUNK_ROWS = 500
+# Campos que no están en el snapshot y se cargan aparte sólo si se piden
+LAZY_FIELDS = ('raw_data',)
+STATS_BREAKDOWNS = ('cell',)
+
+
+def _parse_coordinates(params, name, count):
+    # Lista de `count` floats separados por comas, o None si el parámetro no viene
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        numbers = [float(part) for part in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or any(number != number for number in numbers):
+        raise ValidationError({name: f'Expected {count} comma-separated numbers.'})
+    return numbers
+
+
+def _validate_position(name, latitude, longitude):
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        raise ValidationError({name: 'Latitude must be within [-90, 90] and longitude within [-180, 180].'})
+
+
+def _parse_bbox(params):
+    # ?bbox=min_lon,min_lat,max_lon,max_lat (min_lon > max_lon cruza el antimeridiano)
+    bbox = _parse_coordinates(params, 'bbox', 4)
+    if not bbox:
+        return None
+    min_lon, min_lat, max_lon, max_lat = bbox
+    _validate_position('bbox', min_lat, min_lon)
+    _validate_position('bbox', max_lat, max_lon)
+    if min_lat > max_lat:
+        raise ValidationError({'bbox': 'min_lat must not be greater than max_lat.'})
+    return tuple(bbox)
+
+
+def _parse_near(params):
+    # ?near=lat,lon&radius_km= -> (lat, lon, radius_km) o None
+    near = _parse_coordinates(params, 'near', 2)
+    if not near:
+        return None
+    latitude, longitude = near
+    _validate_position('near', latitude, longitude)
+    try:
+        radius_km = float(params.get('radius_km', ''))
+    except ValueError:
+        raise ValidationError({'radius_km': "'radius_km' is required with 'near'."})
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise ValidationError({'radius_km': f'Must be greater than 0 and at most {MAX_RADIUS_KM}.'})
+    return latitude, longitude, radius_km
+
+
+def _parse_time_param(request, name):
+    # Acepta ISO 8601 o segundos desde epoch
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValidationError({name: 'Expected an ISO 8601 datetime or epoch seconds.'})
+    if django_timezone.is_naive(parsed):
+        parsed = django_timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def _attach_raw_data(rows):
+    # Copia de las filas con raw_data leído de FlightRawData (una consulta para todas)
+    raw_by_id = FlightRawData.load(row['flight_id'] for row in rows)
+    return [{**row, 'raw_data': raw_by_id.get(row['flight_id'])} for row in rows]
+
+
+def _iter_ndjson(fragments):
+    for start in range(0, len(fragments), EXPORT_CHUNK_ROWS):
+        yield b'\n'.join(fragments[start:start + EXPORT_CHUNK_ROWS]) + b'\n'
+
+
+def _iter_compact_array(snapshot, compact):
+    renderer = JSONRenderer()
+    rows = snapshot.rows
+    fields = list(project_row(rows[0], compact=compact)) if rows else []
+    yield renderer.render({'version': snapshot.version, 'count': len(rows), 'fields': fields})[:-1] + b',"rows":['
+    for start in range(0, len(rows), EXPORT_CHUNK_ROWS):
+        chunk = [[row[name] for name in fields] for row in rows[start:start + EXPORT_CHUNK_ROWS]]
+        prefix = b',' if start else b''
+        yield prefix + renderer.render(chunk)[1:-1]
+    yield b']}'
+
 
 class FlightDataViewSet(viewsets.ReadOnlyModelViewSet): # ReadOnly, ya que los datos se crean/actualizan por el cron
-    queryset = FlightData.objects.all().order_by('-timestamp') # Más reciente primero
+    queryset = FlightData.objects.filter(expired_at__isnull=True).order_by('-timestamp', '-id') # Sólo activos, más reciente primero
     serializer_class = FlightDataSerializer
     permission_classes = [permissions.AllowAny]
 
-    @method_decorator(cache_page(60 * 1)) # Cache por 1 minuto
-    @method_decorator(vary_on_headers("Authorization",)) # Si usas autenticación, la caché varía según el token
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        bbox = _parse_bbox(self.request.query_params)
+        if bbox:
+            queryset = filter_bbox(queryset, *bbox)
+
+        near = _parse_near(self.request.query_params)
+        if near:
+            queryset = filter_near(queryset, *near)
+        return queryset
+
+    def get_renderers(self):
+        # El formato binario sólo existe para el listado (snapshot completo o delta)
+        renderers = super().get_renderers()
+        if self.action == 'list':
+            renderers.append(FlightBinaryRenderer())
+        return renderers
+
+    def _has_spatial_filters(self):
+        return any(self.request.query_params.get(name) for name in SPATIAL_PARAMS)
+
+    def _cache_key(self, request):
+        # Los enlaces de paginación dependen del host, así que forma parte de la clave
+        params = tuple((name, tuple(values)) for name, values in sorted(request.query_params.lists()))
+        return (self.action, request.get_host(), request.path, params)
+
+    def _versioned(self, response, version):
+        response['X-Ingest-Version'] = str(version)
+        return response
+
+    def _projection(self):
+        # ?fields=a,b selecciona campos; ?compact=1 omite raw_data
+        compact = self.request.query_params.get('compact') in TRUE_VALUES
+        fields_param = self.request.query_params.get('fields')
+        if not fields_param:
+            return None, compact
+        fields = [name.strip() for name in fields_param.split(',') if name.strip()]
+        unknown = set(fields) - set(self.get_serializer().fields) - set(LAZY_FIELDS)
+        if not fields or unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown)) or '(empty)'}."})
+        return fields, compact
+
+    def _wants_raw_data(self, fields, compact):
+        # raw_data se lee de FlightRawData sólo si se pide: en el detalle por defecto
+        # (salvo ?compact=1), en el listado con ?include=raw_data o en ?fields=
+        if fields is not None:
+            return 'raw_data' in fields
+        if compact:
+            return False
+        return self.action == 'retrieve' or self.request.query_params.get('include') == 'raw_data'
+
+    def _wants_prerendered(self, fields):
+        # Los fragmentos son la salida exacta de JSONRenderer sin indentación
+        return (
+            fields is None
+            and isinstance(self.request.accepted_renderer, JSONRenderer)
+            and 'indent' not in (self.request.accepted_media_type or '')
+        )
+
+    def _json_response(self, content):
+        return HttpResponse(content, content_type=self.request.accepted_renderer.media_type)
+
+    def _paginated_bytes(self, paginator, fragments):
+        # El sobre de paginación se renderiza con results vacío y se le insertan los fragmentos
+        envelope = self.request.accepted_renderer.render(paginator.get_paginated_response([]).data)
+        if not envelope.endswith(b'[]}'):
+            return None
+        return self._json_response(envelope[:-3] + b'[' + b','.join(fragments) + b']}')
+
+    def _binary_response(self, request, version):
+        """
+        Snapshot completo en flights/binary.py, o con ?since=<versión> el delta
+        desde esa versión si este proceso aún la conserva (si no, el snapshot
+        completo; la cabecera indica cuál es). Admite ?bbox=, sin paginación.
+        """
+        if request.query_params.get('near'):
+            raise ValidationError({'near': "Not supported by the binary format; use 'bbox'."})
+        bbox = _parse_bbox(request.query_params)
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError({'since': 'Expected an ingest version (integer).'})
+
+        content = cached_payload(version, bbox, since)
+        return self._versioned(HttpResponse(content, content_type=request.accepted_renderer.media_type), version)
+
+    def _parse_at(self, request):
+        # ?at=<ISO 8601 | epoch | now> -> segundos epoch, o None
+        if request.query_params.get('at') == 'now':
+            return django_timezone.now().timestamp()
+        at = _parse_time_param(request, 'at')
+        return at.timestamp() if at is not None else None
+
+    def _projected_list(self, request, version, at, fields, compact, with_raw):
+        """
+        Listado con las posiciones extrapoladas a ``at`` (flights/motion.py). Todo
+        sale del snapshot de la versión: bbox y near se evalúan sobre la posición
+        proyectada, así que una aeronave entra o sale de la zona al moverse.
+        """
+        snapshot = snapshot_cache.get_snapshot(version, build_snapshot)
+        version = snapshot.version
+        # Se construye una vez por versión: en el LRU las consultas por bbox o página lo desalojarían
+        motion = snapshot_cache.get_pinned(
+            version, 'motion',
+            lambda: FleetMotion(snapshot, load_vertical_motion(row['flight_id'] for row in snapshot.rows)),
+        )
+        max_seconds = getattr(settings, 'FLIGHTS_MAX_EXTRAPOLATION_SECONDS', DEFAULT_MAX_EXTRAPOLATION_SECONDS)
+        rows = snapshot.rows
+        bbox = _parse_bbox(request.query_params)
+        near = _parse_near(request.query_params)
+        positions = None
+        indices = range(len(rows))
+        if bbox or near:
+            # El filtro necesita la posición proyectada de toda la flota
+            positions = motion.project(at, max_seconds=max_seconds)
+            located = [
+                (rows[index]['latitude'], rows[index]['longitude']) if position is None else position[:2]
+                for index, position in enumerate(positions)
+            ]
+            if bbox:
+                indices = [index for index in indices if bbox_contains(bbox, *located[index])]
+            if near:
+                latitude, longitude, radius_km = near
+                indices = [
+                    index for index in indices
+                    if located[index][0] is not None and located[index][1] is not None
+                    and haversine_km(latitude, longitude, *located[index]) <= radius_km
+                ]
+
+        if KeysetPagination.is_requested(request):
+            paginator = KeysetPagination()
+            page = [indices[position] for position in paginator.paginate_keys([snapshot.keys[index] for index in indices], request)]
+        else:
+            paginator = self.paginator
+            page = self.paginate_queryset(indices)
+        paginated = page is not None
+        if not paginated:
+            page = indices
+
+        page_rows = project_rows(
+            [rows[index] for index in page],
+            [positions[index] for index in page] if positions is not None else motion.project(at, page, max_seconds),
+        )
+        if with_raw:
+            page_rows = _attach_raw_data(page_rows)
+        page_rows = [project_row(row, fields, compact) for row in page_rows]
+        response = paginator.get_paginated_response(page_rows) if paginated else Response(page_rows)
+        response['X-Projected-At'] = datetime.fromtimestamp(at, tz=dt_timezone.utc).isoformat()
+        return self._versioned(response, version)
+
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        version = IngestState.current_version()
+        at = self._parse_at(request)
+        if isinstance(request.accepted_renderer, FlightBinaryRenderer):
+            if at is not None:
+                raise ValidationError({'at': 'Not supported by the binary format.'})
+            return self._binary_response(request, version)
+        fields, compact = self._projection()
+        with_raw = self._wants_raw_data(fields, compact)
+        if at is not None:
+            return self._projected_list(request, version, at, fields, compact, with_raw)
+        if self._has_spatial_filters():
+            # Las consultas espaciales usan el índice; se cachea su respuesta para esta versión
+            def build():
+                if KeysetPagination.is_requested(request):
+                    paginator = KeysetPagination()
+                    page = paginator.paginate_queryset(self.filter_queryset(self.get_queryset()), request, self)
+                    data = paginator.get_paginated_response(self.get_serializer(page, many=True).data).data
+                else:
+                    data = super(FlightDataViewSet, self).list(request, *args, **kwargs).data
+                rows = data['results'] if 'results' in data else data
+                if with_raw:
+                    rows = _attach_raw_data(rows)
+                rows = [project_row(row, fields, compact) for row in rows]
+                if 'results' in data:
+                    data['results'] = rows
+                    return data
+                return rows
+            return self._versioned(Response(snapshot_cache.get_or_build(version, self._cache_key(request), build)), version)
+
+        snapshot = snapshot_cache.get_snapshot(version, build_snapshot)
+        # El snapshot puede ser de un ciclo posterior al de la versión leída (ver build_snapshot)
+        version = snapshot.version
+        # Se pagina sobre índices para poder usar tanto las filas como los fragmentos
+        if KeysetPagination.is_requested(request):
+            paginator = KeysetPagination()
+            indices = paginator.paginate_keys(snapshot.keys, request)
+        else:
+            paginator = self.paginator
+            indices = self.paginate_queryset(range(len(snapshot)))
+        paginated = indices is not None
+        if not paginated:
+            indices = range(len(snapshot))
+
+        if not with_raw and self._wants_prerendered(fields):
+            fragments = snapshot.compact_fragments if compact else snapshot.fragments
+            page_fragments = [fragments[index] for index in indices]
+            if not paginated:
+                return self._versioned(self._json_response(b'[' + b','.join(page_fragments) + b']'), version)
+            response = self._paginated_bytes(paginator, page_fragments)
+            if response is not None:
+                return self._versioned(response, version)
+
+        rows = [snapshot.rows[index] for index in indices]
+        if with_raw:
+            rows = _attach_raw_data(rows)
+        rows = [project_row(row, fields, compact) for row in rows]
+        if paginated:
+            return self._versioned(paginator.get_paginated_response(rows), version)
+        return self._versioned(Response(rows), version)
 
-    @method_decorator(cache_page(60 * 1))
-    @method_decorator(vary_on_headers("Authorization",))
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
\ No newline at end of file
+        version = IngestState.current_version()
+        fields, compact = self._projection()
+        snapshot = snapshot_cache.get_snapshot(version, build_snapshot)
+        version = snapshot.version
+        try:
+            index = snapshot.by_id[int(kwargs[self.lookup_field])]
+        except (KeyError, ValueError):
+            raise Http404
+        with_raw = self._wants_raw_data(fields, compact)
+        if not with_raw and self._wants_prerendered(fields):
+            fragments = snapshot.compact_fragments if compact else snapshot.fragments
+            return self._versioned(self._json_response(fragments[index]), version)
+        row = snapshot.rows[index]
+        if with_raw:
+            row = _attach_raw_data([row])[0]
+        return self._versioned(Response(project_row(row, fields, compact)), version)
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, JSONRenderer])
+    def export(self, request, *args, **kwargs):
+        """
+        Snapshot completo en una sola respuesta en streaming: NDJSON (por defecto,
+        ?format=ndjson) o un array compacto {"fields": [...], "rows": [[...], ...]}
+        con ?format=json. No incluye raw_data (está en FlightRawData).
+        """
+        version = IngestState.current_version()
+        compact = request.query_params.get('compact') in TRUE_VALUES
+        snapshot = snapshot_cache.get_snapshot(version, build_snapshot)
+        version = snapshot.version
+
+        if isinstance(request.accepted_renderer, NDJSONRenderer):
+            fragments = snapshot.compact_fragments if compact else snapshot.fragments
+            content = _iter_ndjson(fragments)
+        else:
+            content = _iter_compact_array(snapshot, compact)
+        response = StreamingHttpResponse(content, content_type=request.accepted_renderer.media_type)
+        return self._versioned(response, version)
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request, *args, **kwargs):
+        """
+        Estadísticas de la flota activa precalculadas en la ingesta: vuelos por
+        país, en vuelo/en tierra, bandas de altitud e histograma de velocidades.
+        ?bbox= las limita a las celdas de la rejilla de agregados que tocan la
+        zona y ?by=cell añade el desglose por celda.
+        """
+        bbox = _parse_bbox(request.query_params)
+        by = request.query_params.get('by')
+        if by and by not in STATS_BREAKDOWNS:
+            raise ValidationError({'by': f"Expected one of: {', '.join(STATS_BREAKDOWNS)}."})
+        version = IngestState.current_version()
+
+        def build():
+            aggregate = snapshot_cache.get_or_build(version, ('aggregate',), FleetAggregate.latest)
+            document = aggregate.document if aggregate is not None else {}
+            return {
+                'version': version,
+                'computed_at': serializers.DateTimeField().to_representation(aggregate.computed_at) if aggregate else None,
+                **summarize(document, bbox, by_cell=by == 'cell'),
+            }
+
+        data = snapshot_cache.get_or_build(version, ('stats', bbox, by), build)
+        return self._versioned(Response(data), version)
+
+    @action(detail=True, methods=['get'])
+    def track(self, request, *args, **kwargs):
+        version = IngestState.current_version()
+        data = snapshot_cache.get_or_build(version, self._cache_key(request), lambda: self._build_track(request))
+        return self._versioned(Response(data), version)
+
+    def _build_track(self, request):
+        # Trayectoria del vuelo en [since, until]; por defecto la última hora, máximo 24 horas
+        flight = self.get_object()
+        until = _parse_time_param(request, 'until') or django_timezone.now()
+        since = _parse_time_param(request, 'since') or until - TRACK_DEFAULT_WINDOW
+        if since > until:
+            raise ValidationError({'since': "'since' must be earlier than 'until'."})
+        if until - since > TRACK_MAX_WINDOW:
+            raise ValidationError({'since': f"Time window cannot exceed {TRACK_MAX_WINDOW}."})
+
+        # El rango de bucket acota el recorrido del índice (flight_id, bucket, timestamp)
+        positions = FlightPosition.objects.filter(
+            flight_id=flight.flight_id,
+            bucket__gte=history_bucket_for(since),
+            bucket__lte=history_bucket_for(until),
+            timestamp__gte=since,
+            timestamp__lte=until,
+        ).order_by('timestamp')
+        serializer = FlightPositionSerializer(positions, many=True)
+        datetime_field = serializers.DateTimeField()
+        return {
+            'flight_id': flight.flight_id,
+            'since': datetime_field.to_representation(since),
+            'until': datetime_field.to_representation(until),
+            'positions': serializer.data,
+        }
+
+
+@require_GET
+async def live_feed(request):
+    """
+    Server-Sent Events con los cambios de cada ingesta: un evento "snapshot" al
+    conectar y después un "delta" (added/moved/removed) por versión nueva.
+    ?bbox=min_lon,min_lat,max_lon,max_lat limita el feed a una zona.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Bajo WSGI Django consumiría el stream entero antes de responder
+        return JsonResponse({'detail': 'The live feed requires the ASGI application (tracker_project.asgi).'}, status=501)
+    try:
+        bbox = _parse_bbox(request.GET)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+
+    feed = get_live_feed()
+    subscription, snapshot = await feed.subscribe(bbox)
+    events = iter_live_events(feed, subscription, snapshot, request.headers.get('Last-Event-ID'))
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # Que nginx no acumule los eventos
+    return response
+
+
+@require_GET
+def metrics(request):
+    """
+    Métricas de ingesta en formato de texto de Prometheus: el último ciclo y la
+    ventana de ciclos guardada en IngestCycle, más la caché de snapshot de este
+    proceso.
+    """
+    body = render_prometheus(
+        list(IngestCycle.objects.order_by('-id')),
+        IngestState.current_version(),
+        snapshot_cache.stats(),
+    )
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,88 @@
+# flights/worker.py
+# Worker de ingesta de larga duración: sustituye a cron + `manage.py update_flight_data`.
+
+import logging
+import random
+import threading
+import time
+from django.db import close_old_connections
+from .services import FlightDataService, INGEST_MODE_UPSERT, UPSERT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 10.0
+DEFAULT_MAX_BACKOFF = 300.0
+
+
+class IngestWorker:
+    """
+    Ejecuta ``update_database_from_api`` (o ``update_database_from_sources`` si
+    se pasan ``sources``) cada ``interval`` segundos con la misma sesión HTTP
+    (pool de conexiones). Si un ciclo falla, espera con backoff exponencial con
+    jitter, acotado por ``max_backoff``.
+    """
+
+    def __init__(self, service=None, interval=DEFAULT_POLL_INTERVAL, max_backoff=DEFAULT_MAX_BACKOFF,
+                 mode=INGEST_MODE_UPSERT, batch_size=UPSERT_BATCH_SIZE, on_cycle=None, rng=None, sources=None):
+        self.service = service or FlightDataService()
+        self.interval = interval
+        self.max_backoff = max(max_backoff, interval)
+        self.mode = mode
+        self.batch_size = batch_size
+        self.sources = sources
+        self.on_cycle = on_cycle
+        self.rng = rng or random.Random()
+        self.consecutive_failures = 0
+        self.cycles = 0
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def backoff_delay(self):
+        # Jitter "equal": entre la mitad y el total del retardo exponencial
+        delay = min(self.max_backoff, self.interval * (2 ** self.consecutive_failures))
+        return self.rng.uniform(delay / 2, delay)
+
+    def run_cycle(self):
+        # La conexión a la base de datos puede haber caducado entre ciclos (CONN_MAX_AGE)
+        close_old_connections()
+        started = time.monotonic()
+        try:
+            if self.sources:
+                result = self.service.update_database_from_sources(self.sources, mode=self.mode, batch_size=self.batch_size)
+            else:
+                result = self.service.update_database_from_api(mode=self.mode, batch_size=self.batch_size)
+        except Exception as e:
+            logger.exception(f"Unexpected error in ingest cycle: {e}")
+            result = {'success': False, 'message': f'Unexpected error: {e}'}
+        finally:
+            close_old_connections()
+        result['duration'] = time.monotonic() - started
+        self.cycles += 1
+        if result.get('success'):
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+        if self.on_cycle:
+            self.on_cycle(result)
+        return result
+
+    def run(self, max_cycles=None):
+        logger.info(f"Ingest worker started (interval: {self.interval}s, max backoff: {self.max_backoff}s).")
+        while not self.stopped:
+            result = self.run_cycle()
+            if max_cycles is not None and self.cycles >= max_cycles:
+                break
+            if result.get('success'):
+                # El intervalo se mide de inicio a inicio de ciclo
+                delay = max(0.0, self.interval - result['duration'])
+            else:
+                delay = self.backoff_delay()
+                logger.warning(f"Ingest cycle failed ({self.consecutive_failures} in a row). Retrying in {delay:.1f}s.")
+            self._stop.wait(delay)
+        logger.info(f"Ingest worker stopped after {self.cycles} cycles.")
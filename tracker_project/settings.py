@@ -1,35 +1,34 @@
 from pathlib import Path
-import dj_database_url
+import logging
 import os
-from dotenv import load_dotenv
 
-load_dotenv(override=True)
-print("DEBUG settings.py: .env loaded with override=True")
+logger = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# .env (si existe) tiene prioridad sobre el entorno; sin .env no se importa python-dotenv
+DOTENV_PATH = BASE_DIR / '.env'
+if DOTENV_PATH.is_file():
+    from dotenv import load_dotenv
+    load_dotenv(DOTENV_PATH, override=True)
+
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'fallback_secret_key_insecure_dev_only')
 DEBUG = os.environ.get('DJANGO_DEBUG', 'False') == 'True'
 
-print(f"DEBUG settings.py: SECRET_KEY loaded: {'******' if SECRET_KEY != 'fallback_secret_key_insecure_dev_only' else 'FALLBACK'}")
-print(f"DEBUG settings.py: DEBUG mode: {DEBUG}")
-
 ALLOWED_HOSTS = []
 railway_app_domain = os.environ.get('RAILWAY_PUBLIC_DOMAIN') or os.environ.get('ALLOWED_HOST_FQDN')
 
 if railway_app_domain:
     ALLOWED_HOSTS.append(railway_app_domain)
-    print(f"DEBUG settings.py: Added Railway domain to ALLOWED_HOSTS: {railway_app_domain}")
 
 if DEBUG:
     ALLOWED_HOSTS.extend(['localhost', '127.0.0.1'])
-    print(f"DEBUG settings.py: Added localhost/127.0.0.1 to ALLOWED_HOSTS for DEBUG.")
 elif not ALLOWED_HOSTS:
-    print("WARNING settings.py: No production host in env (RAILWAY_PUBLIC_DOMAIN/ALLOWED_HOST_FQDN). ALLOWED_HOSTS might be empty.")
+    # LOGGING aún no está aplicado: el aviso sale por stderr
+    logger.warning("No production host in env (RAILWAY_PUBLIC_DOMAIN/ALLOWED_HOST_FQDN). ALLOWED_HOSTS is empty.")
     # ALLOWED_HOSTS.append('*') # Consider for initial deployment only if necessary
 
 ALLOWED_HOSTS = list(set(filter(None, ALLOWED_HOSTS)))
-print(f"DEBUG settings.py: Final ALLOWED_HOSTS: {ALLOWED_HOSTS}")
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -81,24 +80,18 @@ DATABASES = {
 }
 
 DATABASE_URL_FROM_ENV = os.environ.get('DATABASE_URL')
-print(f"DEBUG settings.py: DATABASE_URL from os.environ: {DATABASE_URL_FROM_ENV}")
 
 if DATABASE_URL_FROM_ENV:
     try:
+        import dj_database_url
         DATABASES['default'] = dj_database_url.config(
             default=DATABASE_URL_FROM_ENV,
             conn_max_age=600,
-            ssl_require=True
+            # sqlite3.connect() no acepta sslmode
+            ssl_require=not DATABASE_URL_FROM_ENV.startswith('sqlite:')
         )
-        print(f"DEBUG settings.py: DATABASES['default'] configured from DATABASE_URL.")
-        print(f"DEBUG settings.py:   HOST: {DATABASES['default'].get('HOST')}")
-        print(f"DEBUG settings.py:   PORT: {DATABASES['default'].get('PORT')}")
-        print(f"DEBUG settings.py:   NAME: {DATABASES['default'].get('NAME')}")
-        print(f"DEBUG settings.py:   USER: {DATABASES['default'].get('USER')}")
     except Exception as e:
-        print(f"ERROR settings.py: Failed to configure database from DATABASE_URL: {e}. Falling back to SQLite.")
-else:
-    print("DEBUG settings.py: DATABASE_URL not found in environment. Using SQLite as fallback.")
+        logger.error(f"Failed to configure database from DATABASE_URL: {e}. Falling back to SQLite.")
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -124,12 +117,35 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10
 }
 
+# Las vistas de flights ya no usan cache_page: sirven desde un snapshot en memoria
+# versionado por la ingesta (flights/snapshot.py)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'api_cache_table',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+FLIGHTS_SNAPSHOT_CACHE_MAX_ENTRIES = int(os.environ.get('FLIGHTS_SNAPSHOT_CACHE_MAX_ENTRIES', '256'))
+# Versiones anteriores que se conservan para servir deltas (?format=bin&since=)
+FLIGHTS_SNAPSHOT_HISTORY = int(os.environ.get('FLIGHTS_SNAPSHOT_HISTORY', '4'))
+
+# Feed en vivo (/api/flightdata/live/, sólo con ASGI): sondeo de la versión de ingesta
+# y mensajes pendientes por cliente antes de desconectarlo
+FLIGHTS_LIVE_POLL_INTERVAL = float(os.environ.get('FLIGHTS_LIVE_POLL_INTERVAL', '1.0'))
+FLIGHTS_LIVE_QUEUE_SIZE = int(os.environ.get('FLIGHTS_LIVE_QUEUE_SIZE', '16'))
+
+# Extrapolación de posiciones con ?at= (flights/motion.py): segundos máximos de avance
+FLIGHTS_MAX_EXTRAPOLATION_SECONDS = int(os.environ.get('FLIGHTS_MAX_EXTRAPOLATION_SECONDS', '300'))
+
+# Camino rápido de lectura en WSGI (flights/fastpath.py); 'False' sirve todo con la pila completa
+FLIGHTS_FAST_READ_PATH = os.environ.get('FLIGHTS_FAST_READ_PATH', 'True') == 'True'
+
+# Ciclos de ingesta que se conservan (IngestCycle) para /metrics
+FLIGHTS_METRICS_HISTORY = int(os.environ.get('FLIGHTS_METRICS_HISTORY', '50'))
+
+# Fuentes para update_flight_data --sources y run_ingest_worker --sources (flights/sources.py), p. ej.
+# [{"name": "opensky", "parser": "opensky"}, {"name": "radar", "parser": "sbs", "path": "/var/lib/sbs.csv", "bbox": [35, -10, 44, 5]}]
+# Se guarda el JSON sin decodificar: lo valida build_sources sólo en los procesos que usan --sources
+FLIGHTS_INGEST_SOURCES = os.environ.get('FLIGHTS_INGEST_SOURCES', '[]')
 
 LOGGING = {
     'version': 1,
@@ -151,4 +167,3 @@ LOGGING = {
         'flights.management.commands': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
     },
 }
-print("DEBUG settings.py: Settings file loaded completely.")
\ No newline at end of file
@@ -0,0 +1,42 @@
+# Perfil mínimo para el worker de ingesta (run_ingest_worker, update_flight_data)
+# y los procesos que sólo sirven la API:
+#   DJANGO_SETTINGS_MODULE=tracker_project.settings_lean
+# Sin admin, auth, sesiones, mensajes ni estáticos: menos módulos que importar al
+# arrancar y menos memoria por worker de gunicorn. /admin/ no existe en este perfil,
+# la API sólo responde JSON (sin la vista navegable de DRF) y no hay usuario en
+# request.user. Las migraciones se siguen aplicando con el perfil completo.
+# Medido con `manage.py benchmark_startup`.
+
+from .settings import *
+
+INSTALLED_APPS = [
+    'rest_framework',
+    'flights',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': ['django.template.context_processors.request'],
+        },
+    },
+]
+
+AUTH_PASSWORD_VALIDATORS = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    # Sin django.contrib.auth: ni autenticación ni AnonymousUser
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
@@ -1,7 +1,13 @@
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
+from flights.views import metrics
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'), # Prometheus
     path('api/', include('flights.urls')), #  En /api/flightdata/
-]
\ No newline at end of file
+]
+
+# El perfil tracker_project.settings_lean no instala el admin
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tracker_project.settings')
 
 application = get_wsgi_application()
+
+# Listado y detalle de vuelos sin middlewares ni ORM (flights/fastpath.py)
+if settings.FLIGHTS_FAST_READ_PATH:
+    from flights.fastpath import FastReadApplication
+    application = FastReadApplication(application)